@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Учёт активности пользователей (users.last_active) с отложенной записью.
+
+Мидлварь на dp.update только запоминает в памяти «пользователь N активен сейчас» —
+без обращения к БД. Раз в ACTIVITY_FLUSH_SEC секунд накопленное пишется одним
+UPDATE users ... FROM (VALUES ...) на пачку: сколько бы апдейтов ни прислал
+пользователь за интервал, в БД уходит одна строка. При остановке бота буфер
+сбрасывается последний раз (on_shutdown, см. bot.py).
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Dispatcher
+from sqlalchemy import BigInteger, DateTime, column, or_, update, values
+
+from config import ACTIVITY_FLUSH_SEC
+from database import SessionLocal, User
+
+# строк в одном UPDATE
+FLUSH_BATCH_SIZE = 1000
+
+
+class ActivityBuffer:
+    """user_id → время последней активности, ещё не записанное в БД."""
+
+    def __init__(self):
+        self._pending: Dict[int, datetime] = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def touch(self, user_id: int, when: datetime = None):
+        self._pending[user_id] = when or datetime.utcnow()
+
+    def _restore(self, pending: Dict[int, datetime]):
+        # не теряем активность: вернём её в буфер, более свежие отметки важнее
+        for user_id, ts in pending.items():
+            if user_id not in self._pending:
+                self._pending[user_id] = ts
+
+    def flush(self) -> int:
+        """Пишет накопленное в БД. Возвращает число записанных пользователей."""
+        pending, self._pending = self._pending, {}
+        try:
+            return _write(pending)
+        except Exception:
+            self._restore(pending)
+            raise
+
+    async def flush_async(self) -> int:
+        """То же, что flush(), но запись в БД идёт в потоке, не останавливая цикл событий.
+
+        Буфер забирается и при ошибке возвращается в самом цикле, так что touch()
+        из мидлвари с потоком не пересекается.
+        """
+        pending, self._pending = self._pending, {}
+        try:
+            return await asyncio.to_thread(_write, pending)
+        except Exception:
+            self._restore(pending)
+            raise
+
+
+def _write(pending: Dict[int, datetime]) -> int:
+    if not pending:
+        return 0
+    rows = list(pending.items())
+    with SessionLocal() as sess:
+        for i in range(0, len(rows), FLUSH_BATCH_SIZE):
+            batch = values(
+                column("id", BigInteger), column("ts", DateTime), name="activity"
+            ).data(rows[i:i + FLUSH_BATCH_SIZE])
+            sess.execute(
+                update(User)
+                .where(User.id == batch.c.id,
+                       or_(User.last_active.is_(None), User.last_active < batch.c.ts))
+                .values(last_active=batch.c.ts)
+                .execution_options(synchronize_session=False)
+            )
+        sess.commit()
+    return len(rows)
+
+
+buffer = ActivityBuffer()
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """Внешняя мидлварь dp.update: отмечает активность отправителя апдейта."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            buffer.touch(user.id)
+        return await handler(event, data)
+
+
+def install(dp: Dispatcher):
+    dp.update.outer_middleware(ActivityMiddleware())
+
+
+async def flush_loop():
+    """Фоновая задача (запускается в on_startup, см. bot.py)."""
+    while True:
+        await asyncio.sleep(ACTIVITY_FLUSH_SEC)
+        try:
+            await buffer.flush_async()
+        except Exception as e:
+            print("Ошибка при записи активности пользователей:", e)
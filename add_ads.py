@@ -3,13 +3,16 @@ from decimal import Decimal
 from typing import List
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from config import MAIN_CATEGORIES, MODERATION_GROUP_ID, CITY_STRUCTURE, MARKIROVKA_GROUP_ID
+import catalog
+import fingerprint
+import render
+from config import MODERATION_GROUP_ID, MARKIROVKA_GROUP_ID, DUPLICATE_AD_ACTION
 from database import SessionLocal, User, Ad, ChatGroup
 from utils import calc_chat_price, main_menu_keyboard, rus_status
+from callbacks import get_router
 
 
 class AdsStates(StatesGroup):
@@ -31,6 +34,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
       - Формат №1 (обычное объявление)
       - Формат №2 (биржа, «Разместить на бирже»).
     """
+    cb = get_router(dp)
 
     @dp.message(lambda m: m.text == "➕Разместить объявление")
     async def add_ad_start(message: types.Message):
@@ -68,9 +72,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ])
         return await bot.send_message(chat_id, "Выберите действие:", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data in [
-        "create_ad_start", "my_ads_list", "cancel_ad_creation", "adix_market_start"
-    ])
+    @cb.route(exact=("create_ad_start", "my_ads_list", "cancel_ad_creation", "adix_market_start"))
     async def handle_main_menu_callback(call: types.CallbackQuery, state: FSMContext):
         """
         Обработка выбора в инлайн-меню "Создать объявление / Разместить на бирже / ..."
@@ -80,6 +82,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
 
         if call.data == "cancel_ad_creation":
             await state.clear()
+            render.cancel(chat_id, call.message.message_id)
             await bot.delete_message(chat_id, call.message.message_id)
             await bot.send_message(chat_id, "Создание объявления отменено.", reply_markup=main_menu_keyboard())
             user_steps.pop(chat_id, None)
@@ -114,12 +117,14 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 "inline_button_text": None,
                 "text": None,
                 "photos": [],
+                "photo_uids": [],        # file_unique_id фото — для поиска дублей
                 "price": None,
                 "quantity": 1,
-                "city": None,
-                "category": None,
-                "subcat_list": [],
-                "subcategory": None
+                "city": None,            # свой город текстом или None
+                "city_code": None,       # код города из catalog (если выбран из списка)
+                "region": None,          # код региона из catalog
+                "category": None,        # код категории из catalog
+                "subcategory": None      # код подкатегории из catalog
             }
             return await ask_for_inline_button_name(chat_id, state)
 
@@ -146,6 +151,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 "title": None,
                 "description": None,
                 "photos": [],
+                "photo_uids": [],
                 "fio": None,
                 "company_name": None,
                 "inn": None,
@@ -184,7 +190,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
             return await bot.send_message(chat_id, "Ваши объявления:", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("my_ad_detail_") or call.data == "close_my_ads_list")
+    @cb.route("my_ad_detail_", exact=("close_my_ads_list",))
     async def handle_my_ads_inline_callbacks(call: types.CallbackQuery):
         """
         Детали объявления пользователя (или закрыть).
@@ -222,7 +228,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             await bot.edit_message_text(detail, chat_id=chat_id, message_id=call.message.message_id, reply_markup=kb)
             return await bot.answer_callback_query(call.id)
 
-    @dp.callback_query(lambda call: call.data == "close_ad_detail")
+    @cb.route(exact=("close_ad_detail",))
     async def close_ad_detail(call: types.CallbackQuery):
         await bot.delete_message(call.message.chat.id, call.message.message_id)
         await bot.answer_callback_query(call.id)
@@ -302,9 +308,10 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         if message.content_type == "photo":
             file_id = message.photo[-1].file_id
             user_steps[chat_id]["photos"].append(file_id)
+            user_steps[chat_id]["photo_uids"].append(message.photo[-1].file_unique_id)
         return None
 
-    @dp.callback_query(lambda call: call.data in ("photo_done", "photo_skip"))
+    @cb.route(exact=("photo_done", "photo_skip"))
     async def handle_photos_done_skip(call: types.CallbackQuery, state: FSMContext):
         """
         Нажата кнопка "Готово" или "Пропустить" при загрузке фото.
@@ -328,8 +335,6 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         """
         Шаг 4: Города/Регионы.
         """
-        region_names = list(CITY_STRUCTURE.keys())  # ["Москва", "Московская область", "РФ города"]
-        user_steps[chat_id]["regions_list"] = region_names
         msg = (
             "4. Укажите город/регион.\n"
             "Если нет в списке – «Добавить свой».\n"
@@ -337,8 +342,8 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             "*Согласно соглашению ADIX.*"
         )
         buttons = [
-            [ types.InlineKeyboardButton(text=r_name, callback_data=f"pick_region_{i}") ]
-            for i, r_name in enumerate(region_names)
+            [ types.InlineKeyboardButton(text=region.name, callback_data=f"pick_region_{region.code}") ]
+            for region in catalog.REGIONS
         ]
         buttons.append([ types.InlineKeyboardButton(text="Добавить свой город", callback_data="city_custom") ])
         buttons.append([ types.InlineKeyboardButton(text="Пропустить", callback_data="city_skip") ])
@@ -346,7 +351,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await bot.send_message(chat_id, msg, parse_mode="Markdown", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("pick_region_"))
+    @cb.route("pick_region_")
     async def handle_pick_region(call: types.CallbackQuery):
         """
         Выбор региона (Москва / МО / РФ).
@@ -355,38 +360,30 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         if chat_id not in user_steps:
             return await bot.answer_callback_query(call.id, "Нет активного шага", show_alert=True)
         data = user_steps[chat_id]
-        region_list = data.get("regions_list", [])
-        idx_str = call.data.replace("pick_region_", "")
-        try:
-            idx = int(idx_str)
-            region_name = region_list[idx]
-        except:
+        region = catalog.parse_code(call.data.replace("pick_region_", ""), catalog.REGION_BY_CODE)
+        if not region:
             return await bot.answer_callback_query(call.id, "Ошибка индекса региона", show_alert=True)
 
         await bot.delete_message(chat_id, call.message.message_id)
-        await bot.answer_callback_query(call.id, f"Регион: {region_name}")
+        await bot.answer_callback_query(call.id, f"Регион: {region.name}")
 
-        city_list = CITY_STRUCTURE.get(region_name, [])
-        data["picked_region"] = region_name
-        data["city_list"] = city_list
+        data["region"] = region.code
         return await show_city_list(chat_id)
 
     async def show_city_list(chat_id):
         """
         Показ списка городов в выбранном регионе (Формат №1).
         """
-        data = user_steps[chat_id]
-        city_list = data["city_list"]
-        region_name = data["picked_region"]
+        region = catalog.REGION_BY_CODE[user_steps[chat_id]["region"]]
         buttons = [
-            [ types.InlineKeyboardButton(text=c_name, callback_data=f"pick_city_{j}") ]
-            for j, c_name in enumerate(city_list)
+            [ types.InlineKeyboardButton(text=city.name, callback_data=f"pick_city_{city.code}") ]
+            for city in region.cities
         ]
         buttons.append([ types.InlineKeyboardButton(text="Назад к регионам", callback_data="back_to_regions") ])
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-        await bot.send_message(chat_id, f"Вы выбрали регион: {region_name}\nТеперь выберите город:", reply_markup=kb)
+        await bot.send_message(chat_id, f"Вы выбрали регион: {region.name}\nТеперь выберите город:", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("pick_city_"))
+    @cb.route("pick_city_")
     async def handle_pick_city(call: types.CallbackQuery):
         """
         Пользователь выбрал конкретный город (Формат №1).
@@ -396,23 +393,19 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             return await bot.answer_callback_query(call.id, "Нет активного шага", show_alert=True)
 
         data = user_steps[chat_id]
-        city_list = data.get("city_list", [])
-        idx_str = call.data.replace("pick_city_", "")
-        try:
-            idx = int(idx_str)
-            chosen_city = city_list[idx]
-        except:
+        city = catalog.parse_code(call.data.replace("pick_city_", ""), catalog.CITY_BY_CODE)
+        if not city:
             return await bot.answer_callback_query(call.id, "Ошибка индекса города", show_alert=True)
 
-        region_name = data["picked_region"]
-        full_city = f"{region_name} | {chosen_city}"
-        data["city"] = full_city
+        data["region"] = city.region_code
+        data["city_code"] = city.code
+        data["city"] = None
 
         await bot.delete_message(chat_id, call.message.message_id)
-        await bot.answer_callback_query(call.id, f"Вы выбрали: {full_city}")
+        await bot.answer_callback_query(call.id, f"Вы выбрали: {city.full_name}")
         return await ask_for_category(chat_id)
 
-    @dp.callback_query(lambda call: call.data == "back_to_regions")
+    @cb.route(exact=("back_to_regions",))
     async def handle_back_to_regions(call: types.CallbackQuery):
         """
         Вернуться к списку регионов (Формат №1).
@@ -422,7 +415,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await ask_for_region(chat_id)
         await bot.answer_callback_query(call.id)
 
-    @dp.callback_query(lambda call: call.data == "city_custom")
+    @cb.route(exact=("city_custom",))
     async def handle_city_custom(call: types.CallbackQuery, state: FSMContext):
         """
         Ввод собственного названия города (Формат №1).
@@ -439,10 +432,11 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         chat_id = message.chat.id
         if chat_id not in user_steps:
             return
+        user_steps[chat_id]["city_code"] = None
         user_steps[chat_id]["city"] = message.text.strip()
         await ask_for_category(chat_id)
 
-    @dp.callback_query(lambda call: call.data == "city_skip")
+    @cb.route(exact=("city_skip",))
     async def handle_city_skip(call: types.CallbackQuery):
         """
         Пропустить выбор города (Формат №1).
@@ -450,6 +444,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
             return
+        user_steps[chat_id]["city_code"] = None
         user_steps[chat_id]["city"] = None
         await bot.delete_message(chat_id, call.message.message_id)
         await bot.answer_callback_query(call.id, "Город пропущен.")
@@ -462,63 +457,58 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         """
         Шаг 5 (Формат №1): категория.
         """
-        categories = list(MAIN_CATEGORIES.keys())
+        categories = catalog.CATEGORIES
+        button = lambda cat: types.InlineKeyboardButton(text=cat.name, callback_data=f"select_category_{cat.code}")
         buttons = [
-            [
-                types.InlineKeyboardButton(text=f, callback_data=f"select_category_{f}"),
-                types.InlineKeyboardButton(text=s, callback_data=f"select_category_{s}")
-            ]
+            [ button(f), button(s) ]
             for (f, s) in zip(categories[::2], categories[1::2])
         ]
         if len(categories) % 2 > 0:
-            last = categories[len(categories) - 1]
-            buttons.append([
-                types.InlineKeyboardButton(text=last, callback_data=f"select_category_{last}")
-            ])
+            buttons.append([ button(categories[-1]) ])
         buttons.append([
             types.InlineKeyboardButton(text="Отмена", callback_data="cancel_ad_creation")
         ])
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await bot.send_message(chat_id, "5. Выберите категорию:", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("select_category_"))
+    @cb.route("select_category_")
     async def handle_category_selection(call: types.CallbackQuery, state: FSMContext):
         chat_id = call.message.chat.id
-        category = call.data.replace("select_category_", "")
         if chat_id not in user_steps:
             return None
+        category = catalog.parse_code(call.data.replace("select_category_", ""), catalog.CATEGORY_BY_CODE)
+        if not category:
+            return await bot.answer_callback_query(call.id, "Категория не найдена", show_alert=True)
 
         # Пример исключения некоторых категорий
-        if category in ["🏠 Недвижимость", "🚗 Авто и Мото"]:
+        if category.name in ["🏠 Недвижимость", "🚗 Авто и Мото"]:
             await bot.answer_callback_query(call.id)
             await bot.send_message(
                 chat_id,
-                f"Размещение в {category} пока доступно только через администратора.",
+                f"Размещение в {category.name} пока доступно только через администратора.",
                 reply_markup=main_menu_keyboard()
             )
             user_steps.pop(chat_id, None)
             return None
 
-        user_steps[chat_id]["category"] = category
-        user_steps[chat_id]["subcat_list"] = MAIN_CATEGORIES.get(category, [])
+        user_steps[chat_id]["category"] = category.code
+        user_steps[chat_id]["subcategory"] = None
         await bot.delete_message(chat_id, call.message.message_id)
         await bot.answer_callback_query(call.id)
 
-        sub_list = user_steps[chat_id]["subcat_list"]
-        if not sub_list:
-            user_steps[chat_id]["subcategory"] = None
+        if not category.subcategories:
             return await ask_for_price(chat_id, state)
 
         buttons = [
-            [ types.InlineKeyboardButton(text=s, callback_data=f"subcat_{i}") ]
-            for i, s in enumerate(sub_list)
+            [ types.InlineKeyboardButton(text=sub.name, callback_data=f"subcat_{sub.code}") ]
+            for sub in category.subcategories
         ]
         buttons.append([ types.InlineKeyboardButton(text="Пропустить", callback_data="skip_subcategory") ])
         buttons.append([ types.InlineKeyboardButton(text="Отмена", callback_data="cancel_ad_creation") ])
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-        return await bot.send_message(chat_id, f"Подкатегория для {category}:", reply_markup=kb)
+        return await bot.send_message(chat_id, f"Подкатегория для {category.name}:", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("subcat_") or call.data == "skip_subcategory")
+    @cb.route("subcat_", exact=("skip_subcategory",))
     async def handle_subcat(call: types.CallbackQuery, state: FSMContext):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -527,12 +517,10 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         if call.data == "skip_subcategory":
             user_steps[chat_id]["subcategory"] = None
         else:
-            idx_str = call.data.replace("subcat_", "")
-            try:
-                idx = int(idx_str)
-                sub_list = user_steps[chat_id]["subcat_list"]
-                user_steps[chat_id]["subcategory"] = sub_list[idx]
-            except:
+            sub = catalog.parse_code(call.data.replace("subcat_", ""), catalog.SUBCATEGORY_BY_CODE)
+            if sub and sub.category_code == user_steps[chat_id]["category"]:
+                user_steps[chat_id]["subcategory"] = sub.code
+            else:
                 user_steps[chat_id]["subcategory"] = None
 
         await bot.delete_message(chat_id, call.message.message_id)
@@ -551,7 +539,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             await state.set_state(AdsStates.f1_price)
         await bot.send_message(chat_id, "6. Введите цену (число) или «Пропустить».", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data == "price_skip")
+    @cb.route(exact=("price_skip",))
     async def skip_price(call: types.CallbackQuery, state: FSMContext):
         chat_id = call.message.chat.id
         await bot.delete_message(chat_id, call.message.message_id)
@@ -587,7 +575,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             await state.set_state(AdsStates.f1_quantity)
         await bot.send_message(chat_id, "7. Введите количество (число) или «Пропустить».", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data == "quantity_skip")
+    @cb.route(exact=("quantity_skip",))
     async def skip_quantity(call: types.CallbackQuery, state: FSMContext):
         """
         Пользователь пропустил ввод количества (Формат №1).
@@ -616,9 +604,32 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await state.clear()
         return await finalize_ad_save(chat_id)
 
+    async def reject_duplicate(chat_id, text_ids):
+        """Отказ при DUPLICATE_AD_ACTION=reject: текст почти совпадает с живым объявлением."""
+        await bot.send_message(
+            chat_id,
+            "Похожее объявление уже размещено или ожидает модерации "
+            f"({', '.join(f'#{i}' for i in text_ids)}). Повторно подавать его не нужно.",
+            reply_markup=main_menu_keyboard()
+        )
+        user_steps.pop(chat_id, None)
+
+    def format2_duplicates(d) -> list:
+        """
+        Для Формата №2 дубли при DUPLICATE_AD_ACTION=reject ищем до списания денег:
+        отказ после оплаты оставил бы продавца без объявления и без денег.
+        """
+        if DUPLICATE_AD_ACTION != "reject":
+            return []
+        fp = fingerprint.make(f"{d['title']}\n{d['description']}", d.get("photo_uids", []))
+        with SessionLocal() as sess:
+            text_ids, _ = fingerprint.find_duplicates(sess, fp)
+        return text_ids
+
     async def finalize_ad_save(chat_id):
         """
         Сохраняем объявление Формата №1 и отправляем в MODERATION_GROUP_ID сразу весь альбом.
+        Перед сохранением ищем почти-дубли по отпечатку текста и фото (fingerprint.py).
         """
         d = user_steps[chat_id]
         # Состояние, заполненное шагами
@@ -627,9 +638,11 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         photos = d["photos"]  # список file_id
         price = d["price"]
         qty = d["quantity"]
-        city = d["city"]
-        cat = d["category"]
-        subcat = d["subcategory"]
+        # коды из catalog → названия, которые хранятся в ads
+        city = catalog.CITY_BY_CODE[d["city_code"]].full_name if d.get("city_code") else d["city"]
+        cat = catalog.CATEGORY_BY_CODE[d["category"]].name if d["category"] else None
+        subcat = catalog.SUBCATEGORY_BY_CODE[d["subcategory"]].name if d["subcategory"] else None
+        fp = fingerprint.make(text, d.get("photo_uids", []))
 
         # 1) Сохраняем объявление и забираем все нужные поля до закрытия сессии
         with SessionLocal() as session:
@@ -639,6 +652,10 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 user_steps.pop(chat_id, None)
                 return
 
+            text_ids, photo_ids = fingerprint.find_duplicates(session, fp)
+            if text_ids and DUPLICATE_AD_ACTION == "reject":
+                return await reject_duplicate(chat_id, text_ids)
+
             # выгружаем username и прочее
             username = user.username or str(user.id)
             inn_info = user.inn or "—"
@@ -658,11 +675,14 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 photos=",".join(photos) if photos else ""
             )
             session.add(new_ad)
+            session.flush()
+            fingerprint.record(session, new_ad.id, fp)
             session.commit()
             ad_id = new_ad.id
 
         # 2) Формируем подпись после сессии
         caption = (
+                fingerprint.duplicate_note(text_ids, photo_ids) +
                 f"<b>Новое объявление #{ad_id}</b>\n"
                 f"Кнопка: {inline_button_text}\n"
                 f"Текст: {text}\n"
@@ -708,33 +728,6 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
     #            ФОРМАТ №2 — «Разместить на бирже»
     # ========================================================================
 
-    @dp.callback_query(lambda call: call.data == "adix_market_start")
-    async def handle_adix_market_start(call: types.CallbackQuery, state: FSMContext):
-        """
-        Старт потока «Биржа» из главного меню.
-        """
-        chat_id = call.message.chat.id
-        await bot.delete_message(chat_id, call.message.message_id)
-        await bot.answer_callback_query(call.id)
-
-        # инициализируем состояние
-        user_steps[chat_id] = {
-            "format": "format2",
-            "title": None,
-            "description": None,
-            "photos": [],
-            "fio": None,
-            "inn": None,
-            "region": None,
-            "f2_chats": [],
-            "f2_chat_page": 0,
-            "chatgroup_id": None,
-            "chatgroup_price": 0.0,
-            "post_count": 1,
-            "total_sum": 0.0
-        }
-        await start_format2_flow(chat_id, state)
-
     async def start_format2_flow(chat_id: int, state: FSMContext):
         """
         Шаг 1 — «Формат №2 (Биржа)». Запрашиваем название объявления.
@@ -811,11 +804,12 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             photos = user_steps[chat_id]["photos"]
             if len(photos) < 10:
                 photos.append(message.photo[-1].file_id)
+                user_steps[chat_id]["photo_uids"].append(message.photo[-1].file_unique_id)
             else:
                 await bot.send_message(chat_id, "Максимум 10 фото!")
         return None
 
-    @dp.callback_query(lambda call: call.data == "format2_photos_done")
+    @cb.route(exact=("format2_photos_done",))
     async def done_format2_photos(call: types.CallbackQuery, state: FSMContext):
         chat_id = call.message.chat.id
         await bot.delete_message(chat_id, call.message.message_id)
@@ -889,7 +883,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
     # ---------------------------------------------------------------------
 
     # ---------- 1. выбор региона ----------------------------------------
-    @dp.callback_query(lambda c: c.data in ("f2_region_moscow", "f2_region_mo", "f2_region_rf"))
+    @cb.route(exact=("f2_region_moscow", "f2_region_mo", "f2_region_rf"))
     async def handle_format2_region(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         code_map = {
@@ -942,6 +936,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
     async def show_f2_chats_page(chat_id: int):
         """
         Рисует страницу чатов, редактируя старое сообщение, если оно есть.
+        Правка отложенная (render.py): серия быстрых нажатий даёт одну правку.
         """
         d = user_steps[chat_id]
         chats = d["f2_chats"]
@@ -970,19 +965,21 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         text = f"Выберите чаты ({page + 1}/{pages}). Отмечено: {len(d['selected_chat_ids'])}"
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
 
+        async def send_new():
+            # старое сообщение не редактируется (удалено и т.п.) — присылаем новое, если выбор ещё идёт
+            if user_steps.get(chat_id) is not d:
+                return None
+            sent = await bot.send_message(chat_id, text, reply_markup=kb)
+            render.remember(chat_id, sent.message_id, text, kb)
+            d["last_list_msg_id"] = sent.message_id
+            return None
+
         if d.get("last_list_msg_id"):
-            try:
-                return await bot.edit_message_text(text, chat_id=chat_id, message_id=d["last_list_msg_id"], reply_markup=kb)
-            except TelegramRetryAfter:
-                pass
-            except TelegramNetworkError:
-                pass
-
-        sent = await bot.send_message(chat_id, text, reply_markup=kb)
-        d["last_list_msg_id"] = sent.message_id
-        return None
+            render.schedule(bot, chat_id, d["last_list_msg_id"], text, kb, fallback=send_new)
+            return None
+        return await send_new()
 
-    @dp.callback_query(lambda c: c.data in ("f2page_prev", "f2page_next"))
+    @cb.route(exact=("f2page_prev", "f2page_next"))
     async def paginate_f2_chats(call: types.CallbackQuery):
         """
         Листание страниц списка чатов.
@@ -996,7 +993,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await bot.answer_callback_query(call.id)
         await show_f2_chats_page(chat_id)
 
-    @dp.callback_query(lambda c: c.data.startswith("f2toggle_"))
+    @cb.route("f2toggle_")
     async def toggle_chat_selection(call: types.CallbackQuery):
         """
         Срабатывает при клике на чекбокс чата — переключает его в наборе.
@@ -1014,7 +1011,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await show_f2_chats_page(chat_id)
 
     # ---------- 4. закончили выбирать чаты  -----------------------------
-    @dp.callback_query(lambda c: c.data == "f2finish_chats")
+    @cb.route(exact=("f2finish_chats",))
     async def finish_chat_selection(call: types.CallbackQuery):
         """
         Завершение выбора чатов, удаляем сообщение со списком и переходим дальше.
@@ -1026,7 +1023,9 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             return await bot.answer_callback_query(call.id, "Нужно выбрать хотя бы один чат!", show_alert=True)
 
         await bot.answer_callback_query(call.id)
-        await bot.delete_message(chat_id, d.get("last_list_msg_id", call.message.message_id))
+        list_msg_id = d.get("last_list_msg_id") or call.message.message_id
+        render.cancel(chat_id, list_msg_id)
+        await bot.delete_message(chat_id, list_msg_id)
 
         d.update({
             "selected_list": list(d["selected_chat_ids"]),
@@ -1065,7 +1064,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             reply_markup=kb
         )
 
-    @dp.callback_query(lambda c: c.data.startswith("f2cnt_"))
+    @cb.route("f2cnt_")
     async def set_count_for_chat(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         d = user_steps[chat_id]
@@ -1130,7 +1129,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ])
         await bot.send_message(chat_id, "\n".join(lines), reply_markup=kb)
 
-    @dp.callback_query(lambda c: c.data == "f2_back_to_chats")
+    @cb.route(exact=("f2_back_to_chats",))
     async def back_to_chats(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         await bot.answer_callback_query(call.id)
@@ -1138,7 +1137,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await show_f2_chats_page(chat_id)
 
     # ---------- 7. оплата (размещение + маркировка одним платежом) -------
-    @dp.callback_query(lambda c: c.data == "f2pay_all")
+    @cb.route(exact=("f2pay_all",))
     async def handle_f2pay_all(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         d = user_steps.get(chat_id)
@@ -1146,6 +1145,11 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
 
         total = Decimal(str(d["placement_total"] + d["marking_fee"]))
 
+        text_ids = format2_duplicates(d)
+        if text_ids:
+            await bot.answer_callback_query(call.id)
+            return await reject_duplicate(chat_id, text_ids)
+
         with SessionLocal() as sess:
             user = sess.query(User).get(chat_id)
             if not user:
@@ -1174,10 +1178,15 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
 
         ad_ids = []
         selections = d["selections"]  # список словарей (chat, count, mult …)
+        fp = fingerprint.make(f"{title}\n{descr}", d.get("photo_uids", []))
 
         with SessionLocal() as sess:
             user = sess.query(User).get(chat_id)
 
+            # дубли ищем до создания: объявления одной подачи по разным чатам друг другу не дубли.
+            # Отказ по дублю — до оплаты (format2_duplicates); здесь уже списано, только помечаем для модератора
+            text_ids, photo_ids = fingerprint.find_duplicates(sess, fp)
+
             # для подписи
             fio_info = user.full_name or user.company_name or d.get("fio") or "—"
             inn_info = user.inn or d.get("inn") or "—"
@@ -1194,6 +1203,8 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                     ad_type="format2"
                 )
                 sess.add(ad)
+                sess.flush()
+                fingerprint.record(sess, ad.id, fp)
                 sess.commit()
                 ad_ids.append(ad.id)
 
@@ -1203,6 +1214,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             grand_total = place_total + mark_fee
 
             lines = [
+                fingerprint.duplicate_note(text_ids, photo_ids).rstrip("\n"),
                 f"<b>Биржа ADIX (Формат №2)</b>",
                 f"Название: {title}",
                 f"Описание: {descr}",
@@ -1220,7 +1232,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 f"<b>Итого: {grand_total:.2f} ₽</b>",
                 f"\nСтатус: {rus_status('pending')}"
             ]
-            caption = "\n".join(lines)
+            caption = "\n".join(line for line in lines if line)
 
             # ---------- клавиатура: по 2 кнопки на КАЖДЫЙ ad_id ------------
             kb = types.InlineKeyboardMarkup(inline_keyboard=[
@@ -1249,7 +1261,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                          reply_markup=main_menu_keyboard())
         user_steps.pop(chat_id, None)
 
-    @dp.callback_query(lambda call: call.data.startswith("f2chatpick_"))
+    @cb.route("f2chatpick_")
     async def handle_pick_chat_for_region(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -1293,7 +1305,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ])
         await bot.send_message(chat_id, "Сколько размещений хотите оплатить?", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("f2count_"))
+    @cb.route("f2count_")
     async def handle_format2_post_count(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -1341,7 +1353,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ]])
         await bot.send_message(chat_id, text, reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data == "f2pay_now")
+    @cb.route(exact=("f2pay_now",))
     async def handle_f2_pay_now(call: types.CallbackQuery):
         """
         1) Списываем total_sum
@@ -1352,6 +1364,11 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             return None
         total_sum = user_steps[chat_id]["total_sum"]
 
+        text_ids = format2_duplicates(user_steps[chat_id])
+        if text_ids:
+            await bot.answer_callback_query(call.id)
+            return await reject_duplicate(chat_id, text_ids)
+
         with SessionLocal() as session:
             user = session.query(User).filter_by(id=chat_id).first()
             if not user:
@@ -1386,7 +1403,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             reply_markup=kb
         )
 
-    @dp.callback_query(lambda call: call.data == "f2pay_marking")
+    @cb.route(exact=("f2pay_marking",))
     async def handle_f2pay_marking(call: types.CallbackQuery):
         """
         Списываем оплату за маркировку, затем финальное создание объявления.
@@ -1421,6 +1438,7 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         cg_id = d["chatgroup_id"]
         post_cnt = d["post_count"]
         total_sum = d["total_sum"]
+        fp = fingerprint.make(f"{title}\n{desc}", d.get("photo_uids", []))
 
         # 1) Сохраняем в БД и вытаскиваем user/чат до закрытия сессии
         with SessionLocal() as session:
@@ -1431,6 +1449,9 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 user_steps.pop(chat_id, None)
                 return
 
+            # отказ по дублю — до оплаты (format2_duplicates); здесь уже списано, только помечаем для модератора
+            text_ids, photo_ids = fingerprint.find_duplicates(session, fp)
+
             username = d["username_link"]
             inn_info = user.inn or "—"
             fio_info = user.full_name or user.company_name or "—"
@@ -1445,11 +1466,14 @@ def register_add_ads_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 ad_type="format2"
             )
             session.add(ad_obj)
+            session.flush()
+            fingerprint.record(session, ad_obj.id, fp)
             session.commit()
             ad_id = ad_obj.id
 
         # 2) Формируем подпись
         cap = (
+            fingerprint.duplicate_note(text_ids, photo_ids) +
             f"<b>Биржа ADIX (Формат №2) #{ad_id}</b>\n"
             f"Название: {title}\n"
             f"Описание: {desc}\n"
@@ -1516,6 +1540,7 @@ async def start_format2_flow_direct(bot: Bot,
         "title": None,
         "description": None,
         "photos": [],
+        "photo_uids": [],
         "fio": None,
         "company_name": None,
         "inn": None,
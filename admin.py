@@ -1,17 +1,29 @@
 #!/usr/bin/env python3
 import csv
 import os
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from config import ADMIN_IDS, MARKETING_GROUP_ID, MARKIROVKA_GROUP_ID
-from database import SessionLocal, User, Ad, ChatGroup, AdFeedback, Sale, TopUp, Withdrawal
-from database import SupportTicket, SupportMessage, AdComplaint
-from utils import post_ad_to_chat, rus_status
+import antiflood
+import archive
+import finance
+import metrics
+import moderation
+import reputation
+import saved_searches
+import sqlprofiler
+from config import ADMIN_IDS, MARKETING_GROUP_ID, MARKIROVKA_GROUP_ID, AD_LIFETIME_DAYS
+from database import SessionLocal, User, Ad, ChatGroup, AdFeedback, Sale, TopUp
+from database import SupportTicket, AdComplaint
+from utils import post_ad_to_chat, rus_status, renew_ad_expiry
+from utils import CHAT_REGION_LABELS, detect_region, parse_chat_csv_row, parse_chat_xlsx_row
+from callbacks import get_router
+from support import add_ticket_message, thread_text, ticket_button_text, THREAD_TAIL, TICKETS_PAGE_SIZE
 
 
 class AdminStates(StatesGroup):
@@ -36,10 +48,28 @@ def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
 def register_admin_handlers(bot: Bot, dp: Dispatcher):
+    cb = get_router(dp)
+
     @dp.message(Command("admin"))
-    async def admin_menu(message: types.Message):
+    async def admin_menu(message: types.Message, command: CommandObject):
         if not is_admin(message.chat.id):
             return await bot.send_message(message.chat.id, "Нет прав для доступа к админ-меню.")
+        sub = (command.args or "").strip()
+        if sub == "stats":
+            # «/admin stats» — латентность хендлеров (metrics.py)
+            return await bot.send_message(message.chat.id, metrics.summary_text())
+        if sub == "sql":
+            # «/admin sql» — профиль запросов (sqlprofiler.py, при SQL_PROFILE=1)
+            return await bot.send_message(message.chat.id, sqlprofiler.report_text())
+        if sub == "queue":
+            # «/admin queue» — очередь модерации (moderation.py)
+            return await moderation.show_queue(bot, message.chat.id, message.chat.id)
+        if sub == "finance":
+            # «/admin finance» — ожидающие пополнения и выводы (finance.py)
+            return await finance.show_queue(bot, message.chat.id, message.chat.id)
+        if sub.split(" ", 1)[0] == "flood":
+            # «/admin flood <chat_id> <сообщений> <секунд> <повторов>» | «/admin flood <chat_id> default»
+            return await set_flood_rule(message.chat.id, sub.split()[1:])
         kb = types.ReplyKeyboardMarkup(resize_keyboard=True, keyboard=[
             [
                 types.KeyboardButton(text="Управление балансом"),
@@ -58,14 +88,42 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
                 types.KeyboardButton(text="Управление поддержкой")
             ],
             [
+                types.KeyboardButton(text="Очередь модерации"),
                 types.KeyboardButton(text="Редактировать профиль пользователя")
             ],
             [
+                types.KeyboardButton(text="Финансы"),
                 types.KeyboardButton(text="Главное меню")
             ]
         ])
         return await bot.send_message(message.chat.id, "Админ-меню:", reply_markup=kb)
 
+    async def set_flood_rule(chat_id: int, args: list):
+        usage = ("Формат: /admin flood <chat_id> <сообщений> <секунд> <повторов>\n"
+                 "или /admin flood <chat_id> default — вернуть пороги по умолчанию.")
+        try:
+            group_chat_id = int(args[0])
+            values = None if args[1:] == ["default"] else [int(v) for v in args[1:4]]
+        except (IndexError, ValueError):
+            return await bot.send_message(chat_id, usage)
+        if values is not None and (len(values) != 3 or min(values) < 1):
+            return await bot.send_message(chat_id, usage)
+
+        with SessionLocal() as session:
+            cg = session.query(ChatGroup).filter_by(chat_id=group_chat_id).first()
+            if not cg:
+                return await bot.send_message(chat_id, "Чат не найден в списке чатов биржи.")
+            cg.flood_max_messages, cg.flood_window_sec, cg.flood_max_duplicates = values or (None, None, None)
+            session.commit()
+        antiflood.load_rules()
+
+        rule = antiflood.rule_for(group_chat_id)
+        return await bot.send_message(
+            chat_id,
+            f"Антифлуд для {group_chat_id}: не больше {rule.max_messages} сообщений за {rule.window_sec:g} с, "
+            f"не больше {rule.max_duplicates} одинаковых подряд."
+        )
+
     # ------------------------------------------------------------------------
     #            УДАЛИТЬ (ДЕАКТИВИРОВАТЬ) ОБЪЯВЛЕНИЕ
     # ------------------------------------------------------------------------
@@ -102,7 +160,7 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     # ------------------------------------------------------------------------
     #      Одобрить / Отклонить продление
     # ------------------------------------------------------------------------
-    @dp.callback_query(lambda c: c.data.startswith("approve_ext_") or c.data.startswith("reject_ext_"))
+    @cb.route("approve_ext_", "reject_ext_")
     async def handle_extension_request(call: types.CallbackQuery):
         admin_id = call.from_user.id
         if not is_admin(admin_id):
@@ -121,12 +179,11 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
             await bot.edit_message_reply_markup(chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=None)
 
             if action == "approve":
-                ad.is_active = True
-                ad.created_at = datetime.now(timezone.utc)
+                renew_ad_expiry(ad)
                 session.commit()
 
                 await bot.send_message(admin_id, f"✅ Продление объявления #{ad_id} одобрено.")
-                await bot.send_message(ad.user_id, f"Ваше объявление #{ad_id} продлено на 30 дней и снова активно!")
+                await bot.send_message(ad.user_id, f"Ваше объявление #{ad_id} продлено на {AD_LIFETIME_DAYS} дней и снова активно!")
             else:
                 await bot.send_message(admin_id, f"❌ Продление объявления #{ad_id} отклонено.")
                 await bot.send_message(ad.user_id, f"К сожалению, продление объявления #{ad_id} отклонено администратором.")
@@ -166,11 +223,10 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
                 return await bot.send_message(message.chat.id, "Пользователь не найден.")
             try:
                 if val_str.startswith("+") or val_str.startswith("-"):
-                    delta = float(val_str)
-                    user.balance = float(user.balance) + delta
+                    delta = finance.parse_amount(val_str)
+                    user.balance = User.balance + delta   # в SQL: не затираем параллельные списания
                 else:
-                    new_val = float(val_str)
-                    user.balance = new_val
+                    user.balance = finance.parse_amount(val_str)
                 session.commit()
                 return await bot.send_message(message.chat.id, "Баланс изменён.")
             except:
@@ -347,22 +403,9 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
             if not chats:
                 return await bot.send_message(message.chat.id, "Чатов нет в базе.")
 
-        def detect_region(title: str) -> str:
-            low = title.lower()
-            if "москв" in low and "область" not in low:
-                return "Москва"
-            elif "область" in low:
-                return "Московская область"
-            else:
-                return "Города РФ"
-
-        grouped = {
-            "Москва": [],
-            "Московская область": [],
-            "Города РФ": []
-        }
+        grouped = {label: [] for label in CHAT_REGION_LABELS.values()}
         for c in chats:
-            r = detect_region(c.title)
+            r = CHAT_REGION_LABELS[detect_region(c.title)]
             grouped[r].append(c)
 
         result_text = "СПИСОК ЧАТОВ:\n"
@@ -473,20 +516,6 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
 
         rows_added = rows_updated = 0
 
-        def to_float(v):
-            try:
-                return float(v)
-            except:
-                return 0.0
-
-        def parse_chat_id(cell):
-            if isinstance(cell, (int, float)):
-                return int(cell)
-            s = str(cell)
-            if ':' in s:
-                s = s.split(':', 1)[1]
-            return int(s.strip())
-
         try:
             wb = openpyxl.load_workbook(file_path, data_only=True)
         except Exception as e:
@@ -509,55 +538,24 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
             for sheet_name, region_code in sheet_to_region.items():
                 ws = wb[sheet_name]
                 # перебираем строки, начиная со 2-ой, и сразу читаем 7 колонок
-                for row_idx, (title_cell, p1, p5, p10, p_pin, part_cell, id_cell) in \
-                        enumerate(ws.iter_rows(min_row=2, max_col=7, values_only=True), start=2):
-
-                    # если нет ID — пропускаем
-                    if id_cell is None:
-                        continue
-
-                    title = str(title_cell or "").strip()
-                    price_1 = to_float(p1)  # из колонки B
-                    price_5 = to_float(p5)  # из колонки C
-                    price_10 = to_float(p10)  # из колонки D
-                    price_pin = to_float(p_pin)  # из колонки E
-                    try:
-                        participants = int(part_cell or 0)
-                    except:
-                        participants = 0
-
-                    try:
-                        chat_id_val = parse_chat_id(id_cell)
-                    except:
+                for row in ws.iter_rows(min_row=2, max_col=7, values_only=True):
+                    # нет или битый ID — пропускаем
+                    fields = parse_chat_xlsx_row(row)
+                    if fields is None:
                         continue
 
                     # ищем уже существующую запись
-                    cg = session.query(ChatGroup).filter_by(chat_id=chat_id_val).first()
+                    cg = session.query(ChatGroup).filter_by(chat_id=fields["chat_id"]).first()
                     if cg:
                         # обновляем все поля
-                        cg.title = title
+                        for key, value in fields.items():
+                            setattr(cg, key, value)
                         cg.region = region_code
-                        cg.price_1 = price_1
-                        cg.price_5 = price_5
-                        cg.price_10 = price_10
-                        cg.price_pin = price_pin
-                        cg.participants = participants
                         cg.is_active = True
                         rows_updated += 1
                     else:
                         # создаём новую
-                        new_cg = ChatGroup(
-                            chat_id=chat_id_val,
-                            title=title,
-                            region=region_code,
-                            price_1=price_1,
-                            price_5=price_5,
-                            price_10=price_10,
-                            price_pin=price_pin,
-                            participants=participants,
-                            is_active=True
-                        )
-                        session.add(new_cg)
+                        session.add(ChatGroup(region=region_code, is_active=True, **fields))
                         rows_added += 1
 
             session.commit()
@@ -610,44 +608,12 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
                 header = next(reader, None)  # пропустим строку заголовка, если она есть
 
                 for row in reader:
-                    if not row or all(not c.strip() for c in row):
-                        rows_skipped += 1
-                        continue
-
-                    # уберём пустые колонки/пробелы
-                    cells = [c.strip() for c in row if c.strip()]
-
-                    # --- Определяем, есть chat_id --------------------------------
-                    chat_id_val = None
-                    title_val = None
-                    price_val = None
-
-                    # если первый столбец – число ⇒ это chat_id
-                    first = cells[0].lstrip("‑-")  # знак «‑» & обычный минус
-                    if first.isdigit():
-                        # Формат 1
-                        try:
-                            chat_id_val = int(cells[0])
-                            title_val = cells[1] if len(cells) > 1 else ""
-                            price_cell = cells[2] if len(cells) > 2 else ""
-                        except IndexError:
-                            rows_skipped += 1
-                            continue
-                    else:
-                        # Формат 2  (chat_id отсутствует)
-                        title_val = cells[0]
-                        price_cell = cells[-1]  # берём последнюю ячейку
-
-                    # --- Парсим цену --------------------------------------------
-                    price_cell = price_cell.replace(" ", "").replace(",", ".")
-                    try:
-                        price_val = float(price_cell)
-                    except ValueError:
-                        rows_skipped += 1
-                        continue
-                    if abs(price_val) > 9.99e7:
+                    # пустые строки, строки без цены и т.п. — пропускаем
+                    parsed = parse_chat_csv_row(row)
+                    if parsed is None:
                         rows_skipped += 1
                         continue
+                    chat_id_val, title_val, price_val = parsed
 
                     # --- Добавление / обновление --------------------------------
                     if chat_id_val is not None:
@@ -699,13 +665,7 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     # ------------------------------------------------------------------------
     #            МОДЕРАЦИЯ ОБЪЯВЛЕНИЙ (approve/reject/edit/publish)
     # ------------------------------------------------------------------------
-    @dp.callback_query(lambda call:
-        call.data.startswith("approve_ad_") or
-        call.data.startswith("reject_ad_") or
-        call.data.startswith("edit_ad_") or
-        call.data.startswith("publish_ad_") or
-        call.data.startswith("approve_publish_ad_")
-    )
+    @cb.route("approve_ad_", "reject_ad_", "edit_ad_", "publish_ad_", "approve_publish_ad_")
     async def handle_moderation_callbacks(call: types.CallbackQuery, state: FSMContext):
         if not is_admin(call.from_user.id):
             return await bot.answer_callback_query(call.id, "Нет прав для модерации.", show_alert=True)
@@ -729,15 +689,23 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
 
             user_obj = session.query(User).filter_by(id=ad_obj.user_id).first()
 
+            if action in ("approve_ad", "reject_ad", "approve_publish_ad"):
+                # решение — только через очередь модерации: не решаем повторно и не трогаем чужую бронь
+                done, _ = moderation.decide([ad_id], call.from_user.id, approve=action != "reject_ad")
+                if not done:
+                    return await bot.answer_callback_query(
+                        call.id, "Объявление уже рассмотрено или взято в работу другим модератором.", show_alert=True
+                    )
+                session.refresh(ad_obj)
+                if action != "reject_ad":
+                    # подписчики сохранённых поисков получат его в следующей рассылке
+                    saved_searches.on_approved([ad_id])
+
             if action == "approve_ad":
-                ad_obj.status = "approved"
-                session.commit()
                 if user_obj:
                     await bot.send_message(ad_obj.user_id, f"Ваше объявление #{ad_obj.id} теперь «{rus_status('approved')}»!")
                 return await bot.answer_callback_query(call.id, "Объявление одобрено.")
             elif action == "reject_ad":
-                ad_obj.status = "rejected"
-                session.commit()
                 if user_obj:
                     await bot.send_message(ad_obj.user_id, f"Ваше объявление #{ad_obj.id} «{rus_status('rejected')}» админом.")
                 return await bot.answer_callback_query(call.id, "Объявление отклонено.")
@@ -760,8 +728,6 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
                 await post_ad_to_chat(bot, target_chat, ad_obj, user_obj)
                 return await bot.answer_callback_query(call.id, "Объявление опубликовано!")
             elif action == "approve_publish_ad":
-                ad_obj.status = "approved"
-                session.commit()
                 if ad_obj.ad_type == "format2":
                     target_chat = MARKIROVKA_GROUP_ID
                 else:
@@ -791,85 +757,57 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     # ------------------------------------------------------------------------
     #            ОДОБРИТЬ/ОТКЛОНИТЬ ПОПОЛНЕНИЕ
     # ------------------------------------------------------------------------
-    @dp.callback_query(
-        lambda call: call.data.startswith("approve_topup_") or call.data.startswith("reject_topup_")
-    )
+    @cb.route("approve_topup_", "reject_topup_")
     async def handle_topup_approval(call: types.CallbackQuery):
         if not is_admin(call.from_user.id):
             return await bot.answer_callback_query(call.id, "Нет прав для модерации.", show_alert=True)
 
         # извлекаем ID заявки
         topup_id = int(call.data.split("_")[-1])
-        with SessionLocal() as session:
-            topup_obj = session.query(TopUp).filter_by(id=topup_id, status="pending").first()
-            if not topup_obj:
-                return await bot.answer_callback_query(call.id, "Заявка не найдена или уже обработана.", show_alert=True)
-
-            # подгружаем пользователя
-            user_obj = session.query(User).filter_by(id=topup_obj.user_id).first()
-            user_name = f"@{user_obj.username}" if user_obj and user_obj.username else str(user_obj.id)
+        approve = call.data.startswith("approve_topup_")
+        # статус и баланс — одной транзакцией, как пачкой из очереди «Финансы»
+        done, _, balances = finance.decide(finance.TOPUP, [topup_id], approve)
+        if not done:
+            return await bot.answer_callback_query(call.id, "Заявка не найдена или уже обработана.", show_alert=True)
+        decision = done[0]
 
-            pay_sys = getattr(topup_obj, "payment_system", "не указана")
-            pay_card = getattr(topup_obj, "card_number", "не указана")
-
-            # убираем кнопки одобрения/отклонения под заявкой
-            await bot.edit_message_reply_markup(chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=None)
+        with SessionLocal() as session:
+            topup_obj = session.get(TopUp, topup_id)
+            user_obj = session.get(User, decision.user_id)
+        user_name = f"@{user_obj.username}" if user_obj and user_obj.username else str(decision.user_id)
+        pay_sys = topup_obj.payment_system or "не указана"
+        pay_card = topup_obj.card_number or "не указана"
 
-            if call.data.startswith("approve_topup_"):
-                # зачисляем средства
-                if user_obj:
-                    user_obj.balance = float(user_obj.balance) + float(topup_obj.amount)
-                topup_obj.status = "approved"
-                session.commit()
+        # убираем кнопки одобрения/отклонения под заявкой
+        await bot.edit_message_reply_markup(chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=None)
 
-                await bot.answer_callback_query(call.id, "Пополнение одобрено.")
-                await bot.send_message(
-                    call.message.chat.id,
-                    (
-                        f"✅ Пополнение #{topup_id} на сумму {topup_obj.amount} руб. одобрено.\n"
-                        f"Пользователь: {user_name}\n"
-                        f"Система: {pay_sys}, Карта: {pay_card}\n"
-                        f"Новый баланс: {user_obj.balance if user_obj else 'N/A'} руб."
-                    )
+        if approve:
+            await bot.answer_callback_query(call.id, "Пополнение одобрено.")
+            await bot.send_message(
+                call.message.chat.id,
+                (
+                    f"✅ Пополнение #{topup_id} на сумму {finance.money(decision.amount)} руб. одобрено.\n"
+                    f"Пользователь: {user_name}\n"
+                    f"Система: {pay_sys}, Карта: {pay_card}\n"
+                    f"Новый баланс: {finance.money(balances.get(decision.user_id))} руб."
                 )
-                # уведомляем пользователя
-                if user_obj:
-                    await bot.send_message(
-                        user_obj.id,
-                        (
-                            f"Ваше пополнение #{topup_id} на сумму {topup_obj.amount} руб. "
-                            f"«{rus_status('approved')}».\n"
-                            f"Новый баланс: {user_obj.balance} руб."
-                        )
-                    )
-
-            else:  # отклонение
-                topup_obj.status = "rejected"
-                session.commit()
-
-                await bot.answer_callback_query(call.id, "Пополнение отклонено.")
-                await bot.send_message(
-                    call.message.chat.id,
-                    (
-                        f"❌ Пополнение #{topup_id} пользователем {user_name} "
-                        f"(Система: {pay_sys}, Карта: {pay_card}) «{rus_status('rejected')}»."
-                    )
+            )
+        else:  # отклонение
+            await bot.answer_callback_query(call.id, "Пополнение отклонено.")
+            await bot.send_message(
+                call.message.chat.id,
+                (
+                    f"❌ Пополнение #{topup_id} пользователем {user_name} "
+                    f"(Система: {pay_sys}, Карта: {pay_card}) «{rus_status('rejected')}»."
                 )
-                # уведомляем пользователя
-                if user_obj:
-                    await bot.send_message(
-                        user_obj.id,
-                        f"Ваше пополнение #{topup_id} на сумму {topup_obj.amount} руб. «{rus_status('rejected')}»."
-                    )
-        # обязательный ответ на callback_query
-        return await bot.answer_callback_query(call.id)
+            )
+        # уведомляем пользователя
+        return await finance.notify_users(bot, finance.TOPUP, done, approve, balances)
 
     # ------------------------------------------------------------------------
     #            МОДЕРАЦИЯ ОТЗЫВОВ (approve/reject)
     # ------------------------------------------------------------------------
-    @dp.callback_query(
-        lambda call: call.data.startswith("approve_feedback_") or call.data.startswith("reject_feedback_")
-    )
+    @cb.route("approve_feedback_", "reject_feedback_")
     async def handle_feedback_moderation(call: types.CallbackQuery):
         if not is_admin(call.from_user.id):
             return await bot.answer_callback_query(call.id, "Нет прав для модерации.", show_alert=True)
@@ -881,14 +819,16 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
             return await bot.answer_callback_query(call.id, "Ошибка ID отзыва.", show_alert=True)
 
         with SessionLocal() as session:
-            fb_obj = session.query(AdFeedback).filter_by(id=feedback_id).first()
-            # Предположим, что у feedback есть поле status
-            # Если нет — уберите проверку или адаптируйте
+            # строка блокируется до коммита: второй модератор её пропустит (как в finance.decide),
+            # и reputation.apply_approved не сработает дважды
+            fb_obj = (session.query(AdFeedback).filter_by(id=feedback_id)
+                      .with_for_update(skip_locked=True).first())
             if not fb_obj or getattr(fb_obj, "status", None) != "pending":
                 return await bot.answer_callback_query(call.id, "Отзыв не найден или уже обработан.", show_alert=True)
 
             if call.data.startswith("approve_feedback_"):
                 fb_obj.status = "approved"
+                reputation.apply_approved(session, fb_obj)
                 session.commit()
                 await bot.answer_callback_query(call.id, "Отзыв одобрен.")
                 return await bot.send_message(fb_obj.user_id, f"Ваш отзыв #{fb_obj.id} «{rus_status('approved')}»!")
@@ -901,69 +841,40 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     # ------------------------------------------------------------------------
     #            ОДОБРИТЬ / ОТКЛОНИТЬ ВЫВОД СРЕДСТВ
     # ------------------------------------------------------------------------
-    @dp.callback_query(
-        lambda call: call.data.startswith("approve_withdraw_") or call.data.startswith("reject_withdraw_")
-    )
+    @cb.route("approve_withdraw_", "reject_withdraw_")
     async def handle_withdraw_approval(call: types.CallbackQuery):
         if not is_admin(call.from_user.id):
             return await bot.answer_callback_query(call.id, "Нет прав для модерации.", show_alert=True)
 
-        with SessionLocal() as session:
-            if call.data.startswith("approve_withdraw_"):
-                w_id_str = call.data.replace("approve_withdraw_", "")
-                try:
-                    w_id = int(w_id_str)
-                except:
-                    return await bot.answer_callback_query(call.id, "Некорректный ID вывода.", show_alert=True)
-
-                wd = session.query(Withdrawal).filter_by(id=w_id, status="pending").first()
-                if not wd:
-                    return await bot.answer_callback_query(call.id, "Заявка не найдена или уже обработана.", show_alert=True)
-
-                user_obj = session.query(User).filter_by(id=wd.user_id).first()
-                if not user_obj:
-                    return await bot.answer_callback_query(call.id, "Пользователь не найден.", show_alert=True)
-
-                user_obj.balance = float(user_obj.balance) - float(wd.amount)
-                wd.status = "approved"
-                session.commit()
-
-                await bot.answer_callback_query(call.id, "Вывод одобрен, баланс списан.")
-                await bot.send_message(
-                    call.message.chat.id,
-                    f"✅Вывод #{w_id} «{rus_status('approved')}». С пользователя списано {wd.amount} руб."
-                )
-                return await bot.send_message(
-                    wd.user_id,
-                    f"Ваши средства ({wd.amount} руб.) отправлены на вывод!\n"
-                    f"Баланс обновлён: {user_obj.balance} руб."
-                )
-
-            elif call.data.startswith("reject_withdraw_"):
-                w_id_str = call.data.replace("reject_withdraw_", "")
-                try:
-                    w_id = int(w_id_str)
-                except:
-                    return await bot.answer_callback_query(call.id, "Некорректный ID вывода.", show_alert=True)
-
-                wd = session.query(Withdrawal).filter_by(id=w_id, status="pending").first()
-                if not wd:
-                    return await bot.answer_callback_query(call.id, "Заявка не найдена или уже обработана.", show_alert=True)
-
-                wd.status = "rejected"
-                session.commit()
-
-                await bot.answer_callback_query(call.id, "Вывод отклонён.")
-                await bot.send_message(
-                    call.message.chat.id,
-                    f"❌Вывод #{w_id} «{rus_status('rejected')}»."
-                )
-                return await bot.send_message(
-                    wd.user_id,
-                    f"Ваша заявка на вывод #{w_id} «{rus_status('rejected')}»."
-                )
-            else:
-                return None
+        approve = call.data.startswith("approve_withdraw_")
+        try:
+            w_id = int(call.data.split("_")[-1])
+        except ValueError:
+            return await bot.answer_callback_query(call.id, "Некорректный ID вывода.", show_alert=True)
+
+        # сумма зарезервирована при заявке (finance.reserve_withdrawal): одобрение её не списывает,
+        # отклонение — возвращает на баланс
+        done, _, balances = finance.decide(finance.WITHDRAW, [w_id], approve)
+        if not done:
+            return await bot.answer_callback_query(call.id, "Заявка не найдена или уже обработана.", show_alert=True)
+        decision = done[0]
+
+        if approve:
+            await bot.answer_callback_query(call.id, "Вывод одобрен.")
+            charged = ("сумма списана при заявке" if not decision.delta
+                       else f"с пользователя списано {finance.money(-decision.delta)} руб.")
+            await bot.send_message(
+                call.message.chat.id,
+                f"✅Вывод #{w_id} на {finance.money(decision.amount)} руб. «{rus_status('approved')}», {charged}."
+            )
+        else:
+            await bot.answer_callback_query(call.id, "Вывод отклонён.")
+            refunded = f", на баланс возвращено {finance.money(decision.delta)} руб." if decision.delta else "."
+            await bot.send_message(
+                call.message.chat.id,
+                f"❌Вывод #{w_id} «{rus_status('rejected')}»{refunded}"
+            )
+        return await finance.notify_users(bot, finance.WITHDRAW, done, approve, balances)
 
     # ------------------------------------------------------------------------
     #            УПРАВЛЕНИЕ ПОДДЕРЖКОЙ (ТИКЕТАМИ)
@@ -984,24 +895,70 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     async def admin_list_tickets(message: types.Message):
         if not is_admin(message.chat.id):
             return None
+        return await show_tickets_page(message.chat.id)
+
+    async def show_tickets_page(chat_id: int, page: int = 0, message_id: int = None):
+        """
+        Входящие поддержки: открытые тикеты, свежая активность сверху, с непрочитанными и превью.
+        Из БД берём одну страницу (+1 строка, чтобы понять, есть ли следующая).
+        """
+        page = max(0, page)
         with SessionLocal() as session:
-            tickets = session.query(SupportTicket).filter(SupportTicket.status == "open").all()
-            if not tickets:
-                return await bot.send_message(message.chat.id, "Нет открытых тикетов.")
-
-            buttons = [
-                [ types.InlineKeyboardButton(
-                    text=f"Тикет #{t.id} от пользователя {t.user_id}",
-                    callback_data=f"admin_support_view_{t.id}"
-                ) ] for t in tickets
-            ]
-            kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-            return await bot.send_message(message.chat.id, "Открытые тикеты:", reply_markup=kb)
+            rows = (session.query(SupportTicket.id, SupportTicket.status,
+                                  SupportTicket.unread_by_admin, SupportTicket.last_message_preview)
+                           .filter(SupportTicket.status == "open")
+                           .order_by(SupportTicket.last_activity_at.desc().nullslast(), SupportTicket.id.desc())
+                           .offset(page * TICKETS_PAGE_SIZE)
+                           .limit(TICKETS_PAGE_SIZE + 1)
+                           .all())
+        has_next = len(rows) > TICKETS_PAGE_SIZE
+        rows = rows[:TICKETS_PAGE_SIZE]
+        if not rows and page == 0:
+            if message_id:
+                return await bot.edit_message_text("Нет открытых тикетов.", chat_id=chat_id, message_id=message_id)
+            return await bot.send_message(chat_id, "Нет открытых тикетов.")
+
+        buttons = [
+            [ types.InlineKeyboardButton(
+                text=ticket_button_text(t_id, st, unread, preview),
+                callback_data=f"admin_support_view_{t_id}"
+            ) ] for t_id, st, unread, preview in rows
+        ]
+        nav = []
+        if page > 0:
+            nav.append(types.InlineKeyboardButton(text="⏪ Назад", callback_data=f"admin_support_page_{page - 1}"))
+        if has_next:
+            nav.append(types.InlineKeyboardButton(text="Вперёд ⏩", callback_data=f"admin_support_page_{page + 1}"))
+        if nav:
+            buttons.append(nav)
+        kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
+
+        text = f"Открытые тикеты (стр. {page + 1}):" if rows else "На этой странице тикетов нет."
+        if message_id:
+            return await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=kb)
+        return await bot.send_message(chat_id, text, reply_markup=kb)
+
+    @cb.route("admin_support_page_")
+    async def admin_support_tickets_page(call: types.CallbackQuery):
+        if not is_admin(call.from_user.id):
+            return await bot.answer_callback_query(call.id, "Нет прав.")
+        try:
+            page = int(call.data.replace("admin_support_page_", "", 1))
+        except ValueError:
+            return await bot.answer_callback_query(call.id, "Некорректная страница.", show_alert=True)
+
+        await bot.answer_callback_query(call.id)
+        try:
+            return await show_tickets_page(call.message.chat.id, page, call.message.message_id)
+        except TelegramAPIError as e:
+            if "message is not modified" not in str(e):
+                raise
+            return None
 
     # ------------------------------------------------------------------
     #   просмотр тикета (админ)
     # ------------------------------------------------------------------
-    @dp.callback_query(lambda c: c.data.startswith("admin_support_view_"))
+    @cb.route("admin_support_view_")
     async def admin_support_view_ticket(call: types.CallbackQuery):
         if not is_admin(call.from_user.id):
             return await bot.answer_callback_query(call.id, "Нет прав.")
@@ -1016,18 +973,23 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
             if not ticket:
                 return await bot.answer_callback_query(call.id, "Тикет не найден.", show_alert=True)
 
-            text_history = "\n\n".join(
-                f"{'Админ' if m.sender_id in ADMIN_IDS else f'Пользователь {m.sender_id}'} "
-                f"({m.created_at:%d.%m.%y %H:%M}):\n{m.text}"
-                for m in ticket.messages
-            ) or "Сообщений пока нет."
+            # только хвост переписки; давно закрытые тикеты читаются из архива
+            msgs = archive.load_messages(s, archive.KIND_TICKET, t_id, tail=THREAD_TAIL)
+            text_history = thread_text(
+                msgs, max(ticket.message_count, len(msgs)),
+                lambda sender_id: "Админ" if sender_id in ADMIN_IDS else f"Пользователь {sender_id}"
+            )
+            status = ticket.status
+            if ticket.unread_by_admin:
+                ticket.unread_by_admin = 0
+                s.commit()
 
         kb = types.InlineKeyboardMarkup(inline_keyboard=[
             [ types.InlineKeyboardButton(text="✉ Ответить", callback_data=f"admin_support_reply_{t_id}") ],
             [ types.InlineKeyboardButton(text="🛑 Закрыть тикет", callback_data=f"admin_support_close_{t_id}") ]
         ])
         await bot.edit_message_text(
-            f"Тикет #{t_id}\nСтатус: {rus_status(ticket.status)}\n\n{text_history}",
+            f"Тикет #{t_id}\nСтатус: {rus_status(status)}\n\n{text_history}",
             chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=kb
         )
         return await bot.answer_callback_query(call.id)
@@ -1035,7 +997,7 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     # ------------------------------------------------------------------
     #   ответ администратора
     # ------------------------------------------------------------------
-    @dp.callback_query(lambda c: c.data.startswith("admin_support_reply_"))
+    @cb.route("admin_support_reply_")
     async def admin_support_reply_ticket(call: types.CallbackQuery, state: FSMContext):
         if not is_admin(call.from_user.id):
             return await bot.answer_callback_query(call.id)
@@ -1067,9 +1029,7 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
                 return await bot.send_message(message.chat.id, "Тикет не найден или уже закрыт.")
 
             user_id = tk.user_id  # кешируем до commit/выхода
-            s.add(SupportMessage(ticket_id=t_id,
-                                 sender_id=message.chat.id,
-                                 text=text))
+            add_ticket_message(s, t_id, message.chat.id, text, by_admin=True)
             s.commit()
 
         # ── уведомляем пользователя ───────────────────────────
@@ -1086,7 +1046,7 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     # ------------------------------------------------------------------
     #   закрыть тикет (админ)
     # ------------------------------------------------------------------
-    @dp.callback_query(lambda c: c.data.startswith("admin_support_close_"))
+    @cb.route("admin_support_close_")
     async def admin_support_close_ticket(call: types.CallbackQuery):
         if not is_admin(call.from_user.id):
             return await bot.answer_callback_query(call.id, "Нет прав")
@@ -1104,6 +1064,7 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
 
             user_id = ticket.user_id  # ← кешируем!
             ticket.status = "closed"
+            ticket.closed_at = datetime.utcnow()
             s.commit()
 
         await bot.answer_callback_query(call.id, "Тикет закрыт.")
@@ -1115,11 +1076,7 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
     # ------------------------------------------------------------------------
     #            ОБРАБОТКА ЖАЛОБ (complaint_msg_seller_, complaint_del_ad_, complaint_ban_)
     # ------------------------------------------------------------------------
-    @dp.callback_query(lambda call:
-        call.data.startswith("complaint_msg_seller_") or
-        call.data.startswith("complaint_del_ad_") or
-        call.data.startswith("complaint_ban_")
-    )
+    @cb.route("complaint_msg_seller_", "complaint_del_ad_", "complaint_ban_")
     async def handle_complaint_actions(call: types.CallbackQuery, state: FSMContext):
         """
         Жалоба от search.py -> AdComplaint
@@ -1226,7 +1183,8 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
 
             user_seller.is_banned = True
             user_seller.ban_reason = reason
-            dt_until = datetime.now(timezone.utc) + timedelta(days=days_val)
+            # ban_until хранится без часового пояса, в UTC — как и остальные даты (см. maintenance.py)
+            dt_until = datetime.utcnow() + timedelta(days=days_val)
             user_seller.ban_until = dt_until
 
             comp = session.query(AdComplaint).filter_by(id=complaint_id).first()
@@ -1315,48 +1273,3 @@ def register_admin_handlers(bot: Bot, dp: Dispatcher):
             session.commit()
 
         return await bot.send_message(chat_id, f"Поле {field.upper()} пользователя #{user_id} обновлено на: {new_val}")
-
-    @dp.callback_query(lambda call:
-    call.data.startswith("approve_ext_") or call.data.startswith("reject_ext_")             )
-    async def handle_extension_request(call: types.CallbackQuery):
-        """
-        Админ одобряет или отклоняет просьбу о продлении.
-        """
-        admin_id = call.from_user.id
-        if not is_admin(admin_id):
-            return await bot.answer_callback_query(call.id, "Нет прав.", show_alert=True)
-
-        data, ad_id_str = call.data.split("_", 1)[0:2], call.data.split("_", 2)[2]
-        ad_id = int(ad_id_str)
-
-        with SessionLocal() as sess:
-            ad = sess.query(Ad).get(ad_id)
-            if not ad:
-                return await bot.answer_callback_query(call.id, "Объявление не найдено.", show_alert=True)
-
-            if call.data.startswith("approve_ext_"):
-                # сдвигаем created_at на сейчас
-                ad.created_at = datetime.now(timezone.utc)
-                sess.commit()
-
-                # уведомляем
-                await bot.edit_message_reply_markup(
-                    chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=None
-                )
-                await bot.send_message(admin_id, f"✅ Продление объявления #{ad_id} одобрено.")
-                await bot.send_message(
-                    ad.user_id,
-                    f"Ваше объявление #{ad_id} продлено на 30 дней!"
-                )
-            else:
-                # отклоняем
-                await bot.edit_message_reply_markup(
-                    chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=None
-                )
-                await bot.send_message(admin_id, f"❌ Продление объявления #{ad_id} отклонено.")
-                await bot.send_message(
-                    ad.user_id,
-                    f"К сожалению, продление объявления #{ad_id} отклонено администратором."
-                )
-
-        return await bot.answer_callback_query(call.id)
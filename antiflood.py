@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Антифлуд в чатах биржи (вызывается из guard_group_messages, см. bot.py).
+
+На каждую пару (чат, пользователь) в памяти держим скользящее окно времён
+последних сообщений и хэш последнего сообщения с числом повторов подряд.
+Нарушение — больше max_messages сообщений за window_sec секунд или больше
+max_duplicates одинаковых сообщений (текст/подпись + file_unique_id вложения).
+Альбом (сообщения с одним media_group_id) считается одним сообщением — по первому элементу.
+Санкции нарастают с каждым нарушением в пределах FLOOD_STRIKE_TTL_SEC:
+удалить сообщение → удалить и замьютить → удалить, замьютить надолго и сообщить админам.
+
+Проверка — O(1) на сообщение и без БД: пороги чатов (колонки flood_* в chat_groups)
+загружаются в память на старте и после изменения командой «/admin flood».
+Состояния молчащих пользователей вытесняются по FLOOD_IDLE_TTL_SEC.
+"""
+import hashlib
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, replace
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot, types
+
+from config import (
+    ADMIN_COMPLAINT_CHAT_ID, FLOOD_MAX_MESSAGES, FLOOD_WINDOW_SEC, FLOOD_MAX_DUPLICATES,
+    FLOOD_DUP_WINDOW_SEC, FLOOD_MUTE_SEC, FLOOD_STRIKE_TTL_SEC, FLOOD_IDLE_TTL_SEC
+)
+from database import SessionLocal, ChatGroup
+
+ACTION_DELETE = "delete"
+ACTION_MUTE = "mute"
+ACTION_REPORT = "report"
+# санкция за 1-е, 2-е и 3-е (и последующие) нарушение
+_ESCALATION = (ACTION_DELETE, ACTION_MUTE, ACTION_REPORT)
+# во сколько раз дольше мьют на последней ступени
+REPORT_MUTE_FACTOR = 6
+
+
+@dataclass(frozen=True)
+class FloodRule:
+    max_messages: int = FLOOD_MAX_MESSAGES
+    window_sec: float = FLOOD_WINDOW_SEC
+    max_duplicates: int = FLOOD_MAX_DUPLICATES
+    dup_window_sec: float = FLOOD_DUP_WINDOW_SEC
+    mute_sec: int = FLOOD_MUTE_SEC
+
+
+DEFAULT_RULE = FloodRule()
+
+
+class _State:
+    __slots__ = ("times", "last_hash", "last_hash_at", "dup_count", "strikes", "strike_at", "seen_at", "last_group")
+
+    def __init__(self, max_messages: int):
+        # окно хранит не больше max_messages + 1 отметок — этого достаточно, чтобы увидеть превышение
+        self.times = deque(maxlen=max_messages + 1)
+        self.last_hash = None
+        self.last_hash_at = 0.0
+        self.dup_count = 0
+        self.strikes = 0
+        self.strike_at = 0.0
+        self.seen_at = 0.0
+        self.last_group = None       # media_group_id последнего альбома
+
+
+_rules: Dict[int, FloodRule] = {}
+_states: "OrderedDict[Tuple[int, int], _State]" = OrderedDict()
+
+
+def rule_for(chat_id: int) -> FloodRule:
+    return _rules.get(chat_id, DEFAULT_RULE)
+
+
+def load_rules():
+    """Пороги чатов из chat_groups в память (на старте и после «/admin flood»)."""
+    with SessionLocal() as sess:
+        rows = sess.query(
+            ChatGroup.chat_id, ChatGroup.flood_max_messages, ChatGroup.flood_window_sec, ChatGroup.flood_max_duplicates
+        ).filter(
+            (ChatGroup.flood_max_messages != None) | (ChatGroup.flood_window_sec != None)
+            | (ChatGroup.flood_max_duplicates != None)
+        ).all()
+    rules = {}
+    for chat_id, max_messages, window_sec, max_duplicates in rows:
+        rules[chat_id] = replace(
+            DEFAULT_RULE,
+            max_messages=max_messages or DEFAULT_RULE.max_messages,
+            window_sec=window_sec or DEFAULT_RULE.window_sec,
+            max_duplicates=max_duplicates or DEFAULT_RULE.max_duplicates,
+        )
+    _rules.clear()
+    _rules.update(rules)
+    # окна под новые пороги заведутся заново
+    _states.clear()
+
+
+def content_hash(message: types.Message) -> Optional[int]:
+    """Хэш содержимого: нормализованный текст/подпись + file_unique_id вложения."""
+    text = " ".join((message.text or message.caption or "").lower().split())
+    media = (
+        (message.photo[-1] if message.photo else None)
+        or message.sticker or message.video or message.document or message.voice or message.animation
+    )
+    key = f"{text}\x00{media.file_unique_id if media else ''}"
+    if key == "\x00":
+        return None
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _evict_idle(now: float):
+    # самые давно молчавшие — в начале OrderedDict
+    while _states:
+        key, state = next(iter(_states.items()))
+        if now - state.seen_at <= FLOOD_IDLE_TTL_SEC:
+            break
+        del _states[key]
+
+
+def check(chat_id: int, user_id: int, msg_hash: Optional[int], now: float = None,
+          media_group_id: Optional[str] = None) -> Optional[str]:
+    """
+    Учитывает сообщение. Возвращает санкцию (ACTION_*) или None, если нарушения нет.
+    Остальные элементы уже учтённого альбома (тот же media_group_id) пропускаются.
+    """
+    now = time.monotonic() if now is None else now
+    rule = rule_for(chat_id)
+    key = (chat_id, user_id)
+    state = _states.get(key)
+    if state is None:
+        state = _states[key] = _State(rule.max_messages)
+    else:
+        _states.move_to_end(key)
+    state.seen_at = now
+    _evict_idle(now)
+
+    if media_group_id is not None:
+        if media_group_id == state.last_group:
+            return None
+        state.last_group = media_group_id
+
+    times = state.times
+    times.append(now)
+    too_fast = len(times) > rule.max_messages and now - times[0] < rule.window_sec
+
+    if msg_hash is not None and msg_hash == state.last_hash and now - state.last_hash_at <= rule.dup_window_sec:
+        state.dup_count += 1
+    else:
+        state.last_hash, state.dup_count = msg_hash, 1
+    state.last_hash_at = now
+    repeated = msg_hash is not None and state.dup_count > rule.max_duplicates
+
+    if not (too_fast or repeated):
+        return None
+    if now - state.strike_at > FLOOD_STRIKE_TTL_SEC:
+        state.strikes = 0
+    state.strikes += 1
+    state.strike_at = now
+    return _ESCALATION[min(state.strikes, len(_ESCALATION)) - 1]
+
+
+async def enforce(bot: Bot, message: types.Message, action: str):
+    """Применяет санкцию к автору сообщения."""
+    chat_id, user = message.chat.id, message.from_user
+    try:
+        await bot.delete_message(chat_id, message.message_id)
+    except Exception:
+        pass
+    if action == ACTION_DELETE:
+        return
+
+    mute_sec = rule_for(chat_id).mute_sec * (REPORT_MUTE_FACTOR if action == ACTION_REPORT else 1)
+    try:
+        await bot.restrict_chat_member(
+            chat_id, user.id,
+            permissions=types.ChatPermissions(can_send_messages=False),
+            # относительный срок: aiogram не переводит naive datetime в UTC
+            until_date=timedelta(seconds=mute_sec)
+        )
+    except Exception as e:
+        # у бота может не быть права ограничивать участников
+        print(f"antiflood: не удалось замьютить {user.id} в {chat_id}: {e}")
+
+    if action == ACTION_REPORT:
+        mention = f"@{user.username}" if user.username else user.full_name
+        try:
+            await bot.send_message(
+                ADMIN_COMPLAINT_CHAT_ID,
+                f"🚨 Флуд в чате «{message.chat.title}» ({chat_id}):\n"
+                f"пользователь {user.id} ({mention}) замьючен на {mute_sec // 60} мин.\n"
+                f"Забанить в боте: «Забанить/Разбанить» в админ-меню."
+            )
+        except Exception as e:
+            print(f"antiflood: не удалось сообщить админам: {e}")
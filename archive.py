@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Архив переписки: закрытые чаты по объявлениям и тикеты поддержки старше
+ARCHIVE_AFTER_DAYS уносят свои сообщения из ad_chat_messages / support_messages
+в message_archives — одна строка на чат/тикет, сообщения в сжатом JSON.
+
+Горячие таблицы сообщений остаются маленькими (в них только живая переписка),
+а сами чат/тикет никуда не деваются — статус, участники и т.п. на месте.
+Запускается из maintenance.run_maintenance.
+"""
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import delete, exists, insert, select
+
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from database import (
+    SessionLocal, AdChat, AdChatMessage, SupportTicket, SupportMessage, MessageArchive
+)
+
+KIND_AD_CHAT = "ad_chat"
+KIND_TICKET = "ticket"
+
+# вид архива → (родитель, таблица сообщений, колонка-ссылка на родителя)
+_KINDS = {
+    KIND_AD_CHAT: (AdChat, AdChatMessage, AdChatMessage.chat_id),
+    KIND_TICKET: (SupportTicket, SupportMessage, SupportMessage.ticket_id),
+}
+
+
+class ArchivedMessage(NamedTuple):
+    sender_id: int
+    text: str
+    created_at: datetime
+
+
+def pack_messages(messages: List[ArchivedMessage]) -> bytes:
+    payload = [[m.sender_id, m.text, m.created_at.isoformat() if m.created_at else None] for m in messages]
+    return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def unpack_messages(blob: bytes) -> List[ArchivedMessage]:
+    return [
+        ArchivedMessage(sender_id, text, datetime.fromisoformat(ts) if ts else None)
+        for sender_id, text, ts in json.loads(zlib.decompress(blob).decode("utf-8"))
+    ]
+
+
+def _archive_batch(kind: str, cutoff: datetime) -> int:
+    """Одна пачка родителей одного вида — одна транзакция. Возвращает размер пачки."""
+    parent, message, parent_col = _KINDS[kind]
+    already = exists().where(MessageArchive.kind == kind, MessageArchive.parent_id == parent.id)
+    with SessionLocal() as sess:
+        ids = sess.execute(
+            select(parent.id)
+            .where(parent.status == "closed", parent.closed_at < cutoff, ~already)
+            .order_by(parent.closed_at)
+            .limit(ARCHIVE_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            return 0
+
+        rows = sess.execute(
+            delete(message)
+            .where(parent_col.in_(ids))
+            .returning(parent_col, message.sender_id, message.text, message.created_at)
+            .execution_options(synchronize_session=False)
+        ).all()
+        by_parent = defaultdict(list)
+        for parent_id, sender_id, text, created_at in rows:
+            by_parent[parent_id].append(ArchivedMessage(sender_id, text, created_at))
+
+        now = datetime.utcnow()
+        archives = []
+        for parent_id in ids:
+            msgs = sorted(by_parent.get(parent_id, []), key=lambda m: m.created_at or datetime.min)
+            archives.append({
+                "kind": kind,
+                "parent_id": parent_id,
+                "message_count": len(msgs),
+                "first_at": msgs[0].created_at if msgs else None,
+                "last_at": msgs[-1].created_at if msgs else None,
+                "payload": pack_messages(msgs),
+                "archived_at": now,
+            })
+        sess.execute(insert(MessageArchive), archives)
+        sess.commit()
+    return len(ids)
+
+
+def archive_closed() -> int:
+    """Архивирует всё, что закрыто дольше ARCHIVE_AFTER_DAYS. Возвращает число чатов + тикетов."""
+    cutoff = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    total = 0
+    for kind in _KINDS:
+        while True:
+            n = _archive_batch(kind, cutoff)
+            total += n
+            if n < ARCHIVE_BATCH_SIZE:
+                break
+    return total
+
+
+def load_messages(sess, kind: str, parent_id: int, tail: Optional[int] = None) -> List[ArchivedMessage]:
+    """
+    Переписка чата/тикета по порядку: из горячей таблицы, а если её там уже нет —
+    из архива. tail — только столько последних сообщений.
+    """
+    _, message, parent_col = _KINDS[kind]
+    q = select(message.sender_id, message.text, message.created_at).where(parent_col == parent_id)
+    if tail:
+        rows = sess.execute(q.order_by(message.created_at.desc(), message.id.desc()).limit(tail)).all()[::-1]
+    else:
+        rows = sess.execute(q.order_by(message.created_at.asc(), message.id.asc())).all()
+    if rows:
+        return [ArchivedMessage(*r) for r in rows]
+    blob = sess.execute(
+        select(MessageArchive.payload)
+        .where(MessageArchive.kind == kind, MessageArchive.parent_id == parent_id)
+    ).scalar()
+    if blob is None:
+        return []
+    msgs = unpack_messages(blob)
+    return msgs[-tail:] if tail else msgs
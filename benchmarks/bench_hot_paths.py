@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки чистых функций, которые вызываются на каждое сообщение/нажатие
+или на каждую строку импорта: цены чатов, статусы, подпись поста, регион чата,
+разбор строк chats.csv / chati.xlsx, упаковка и маршрутизация callback_data.
+
+Фикстуры — те самые chats.csv и chati.xlsx из корня репозитория.
+
+    python benchmarks/bench_hot_paths.py                  # просто замер
+    python benchmarks/bench_hot_paths.py --save           # записать baseline
+    python benchmarks/bench_hot_paths.py --compare        # сравнить с baseline (код 1 при замедлении)
+
+Baseline лежит в benchmarks/baseline_hot_paths.json. Числа зависят от машины:
+сравнивать имеет смысл прогоны на одном и том же железе, перезаписывайте baseline
+через --save, когда меняете машину или сознательно принимаете замедление.
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openpyxl
+
+import callbacks
+import utils
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline_hot_paths.json")
+CHATS_CSV = os.path.join(ROOT, "chats.csv")
+CHATS_XLSX = os.path.join(ROOT, "chati.xlsx")
+
+
+# ─────────────────────────── фикстуры ───────────────────────────
+def load_fixtures() -> dict:
+    with open(CHATS_CSV, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        next(reader, None)
+        csv_rows = [row for row in reader]
+
+    wb = openpyxl.load_workbook(CHATS_XLSX, data_only=True)
+    xlsx_rows = [
+        row
+        for name in wb.sheetnames[:3]
+        for row in wb[name].iter_rows(min_row=2, max_col=7, values_only=True)
+    ]
+
+    chats = [
+        SimpleNamespace(price_1=r[1] or 0, price_5=r[2] or 0, price_10=r[3] or 0)
+        for r in xlsx_rows if r[1] is not None
+    ]
+    ad = SimpleNamespace(
+        id=123456, inline_button_text="Стул", text="Стул деревянный, б/у, самовывоз. " * 8,
+        price=Decimal("1500.00"), quantity=1, category="🛋️ Дом и сад", subcategory="Мебель",
+        city="Москва | ЗАО", photos="",
+    )
+    user = SimpleNamespace(inn="771234567890", full_name="Иванов Иван Иванович", company_name=None, username="seller")
+
+    router = callbacks.CallbackRouter()
+    for prefix in ("approve_ad_", "reject_ad_", "edit_ad_", "my_ad_detail_", "profile_my_ad_", "f2toggle_", "f2cnt_"):
+        router.route(prefix)(lambda call: None)
+    router.route(callbacks.BUY_AD, callbacks.DETAILS_AD, callbacks.SEARCH_OPEN_AD)(lambda call, args: None)
+    router.route(exact=("create_ad_start", "photo_done", "photo_skip", "srch_cat_all"))(lambda call: None)
+
+    return {
+        "csv_rows": csv_rows,
+        "xlsx_rows": xlsx_rows,
+        "titles": [str(r[0] or "") for r in xlsx_rows],
+        "chats": chats,
+        "ad": ad,
+        "user": user,
+        "router": router,
+    }
+
+
+def cases(fx: dict) -> dict:
+    """Имя → (функция одного прохода, сколько операций в проходе)."""
+    chats, titles = fx["chats"], fx["titles"]
+    csv_rows, xlsx_rows = fx["csv_rows"], fx["xlsx_rows"]
+    ad, user, router = fx["ad"], fx["user"], fx["router"]
+    statuses = ["pending", "approved", "rejected", "completed", "canceled", "open", "closed", "unknown"]
+    packed = [callbacks.BUY_AD.pack(i) for i in range(1000, 1100)]
+    clicks = packed + ["buy_ad_1234", "approve_ad_42", "f2cnt_pin", "photo_done", "nothing_here"]
+
+    def calc_chat_price():
+        for chat in chats:
+            for qty in (1, 5, 10, 3):
+                utils.calc_chat_price(chat, qty)
+
+    def rus_status():
+        for st in statuses:
+            utils.rus_status(st)
+
+    def build_ad_caption():
+        utils.build_ad_caption(ad, user)
+
+    def detect_region():
+        for title in titles:
+            utils.detect_region(title)
+
+    def parse_chat_csv_row():
+        for row in csv_rows:
+            utils.parse_chat_csv_row(row)
+
+    def parse_chat_xlsx_row():
+        for row in xlsx_rows:
+            utils.parse_chat_xlsx_row(row)
+
+    def load_chati_xlsx():
+        openpyxl.load_workbook(CHATS_XLSX, data_only=True)
+
+    def callback_pack():
+        for i in range(100):
+            callbacks.BUY_AD.pack(i)
+
+    def callback_unpack():
+        for data in packed:
+            callbacks.BUY_AD.unpack(data)
+
+    def callback_resolve():
+        for data in clicks:
+            router.resolve(data)
+
+    return {
+        "calc_chat_price": (calc_chat_price, len(chats) * 4),
+        "rus_status": (rus_status, len(statuses)),
+        "build_ad_caption": (build_ad_caption, 1),
+        "detect_region": (detect_region, len(titles)),
+        "parse_chat_csv_row": (parse_chat_csv_row, len(csv_rows)),
+        "parse_chat_xlsx_row": (parse_chat_xlsx_row, len(xlsx_rows)),
+        "load_chati_xlsx": (load_chati_xlsx, 1),
+        "callback_pack": (callback_pack, 100),
+        "callback_unpack": (callback_unpack, len(packed)),
+        "callback_resolve": (callback_resolve, len(clicks)),
+    }
+
+
+# ─────────────────────────── замер ───────────────────────────
+def measure(fn, ops: int, repeat: int, min_time: float) -> float:
+    """Лучшее из `repeat` время одной операции, нс."""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number / ops * 1e9
+
+
+def run(only=None, repeat: int = 5, min_time: float = 0.2) -> dict:
+    fx = load_fixtures()
+    results = {}
+    for name, (fn, ops) in cases(fx).items():
+        if only and name not in only:
+            continue
+        results[name] = round(measure(fn, ops, repeat, min_time), 1)
+    return results
+
+
+def _fmt(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} мс"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} мкс"
+    return f"{ns:.0f} нс"
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Микробенчмарки горячих функций")
+    ap.add_argument("--save", action="store_true", help="записать результат как baseline")
+    ap.add_argument("--compare", action="store_true", help="сравнить с baseline")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--threshold", type=float, default=20.0, help="допустимое замедление, %%")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--only", nargs="*", help="только эти бенчмарки")
+    args = ap.parse_args(argv)
+
+    results = run(args.only, args.repeat)
+
+    baseline = {}
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    slower = []
+    print(f"{'бенчмарк':<22}{'на операцию':>14}{'baseline':>14}{'Δ':>9}")
+    for name, ns in results.items():
+        line = f"{name:<22}{_fmt(ns):>14}"
+        if name in baseline:
+            delta = (ns - baseline[name]) / baseline[name] * 100
+            line += f"{_fmt(baseline[name]):>14}{delta:>+8.1f}%"
+            if delta > args.threshold:
+                slower.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "saved_at": datetime.utcnow().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": f"{platform.system()} {platform.machine()} {platform.processor()}".strip(),
+                "unit": "ns/op",
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\nBaseline записан: {args.baseline}")
+
+    if slower:
+        print(f"\nМедленнее baseline больше чем на {args.threshold:.0f}%: {', '.join(slower)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
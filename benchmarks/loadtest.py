@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный прогон: настоящий Dispatcher из bot.py против фейкового Bot API
+(aiohttp на localhost) и локального Postgres.
+
+Виртуальные пользователи параллельно проходят сценарии — поиск, подача объявления
+(Формат №1), покупка размещения на бирже (Формат №2), спам в группе — а админ
+делает рассылку. Кнопки берутся из клавиатур, которые бот реально прислал
+в фейковый API, так что сценарий идёт по тем же callback_data, что и у живых людей.
+
+ВНИМАНИЕ: база очищается (TRUNCATE всех таблиц) и заполняется тестовыми данными.
+Без --allow-any-db имя базы обязано содержать «bench».
+
+    DB_NAME=adix_bench python benchmarks/loadtest.py --users 50 --iterations 5
+    DB_NAME=adix_bench python benchmarks/loadtest.py --journeys search,format2 --api-latency-ms 30 --max-p95-ms 150
+
+Отчёт: апдейтов/с и по каждому сценарию p50/p95/p99 обработки апдейта, запросы к БД
+и вызовы Bot API на один проход. С --max-p95-ms код выхода 1 при превышении порога.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+JOURNEYS = ("search", "submit", "format2", "group_spam", "broadcast")
+
+# id тестовых пользователей и чатов — вне диапазона настоящих
+USER_ID_BASE = 7_000_000_000
+STRANGER_ID_BASE = 8_000_000_000
+GROUP_CHAT_BASE = -1_009_000_000_000
+
+
+class JourneyError(Exception):
+    pass
+
+
+# ─────────────────────────── фейковый Bot API ───────────────────────────
+class FakeBotApi:
+    """
+    Отвечает на POST /bot<token>/<method> правдоподобными объектами Telegram
+    и запоминает последнюю inline-клавиатуру в каждом чате.
+    """
+
+    _MESSAGE_METHODS = {
+        "sendmessage", "sendphoto", "sendvideo", "senddocument", "sendanimation", "sendsticker",
+        "forwardmessage", "editmessagetext", "editmessagecaption", "editmessagereplymarkup",
+    }
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.calls = Counter()
+        self.keyboards: Dict[int, List[str]] = {}
+        self._message_ids = itertools.count(1000)
+
+    def _message(self, chat_id: int, text: str = "") -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "text": text,
+        }
+
+    def _remember_keyboard(self, chat_id: int, raw_markup: Optional[str]):
+        if not raw_markup:
+            return
+        markup = json.loads(raw_markup)
+        if "inline_keyboard" in markup:
+            self.keyboards[chat_id] = [
+                btn["callback_data"] for row in markup["inline_keyboard"] for btn in row if "callback_data" in btn
+            ]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        try:
+            chat_id = int(form.get("chat_id", 0))
+        except ValueError:
+            chat_id = 0
+        self._remember_keyboard(chat_id, form.get("reply_markup"))
+
+        if method in self._MESSAGE_METHODS:
+            result = self._message(chat_id, form.get("text", ""))
+        elif method == "sendmediagroup":
+            result = [self._message(chat_id) for _ in json.loads(form["media"])]
+        elif method == "copymessage":
+            result = {"message_id": next(self._message_ids)}
+        elif method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "ADIX bench", "username": "adix_bench_bot"}
+        elif method == "getchat":
+            result = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+        elif method == "getchatmember":
+            result = {"status": "member", "user": {"id": int(form.get("user_id", 0)), "is_bot": False, "first_name": "u"}}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+
+# ─────────────────────────── данные ───────────────────────────
+def seed(args):
+    """Чистит базу и заливает пользователей, объявления и чаты биржи."""
+    from sqlalchemy import insert, text
+
+    import catalog
+    import counters
+    from config import ADMIN_IDS
+    from database import engine, upgrade_db, Base, User, Ad, ChatGroup
+
+    upgrade_db()
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    tables = ", ".join(t.name for t in Base.metadata.sorted_tables)
+    cities = [c for r in catalog.REGIONS for c in r.cities]
+
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {tables} RESTART IDENTITY CASCADE"))
+
+        user_ids = [USER_ID_BASE + i for i in range(max(args.users, args.audience))]
+        conn.execute(insert(User.__table__), [
+            {"id": uid, "username": f"bench{uid - USER_ID_BASE}", "balance": 1_000_000, "last_active": now}
+            for uid in user_ids + [ADMIN_IDS[0]]
+        ])
+
+        ads = []
+        for i in range(args.ads):
+            cat = rng.choice(catalog.CATEGORIES)
+            sub = rng.choice(cat.subcategories) if cat.subcategories else None
+            ads.append({
+                "user_id": rng.choice(user_ids),
+                "inline_button_text": f"Товар {i}",
+                "text": f"Тестовое объявление #{i}",
+                "price": rng.randint(100, 100_000),
+                "quantity": 1,
+                "category": cat.name,
+                "subcategory": sub.name if sub else None,
+                "city": rng.choice(cities).full_name,
+                "photos": "",
+                "status": "approved",
+                "is_active": True,
+                "created_at": now - timedelta(minutes=i),
+                "expires_at": now + timedelta(days=30),
+            })
+        for chunk in range(0, len(ads), 1000):
+            conn.execute(insert(Ad.__table__), ads[chunk:chunk + 1000])
+
+        conn.execute(insert(ChatGroup.__table__), [
+            {
+                "chat_id": GROUP_CHAT_BASE - i, "title": f"Бенч-чат {i:02d}", "region": region,
+                "price_1": 300, "price_5": 1200, "price_10": 2000, "price_pin": 500,
+                "participants": 1000, "is_active": True,
+            }
+            for i, region in enumerate(["moscow"] * args.chats + ["mo"] * 3 + ["rf"] * 3)
+        ])
+
+    counters.rebuild()
+
+
+# ─────────────────────────── прогон ───────────────────────────
+class _Sample:
+    __slots__ = ("queries", "api_calls")
+
+    def __init__(self):
+        self.queries = 0
+        self.api_calls = 0
+
+
+_sample: ContextVar[Optional[_Sample]] = ContextVar("loadtest_sample", default=None)
+
+
+class JourneyStats:
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.latencies: List[float] = []
+        self.queries = 0
+        self.api_calls = 0
+        self.last_error = ""
+
+    @staticmethod
+    def _pct(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> dict:
+        runs = max(self.runs, 1)
+        return {
+            "runs": self.runs,
+            "errors": self.errors,
+            "updates": len(self.latencies),
+            "p50_ms": round(self._pct(self.latencies, 0.50) * 1000, 2),
+            "p95_ms": round(self._pct(self.latencies, 0.95) * 1000, 2),
+            "p99_ms": round(self._pct(self.latencies, 0.99) * 1000, 2),
+            "queries_per_run": round(self.queries / runs, 1),
+            "api_calls_per_run": round(self.api_calls / runs, 1),
+        }
+
+
+class LoadRun:
+    def __init__(self, bot_module, api: FakeBotApi):
+        self.bot_module = bot_module
+        self.bot = bot_module.bot
+        self.dp = bot_module.dp
+        self.api = api
+        self.stats: Dict[str, JourneyStats] = defaultdict(JourneyStats)
+        self._update_ids = itertools.count(1)
+        self._install_counters()
+
+    def _install_counters(self):
+        from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+        from sqlalchemy import event
+        from database import engine
+
+        def count_query(*_):
+            sample = _sample.get()
+            if sample is not None:
+                sample.queries += 1
+
+        class CountApiCalls(BaseRequestMiddleware):
+            async def __call__(self, make_request, bot, method):
+                sample = _sample.get()
+                if sample is not None:
+                    sample.api_calls += 1
+                return await make_request(bot, method)
+
+        event.listen(engine, "after_cursor_execute", count_query)
+        self.bot.session.middleware(CountApiCalls())
+
+    async def feed(self, journey: str, payload: dict):
+        from aiogram import types
+
+        payload["update_id"] = next(self._update_ids)
+        update = types.Update.model_validate(payload, context={"bot": self.bot})
+        sample = _Sample()
+        token = _sample.set(sample)
+        start = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        finally:
+            _sample.reset(token)
+            st = self.stats[journey]
+            st.latencies.append(time.perf_counter() - start)
+            st.queries += sample.queries
+            st.api_calls += sample.api_calls
+
+
+class VirtualUser:
+    def __init__(self, run: LoadRun, user_id: int, rng: random.Random):
+        self.run = run
+        self.id = user_id
+        self.rng = rng
+        self.journey = ""
+        self._message_ids = itertools.count(1)
+
+    def _from(self, user_id: Optional[int] = None) -> dict:
+        uid = user_id or self.id
+        return {"id": uid, "is_bot": False, "first_name": "Bench", "username": f"u{uid}"}
+
+    def _message(self, chat_id: int, text: str, user_id: Optional[int] = None) -> dict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": self._from(user_id),
+            "text": text,
+        }
+
+    async def text(self, text: str):
+        await self.run.feed(self.journey, {"message": self._message(self.id, text)})
+
+    async def group_text(self, chat_id: int, text: str, user_id: Optional[int] = None):
+        await self.run.feed(self.journey, {"message": self._message(chat_id, text, user_id)})
+
+    async def press(self, data: str):
+        await self.run.feed(self.journey, {"callback_query": {
+            "id": str(next(self._message_ids)),
+            "from": self._from(),
+            "chat_instance": str(self.id),
+            "data": data,
+            "message": self._message(self.id, ""),
+        }})
+
+    def buttons(self) -> List[str]:
+        return self.run.api.keyboards.get(self.id, [])
+
+    def pick(self, *prefixes: str, exclude=(), fallback: Optional[str] = None) -> str:
+        """Случайная кнопка последней клавиатуры с одним из префиксов."""
+        found = [b for b in self.buttons() if b.startswith(prefixes) and b not in exclude]
+        if found:
+            return self.rng.choice(found)
+        if fallback is not None:
+            return fallback
+        raise JourneyError(f"нет кнопки {prefixes} среди {self.buttons()[:6]}")
+
+
+# ─────────────────────────── сценарии ───────────────────────────
+async def journey_search(u: VirtualUser):
+    import callbacks
+
+    await u.text("🔍Поиск объявлений")
+    region = u.pick(callbacks.SEARCH_REGION.prefix, fallback="srch_city_skip")
+    await u.press(region)
+    if region != "srch_city_skip":
+        await u.press(u.pick(callbacks.SEARCH_CITY.prefix, "srch_wide_region"))
+    await u.press(u.pick(callbacks.SEARCH_CATEGORY.prefix, "srch_cat_all"))
+    if "srch_subcat_skip" in u.buttons():
+        await u.press(u.pick(callbacks.SEARCH_SUBCATEGORY.prefix, "srch_subcat_skip"))
+    opened = u.pick(callbacks.SEARCH_OPEN_AD.prefix, fallback="")
+    if opened:
+        await u.press(opened)
+
+
+async def journey_submit(u: VirtualUser):
+    import catalog
+
+    # эти категории бот отправляет к администратору — сценарий до конца не дойдёт
+    restricted = {f"select_category_{catalog.CATEGORY_BY_NAME[n].code}"
+                  for n in ("🏠 Недвижимость", "🚗 Авто и Мото") if n in catalog.CATEGORY_BY_NAME}
+
+    await u.text("➕Разместить объявление")
+    await u.press("create_ad_start")
+    await u.text("Стул")
+    await u.text("Стул деревянный, б/у, самовывоз")
+    await u.press("photo_skip")
+    await u.press(u.pick("pick_region_"))
+    await u.press(u.pick("pick_city_"))
+    await u.press(u.pick("select_category_", exclude=restricted))
+    if "skip_subcategory" in u.buttons():
+        await u.press(u.pick("subcat_", "skip_subcategory"))
+    await u.text(str(u.rng.randint(100, 50_000)))
+    await u.text("1")
+
+
+async def journey_format2(u: VirtualUser):
+    await u.text("➕Разместить объявление")
+    await u.press("adix_market_start")
+    await u.text("Ремонт окон")
+    await u.text("Ремонт пластиковых окон, выезд в день обращения")
+    await u.press("format2_photos_done")
+    await u.text("Иванов Иван Иванович")
+    await u.text("123456789012")
+    await u.press("f2_region_moscow")
+    await u.press(u.pick("f2toggle_"))
+    await u.press("f2finish_chats")
+    await u.press(u.pick("f2cnt_"))
+    await u.press("f2pay_all")
+
+
+async def journey_group_spam(u: VirtualUser):
+    # незарегистрированные «спамеры» (их сообщения бот удаляет) и сам пользователь
+    group = GROUP_CHAT_BASE - u.rng.randrange(3)
+    for i in range(3):
+        stranger = STRANGER_ID_BASE + (u.id - USER_ID_BASE) * 10 + i
+        await u.group_text(group, "Продам гараж, пишите в ЛС", user_id=stranger)
+    await u.group_text(group, "Здравствуйте, актуально?")
+    await u.group_text(group, "Спасибо!")
+
+
+async def journey_broadcast(u: VirtualUser):
+    await u.text("Рассылка")
+    await u.text("Бенч-рассылка: проверка нагрузки")
+
+
+JOURNEY_FUNCS = {
+    "search": journey_search,
+    "submit": journey_submit,
+    "format2": journey_format2,
+    "group_spam": journey_group_spam,
+    "broadcast": journey_broadcast,
+}
+
+
+async def run_user(run: LoadRun, u: VirtualUser, journeys: List[str], iterations: int):
+    await u.text("/start")
+    for _ in range(iterations):
+        for name in journeys:
+            u.journey = name
+            stats = run.stats[name]
+            stats.runs += 1
+            try:
+                await JOURNEY_FUNCS[name](u)
+            except Exception as e:
+                stats.errors += 1
+                stats.last_error = f"{type(e).__name__}: {e}"
+                # сбрасываем незаконченный диалог, чтобы следующий сценарий начинался с чистого листа
+                try:
+                    await u.press("cancel_ad_creation")
+                except Exception:
+                    pass
+
+
+def print_report(result: dict):
+    print(f"\nАпдейтов: {result['updates']} за {result['seconds']:.1f} с → {result['updates_per_sec']:.0f} апд/с")
+    print(f"Вызовов Bot API: {result['api_calls']}")
+    head = f"{'сценарий':<12}{'проходы':>8}{'ошибки':>8}{'апдейты':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'SQL/проход':>12}{'API/проход':>12}"
+    print(head)
+    print("-" * len(head))
+    for name, s in result["journeys"].items():
+        print(f"{name:<12}{s['runs']:>8}{s['errors']:>8}{s['updates']:>9}"
+              f"{s['p50_ms']:>8.1f}{s['p95_ms']:>8.1f}{s['p99_ms']:>8.1f}"
+              f"{s['queries_per_run']:>12.1f}{s['api_calls_per_run']:>12.1f}")
+        if s.get("last_error"):
+            print(f"    последняя ошибка: {s['last_error'][:200]}")
+    print("(задержки — мс на один апдейт)")
+
+
+async def main_async(args) -> int:
+    api = FakeBotApi(args.api_latency_ms)
+    base_url = await api.start()
+
+    # bot.py читает настройки при импорте: подменяем токен и адрес API заранее
+    os.environ["TELEGRAM_API_URL"] = base_url
+    os.environ["BOT_TOKEN"] = "123456:BENCH"
+    from config import DB_NAME, ADMIN_IDS
+    if "bench" not in DB_NAME and not args.allow_any_db:
+        print(f"База «{DB_NAME}» не похожа на тестовую (нет «bench» в имени). "
+              "Прогон стирает данные — задайте DB_NAME=..._bench или --allow-any-db.")
+        return 2
+
+    seed(args)
+    import bot as bot_module
+    bot_module.create_app()
+
+    run = LoadRun(bot_module, api)
+    journeys = [j for j in args.journeys.split(",") if j != "broadcast"]
+    users = [VirtualUser(run, USER_ID_BASE + i, random.Random(args.seed + i)) for i in range(args.users)]
+    tasks = [run_user(run, u, journeys, args.iterations) for u in users]
+    if "broadcast" in args.journeys.split(","):
+        admin = VirtualUser(run, ADMIN_IDS[0], random.Random(args.seed))
+        tasks.append(run_user(run, admin, ["broadcast"], args.broadcasts))
+
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    seconds = time.perf_counter() - started
+
+    # таймеры удаления предупреждений в группах живут по 2 минуты — гасим их
+    for thread in threading.enumerate():
+        if isinstance(thread, threading.Timer):
+            thread.cancel()
+    await run.bot.session.close()
+
+    journeys_summary = {}
+    for name in args.journeys.split(","):
+        s = run.stats[name].summary()
+        s["last_error"] = run.stats[name].last_error
+        journeys_summary[name] = s
+    updates = sum(s["updates"] for s in journeys_summary.values())
+    result = {
+        "params": vars(args),
+        "updates": updates,
+        "seconds": seconds,
+        "updates_per_sec": updates / seconds if seconds else 0.0,
+        "api_calls": sum(api.calls.values()),
+        "journeys": journeys_summary,
+    }
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.max_p95_ms:
+        slow = [n for n, s in journeys_summary.items() if s["p95_ms"] > args.max_p95_ms]
+        if slow:
+            print(f"\nПревышен порог p95 {args.max_p95_ms} мс: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Нагрузочный прогон бота против фейкового Bot API")
+    ap.add_argument("--users", type=int, default=20, help="параллельных пользователей")
+    ap.add_argument("--iterations", type=int, default=3, help="проходов набора сценариев на пользователя")
+    ap.add_argument("--journeys", default=",".join(JOURNEYS), help=f"через запятую из: {', '.join(JOURNEYS)}")
+    ap.add_argument("--broadcasts", type=int, default=1, help="рассылок от админа")
+    ap.add_argument("--audience", type=int, default=500, help="пользователей в базе (получатели рассылки)")
+    ap.add_argument("--ads", type=int, default=5000, help="одобренных объявлений в базе")
+    ap.add_argument("--chats", type=int, default=30, help="чатов биржи в регионе «Москва»")
+    ap.add_argument("--api-latency-ms", type=float, default=0.0, help="искусственная задержка фейкового API")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", help="сохранить результат в файл")
+    ap.add_argument("--max-p95-ms", type=float, default=0.0, help="порог p95 для кода выхода 1")
+    ap.add_argument("--allow-any-db", action="store_true", help="разрешить базу без «bench» в имени")
+    args = ap.parse_args(argv)
+    unknown = set(args.journeys.split(",")) - set(JOURNEYS)
+    if unknown:
+        ap.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main_async(parse_args())))
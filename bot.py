@@ -1,34 +1,83 @@
 #!/usr/bin/env python3
+"""
+Точка входа. Импорт модуля только создаёт Bot/Dispatcher — без обращений к БД
+и без фоновых задач. Хендлеры подключает create_app(), а проверка схемы, счётчики
+и фоновые задачи поднимаются в on_startup, когда polling уже запускается.
+Перед первым запуском и после обновлений: «alembic upgrade head».
+"""
+import time
+
+_IMPORT_STARTED = time.perf_counter()
 
 import asyncio
+import contextlib
 import dataclasses
 import threading
-import time
 from datetime import datetime, timedelta, timezone
-from typing import Dict
+from typing import Dict, List
 
-from aiogram import Bot, Dispatcher, types, F
+from aiogram import Bot, Dispatcher, Router, types, F
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart
 
-# Импорт обработчиков добавления объявлений (Формат №1 и Формат №2)
-import add_ads
-# Импорт обработчиков профиля/личного кабинета (с указанием карты при пополнении)
-import profile
-# Импорт обработчиков поиска (включает «Пожаловаться» / «Оставить отзыв»)
-import search
-# Импорт модуля обратной связи
-import support
-# Импорт админ-хендлеров (рассылка, бан, модерация и т.д.)
-from admin import register_admin_handlers
-from config import BOT_TOKEN
-from database import init_db, SessionLocal, User, Ad, ScheduledPost, Sale
+import antiflood
+import callbacks
+# Фоновое обслуживание (срок жизни объявлений)
+import maintenance
+# Отложенная запись users.last_active
+import activity
+# Счётчики объявлений для меню поиска
+import counters
+# Латентность хендлеров: БД / Bot API / ошибки
+import metrics
+# Профилирование SQL (SQL_PROFILE=1)
+import sqlprofiler
+# Регистрация пользователей (upsert + кэш)
+import users
+# Проверка чеков пополнения на повторы (пул процессов для dHash)
+import receipts
+# Сохранённые поиски и уведомления о новых объявлениях
+import saved_searches
+from config import ADMIN_IDS, BOT_TOKEN, DB_SCHEMA_CHECK, METRICS_HOST, METRICS_PORT, TELEGRAM_API_URL
+from database import check_schema, SessionLocal, User, Ad, ScheduledPost, Sale
 # Импорт функций-утилит (главное меню, post_ad_to_chat, reserve_funds_for_sale и т.п.)
 from utils import main_menu_keyboard, post_ad_to_chat
 
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties())
+
+class StartupTimer:
+    """Сколько занял каждый этап запуска — печатается одной строкой в on_startup."""
+
+    def __init__(self):
+        self.steps: List[tuple] = []
+
+    @contextlib.contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def report(self) -> str:
+        total = time.perf_counter() - _IMPORT_STARTED
+        parts = ", ".join(f"{name} {sec * 1000:.0f} мс" for name, sec in self.steps)
+        return f"Запуск за {total * 1000:.0f} мс: {parts}"
+
+
+startup_timer = StartupTimer()
+startup_timer.steps.append(("импорт", time.perf_counter() - _IMPORT_STARTED))
+
+api_session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=api_session, default=DefaultBotProperties())
 dp = Dispatcher()
-init_db()
+cb = callbacks.get_router(dp)
+# /start и охрана групп — подключаются последними, после хендлеров модулей (см. create_app)
+core_router = Router(name="core")
+
+# Фоновые задачи, запущенные в on_startup (гасим в on_shutdown)
+background_tasks: List[asyncio.Task] = []
 
 @dataclasses.dataclass
 class WarnMessage:
@@ -43,70 +92,167 @@ user_steps = {}
 #  warn_messages[user_id] = (chat_id, warn_message_id, timer_object)
 warn_messages: Dict[int, WarnMessage] = {}
 
-# Регистрируем все хендлеры из соответствующих модулей
-register_admin_handlers(bot, dp)
-search.register_search_handlers(bot, dp, user_steps)
-add_ads.register_add_ads_handlers(bot, dp, user_steps)
-profile.register_profile_handlers(bot, dp, user_steps)
-support.register_support_handlers(bot, dp)
+# Администраторы групп: chat_id → (момент загрузки, id админов).
+# Список берём из Bot API раз в GROUP_ADMINS_TTL_SEC, а не на каждое сообщение
+GROUP_ADMINS_TTL_SEC = 300
+_group_admins: Dict[int, tuple] = {}
+
+_app_ready = False
 
-def get_or_create_user(chat_id, username=None):
+def create_app():
     """
-    Проверяем наличие пользователя в БД (по chat_id).
-    Если нет — создаём; если есть — при необходимости обновляем username.
+    Собирает приложение: мидлвари, хендлеры всех модулей, хуки запуска/остановки.
+    Модули хендлеров импортируются здесь, а не при импорте bot.py. Повторный вызов ничего не делает.
     """
+    global _app_ready
+    if _app_ready:
+        return bot, dp
+
+    with startup_timer.step("модули"):
+        # Импорт обработчиков добавления объявлений (Формат №1 и Формат №2)
+        import add_ads
+        # Импорт обработчиков профиля/личного кабинета (с указанием карты при пополнении)
+        import profile
+        # Импорт обработчиков поиска (включает «Пожаловаться» / «Оставить отзыв»)
+        import search
+        # Импорт модуля обратной связи
+        import support
+        # Импорт админ-хендлеров (рассылка, бан, модерация и т.д.)
+        from admin import register_admin_handlers
+        # Очередь модерации объявлений
+        import moderation
+        # Очередь пополнений и выводов
+        import finance
+        # Отзывы о продавце
+        import reputation
+
+    with startup_timer.step("хендлеры"):
+        metrics.install(dp, bot)
+        sqlprofiler.install(dp)
+        activity.install(dp)
+
+        # Регистрируем все хендлеры из соответствующих модулей
+        register_admin_handlers(bot, dp)
+        moderation.register_moderation_handlers(bot, dp)
+        finance.register_finance_handlers(bot, dp)
+        reputation.register_reputation_handlers(bot, dp)
+        saved_searches.register_saved_search_handlers(bot, dp)
+        search.register_search_handlers(bot, dp, user_steps)
+        add_ads.register_add_ads_handlers(bot, dp, user_steps)
+        profile.register_profile_handlers(bot, dp, user_steps)
+        support.register_support_handlers(bot, dp)
+        dp.include_router(core_router)
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    _app_ready = True
+    return bot, dp
+
+async def on_startup():
+    # схему меняют только миграции («alembic upgrade head»), здесь лишь сверяем ревизию
+    with startup_timer.step("схема БД"):
+        check_schema(DB_SCHEMA_CHECK)
+
+    # Пересчитываем счётчики меню поиска: дальше они ведутся инкрементально (counters.py)
+    with startup_timer.step("счётчики"):
+        try:
+            counters.rebuild()
+        except Exception as e:
+            print(f"Ошибка при пересчёте счётчиков объявлений: {e}")
+
+    # Пороги антифлуда отдельных чатов — в память, дальше проверка идёт без БД
+    with startup_timer.step("антифлуд"):
+        try:
+            antiflood.load_rules()
+        except Exception as e:
+            print(f"Ошибка при загрузке порогов антифлуда: {e}")
+
+    # Публикация запланированных объявлений и обслуживание (срок жизни объявлений)
+    background_tasks.append(asyncio.create_task(scheduled_post_loop()))
+    background_tasks.append(asyncio.create_task(maintenance.maintenance_loop(bot)))
+    background_tasks.append(asyncio.create_task(activity.flush_loop()))
+    # уведомления по сохранённым поискам (saved_searches.py)
+    background_tasks.append(asyncio.create_task(saved_searches.alert_loop(bot)))
+    # проверка чеков пополнения на повторы (receipts.py)
+    background_tasks.append(asyncio.create_task(receipts.worker_loop(bot)))
+
+    if METRICS_PORT:
+        with startup_timer.step("/metrics"):
+            await metrics.start_http_server(METRICS_HOST, METRICS_PORT)
+
+    print(startup_timer.report())
+
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    receipts.shutdown()
+    # последняя активность, накопленная с прошлой записи
+    try:
+        await activity.buffer.flush_async()
+    except Exception as e:
+        print("Ошибка при записи активности пользователей:", e)
+
+def _due_posts(now):
+    """Подошедшие публикации: [(id задачи, чат, объявление, автор)], объекты отсоединены от сессии."""
     with SessionLocal() as session:
-        user = session.query(User).filter_by(id=chat_id).first()
-        if not user:
-            user = User(id=chat_id, username=username)
-            session.add(user)
-            session.commit()
-        else:
-            if username and user.username != username:
-                user.username = username
-                session.commit()
-        return user
+        due = []
+        for task in session.query(ScheduledPost).filter(ScheduledPost.next_post_time <= now).all():
+            ad_obj = session.query(Ad).filter_by(id=task.ad_id).first()
+            user_obj = session.query(User).filter_by(id=ad_obj.user_id).first() if ad_obj else None
+            due.append((task.id, task.chat_id, ad_obj, user_obj))
+        session.expunge_all()
+    return due
+
+
+def _advance_posts(now, live: dict):
+    """Сдвигает задачи после публикации; live: id задачи → объявление ещё активно."""
+    with SessionLocal() as session:
+        for task in session.query(ScheduledPost).filter(ScheduledPost.id.in_(list(live))).all():
+            if not live[task.id]:
+                # объявление удалено или снято по сроку — дальше не публикуем
+                session.delete(task)
+                continue
+            task.posts_left -= 1
+            if task.posts_left > 0:
+                task.next_post_time = now + timedelta(minutes=task.interval_minutes)
+            else:
+                session.delete(task)
+        session.commit()
+
 
 async def scheduled_post_worker():
+    # БД — в потоке (asyncio.to_thread), в цикле событий — только отправка в чаты
     try:
-        with SessionLocal() as session:
-            now = datetime.now(timezone.utc)
-            tasks = session.query(ScheduledPost).filter(ScheduledPost.next_post_time <= now).all()
-            for task in tasks:
-                ad_obj = session.query(Ad).filter_by(id=task.ad_id).first()
-                if ad_obj and ad_obj.status == "approved":
-                    user_obj = session.query(User).filter_by(id=ad_obj.user_id).first()
-                    await post_ad_to_chat(bot, task.chat_id, ad_obj, user_obj)
-
-                task.posts_left -= 1
-                if task.posts_left > 0:
-                    task.next_post_time = now + timedelta(minutes=task.interval_minutes)
-                else:
-                    session.delete(task)
-            session.commit()
+        now = datetime.now(timezone.utc)
+        live = {}
+        for task_id, chat_id, ad_obj, user_obj in await asyncio.to_thread(_due_posts, now):
+            live[task_id] = bool(ad_obj and ad_obj.is_active)
+            if live[task_id] and ad_obj.status == "approved":
+                await post_ad_to_chat(bot, chat_id, ad_obj, user_obj)
+        if live:
+            await asyncio.to_thread(_advance_posts, now, live)
     except Exception as e:
         print("Ошибка в scheduled_post_worker:", e)
 
-def scheduled_post_worker_sync():
+async def scheduled_post_loop():
     """
-    Пример фонового потока для обработки таблицы ScheduledPost.
+    Фоновая задача для обработки таблицы ScheduledPost.
     Раз в минуту проверяем, не пора ли опубликовать что-то в чате/канале.
     """
     while True:
-        asyncio.run(scheduled_post_worker())
-        time.sleep(60)
-
-# Запускаем поток, который публикует запланированные объявления
-bg_thread = threading.Thread(target=scheduled_post_worker_sync, daemon=True)
-bg_thread.start()
+        await scheduled_post_worker()
+        await asyncio.sleep(60)
 
-@dp.message(CommandStart())
+@core_router.message(CommandStart())
 async def start_handler(message: types.Message):
     """
     Регистрируем (или обновляем) пользователя и выводим приветствие
     + ссылки на оба соглашения.
     """
-    get_or_create_user(message.chat.id, message.from_user.username)
+    # один upsert, а для уже известного пользователя с тем же username — ни одного запроса
+    users.ensure_user(message.chat.id, message.from_user.username)
 
     greeting = (
         "🎉 Приветствую вас в Adix! 🌟\n\n"
@@ -142,18 +288,36 @@ async def start_handler(message: types.Message):
         reply_markup=kb
     )
 
+async def _is_group_admin(chat_id: int, user_id: int) -> bool:
+    cached = _group_admins.get(chat_id)
+    if cached is None or time.monotonic() - cached[0] > GROUP_ADMINS_TTL_SEC:
+        try:
+            admin_ids = {m.user.id for m in await bot.get_chat_administrators(chat_id)}
+        except Exception:
+            # нет права смотреть или другая ошибка — считаем всех обычными юзерами
+            admin_ids = set()
+        cached = _group_admins[chat_id] = (time.monotonic(), admin_ids)
+    return user_id in cached[1]
+
 # ------------------- Удаляем сообщения из групп/супергрупп, если нет /start (пункты 1 и 2) -------------------
-@dp.message(F.chat.type.in_({ "group", "supergroup"}), F.content_type.in_({ "text", "photo", "sticker", "video", "document", "voice", "animation" }))
+@core_router.message(F.chat.type.in_({ "group", "supergroup"}), F.content_type.in_({ "text", "photo", "sticker", "video", "document", "voice", "animation" }))
 async def guard_group_messages(message: types.Message):
     """
     Если пользователь не зарегистрирован в боте (не делал /start), то удаляем его сообщение.
     Затем посылаем предупреждение со ссылкой на бота.
     Предыдущие предупреждения пользователя удаляем и ставим новое (удаляем его через 2 мин).
+    Сообщения зарегистрированных проходят через антифлуд (antiflood.py) — без запросов к БД.
+    Сообщения от имени канала или анонимного админа (sender_chat) и админов группы не трогаем.
     """
-    with SessionLocal() as session:
-        user_db = session.query(User).filter_by(id=message.from_user.id).first()
+    # --- сообщение от имени канала / анонимного админа: from_user там — служебный бот
+    if message.sender_chat is not None or message.from_user is None:
+        return
+
+    if not users.is_registered(message.from_user.id):
+        # --- администраторы / создатель группы могут писать и без /start
+        if await _is_group_admin(message.chat.id, message.from_user.id):
+            return
 
-    if not user_db:
         # 1) Удаляем сообщение пользователя
         try:
             await bot.delete_message(message.chat.id, message.message_id)
@@ -162,7 +326,8 @@ async def guard_group_messages(message: types.Message):
 
         # 2) Если у нас уже есть предупреждение для этого user_id – удаляем его, отменяем таймер
         if message.from_user.id in warn_messages:
-            old_chat_id, old_msg_id, old_timer = warn_messages[message.from_user.id]
+            old = warn_messages[message.from_user.id]
+            old_chat_id, old_msg_id, old_timer = old.chat_id, old.message_id, old.timer
             # Удаляем старое предупреждение
             try:
                 await bot.delete_message(old_chat_id, old_msg_id)
@@ -174,7 +339,7 @@ async def guard_group_messages(message: types.Message):
 
         # 3) Отправляем новое предупреждение
         # Кнопка «↩️ Перейти в бота»
-        bot_username = (await bot.get_me()).username
+        bot_username = (await bot.me()).username
         inline_kb = types.InlineKeyboardMarkup(inline_keyboard=[[
             types.InlineKeyboardButton(
                 text="↩️ Перейти в бота / Принять соглашение",
@@ -212,25 +377,23 @@ async def guard_group_messages(message: types.Message):
         # 5) Запоминаем, чтобы при повторной попытке удалить и заменить
         warn_messages[message.from_user.id] = WarnMessage(message.chat.id, warn_msg.message_id, t)
 
-    else:
-        # Пользователь зарегистрирован, разрешаем писать
-        pass
+    elif message.from_user.id not in ADMIN_IDS:
+        # Пользователь зарегистрирован — писать можно, но в пределах порогов антифлуда
+        action = antiflood.check(message.chat.id, message.from_user.id, antiflood.content_hash(message),
+                                 media_group_id=message.media_group_id)
+        if action:
+            await antiflood.enforce(bot, message, action)
 
 # ========================= Сделки (покупка/продажа) =========================
 
-@dp.callback_query(lambda call: call.data.startswith("buy_ad_"))
-async def handle_buy_ad(call: types.CallbackQuery):
+@cb.route(callbacks.BUY_AD)
+async def handle_buy_ad(call: types.CallbackQuery, args: tuple):
     """
     Пользователь нажал «Купить».
     1) Если нажатие было в группе/канале — просим перейти в ЛС бота.
     2) Если ЛС — уточняем «Вы действительно хотите купить?».
     """
-    ad_id_str = call.data.replace("buy_ad_", "")
-    try:
-        ad_id = int(ad_id_str)
-    except:
-        await bot.answer_callback_query(call.id, "Некорректный ID объявления.", show_alert=True)
-        return None
+    ad_id, = args
 
     # Если нажали в группе, просим перейти в ЛС
     if call.message.chat.type != "private":
@@ -242,8 +405,8 @@ async def handle_buy_ad(call: types.CallbackQuery):
 
     # Если это ЛС, уточняем
     kb = types.InlineKeyboardMarkup(inline_keyboard=[[
-        types.InlineKeyboardButton(text="Подтвердить покупку", callback_data=f"confirm_buy_ad_{ad_id}"),
-        types.InlineKeyboardButton(text="Отмена", callback_data=f"cancel_buy_ad_{ad_id}")
+        types.InlineKeyboardButton(text="Подтвердить покупку", callback_data=callbacks.CONFIRM_BUY.pack(ad_id)),
+        types.InlineKeyboardButton(text="Отмена", callback_data=callbacks.CANCEL_BUY.pack(ad_id))
     ]])
     await bot.answer_callback_query(call.id)
     return await bot.send_message(
@@ -253,22 +416,13 @@ async def handle_buy_ad(call: types.CallbackQuery):
     )
 
 
-@dp.callback_query(lambda call: call.data.startswith("confirm_buy_ad_") or call.data.startswith("cancel_buy_ad_"))
-async def handle_confirm_buy_ad(call: types.CallbackQuery):
+@cb.route(callbacks.CONFIRM_BUY, callbacks.CANCEL_BUY)
+async def handle_confirm_buy_ad(call: types.CallbackQuery, args: tuple):
     """
     Обрабатываем «Подтвердить покупку» / «Отменить покупку».
     """
-    if call.data.startswith("confirm_buy_ad_"):
-        ad_id_str = call.data.replace("confirm_buy_ad_", "")
-        action = "confirm"
-    else:
-        ad_id_str = call.data.replace("cancel_buy_ad_", "")
-        action = "cancel"
-
-    try:
-        ad_id = int(ad_id_str)
-    except:
-        return await bot.answer_callback_query(call.id, "Некорректный ID объявления.", show_alert=True)
+    ad_id, = args
+    action = "cancel" if call.data.startswith(("cancel_buy_ad_", callbacks.CANCEL_BUY.prefix)) else "confirm"
 
     with SessionLocal() as session:
         ad_obj = session.query(Ad).filter_by(id=ad_id).first()
@@ -293,8 +447,8 @@ async def handle_confirm_buy_ad(call: types.CallbackQuery):
         if result == "ok":
             # Сделка -> pending
             kb_buyer = types.InlineKeyboardMarkup(inline_keyboard=[[
-                types.InlineKeyboardButton(text="Принять сделку", callback_data=f"confirm_deal_{ad_obj.id}"),
-                types.InlineKeyboardButton(text="Отклонить сделку", callback_data=f"cancel_deal_{ad_obj.id}")
+                types.InlineKeyboardButton(text="Принять сделку", callback_data=callbacks.CONFIRM_DEAL.pack(ad_obj.id)),
+                types.InlineKeyboardButton(text="Отклонить сделку", callback_data=callbacks.CANCEL_DEAL.pack(ad_obj.id))
             ]])
             await bot.answer_callback_query(call.id, "Средства зарезервированы! Ожидается завершение сделки.")
             await bot.send_message(
@@ -316,23 +470,14 @@ async def handle_confirm_buy_ad(call: types.CallbackQuery):
             # Ошибка при резервировании
             return await bot.answer_callback_query(call.id, result, show_alert=True)
 
-@dp.callback_query(lambda call: call.data.startswith("confirm_deal_") or call.data.startswith("cancel_deal_"))
-async def handle_deal_confirmation(call: types.CallbackQuery):
+@cb.route(callbacks.CONFIRM_DEAL, callbacks.CANCEL_DEAL)
+async def handle_deal_confirmation(call: types.CallbackQuery, args: tuple):
     """
     «Принять сделку» -> деньги уходят продавцу
     «Отклонить сделку» -> деньги возвращаются покупателю
     """
-    if call.data.startswith("confirm_deal_"):
-        ad_id_str = call.data.replace("confirm_deal_", "")
-        action = "confirm"
-    else:
-        ad_id_str = call.data.replace("cancel_deal_", "")
-        action = "cancel"
-
-    try:
-        ad_id = int(ad_id_str)
-    except:
-        return await bot.answer_callback_query(call.id, "Некорректный ID сделки", show_alert=True)
+    ad_id, = args
+    action = "cancel" if call.data.startswith(("cancel_deal_", callbacks.CANCEL_DEAL.prefix)) else "confirm"
 
     with SessionLocal() as session:
         sale_obj = session.query(Sale).filter_by(ad_id=ad_id, buyer_id=call.from_user.id, status="pending").first()
@@ -385,16 +530,12 @@ async def handle_deal_confirmation(call: types.CallbackQuery):
                 f"Сделка #{sale_obj.id} отменена, {sale_obj.amount} руб. возвращены на ваш баланс."
             )
 
-@dp.callback_query(lambda call: call.data.startswith("details_ad_"))
-async def handle_details_ad(call: types.CallbackQuery):
+@cb.route(callbacks.DETAILS_AD)
+async def handle_details_ad(call: types.CallbackQuery, args: tuple):
     """
     Кнопка «Подробнее» по объявлению
     """
-    ad_id_str = call.data.replace("details_ad_", "")
-    try:
-        ad_id = int(ad_id_str)
-    except:
-        return await bot.answer_callback_query(call.id, "Некорректный ID объявления", show_alert=True)
+    ad_id, = args
 
     with SessionLocal() as session:
         ad_obj = session.query(Ad).filter_by(id=ad_id).first()
@@ -419,7 +560,7 @@ async def handle_details_ad(call: types.CallbackQuery):
             [
                 types.InlineKeyboardButton(
                     text=f"Купить «{ad_obj.inline_button_text}»" if ad_obj.inline_button_text else "Купить",
-                    callback_data=f"buy_ad_{ad_obj.id}"
+                    callback_data=callbacks.BUY_AD.pack(ad_obj.id)
                 )
             ],
             [
@@ -432,118 +573,8 @@ async def handle_details_ad(call: types.CallbackQuery):
     await bot.answer_callback_query(call.id)
     return await bot.send_message(call.message.chat.id, caption, reply_markup=kb)
 
-#------------------------------
-#DELETE MESSAGES
-#------------------------------
-@dp.message(F.chat.type.in_({ "group", "supergroup"}), F.content_type.in_({ "text", "photo", "sticker", "video", "document", "voice", "animation" }))
-async def guard_group_messages(message: types.Message):
-    """
-    • Пропускаем администраторов/создателя группы и сообщения от имени канала.
-    • Если пользователь ещё не нажимал /start – удаляем его сообщение
-      и показываем предупреждение с кнопкой «Перейти в бота» + ссылки
-      на оба соглашения.
-    Предыдущее предупреждение этого юзера удаляем, таймер гасим.
-    """
-    # --- сообщение от имени канала — пропускаем
-    if message.sender_chat is not None:
-        return
-
-    user = message.from_user
-    if not user:      # теоретически бывает в пересланных
-        return
-
-    user_id = user.id
-
-    # --- администраторы / создатель – им писать можно
-    try:
-        member = await bot.get_chat_member(message.chat.id, user_id)
-        if member.status in ("administrator", "creator"):
-            return
-    except Exception:
-        # нет права смотреть или другая ошибка — считаем обычным юзером
-        pass
-
-    # --- уже зарегистрирован? → можно писать
-    with SessionLocal() as session:
-        if session.query(User).filter_by(id=user_id).first():
-            return
-
-    # =========================== Блокировка сообщения =========================
-
-    # 1) удаляем исходное сообщение
-    try:
-        await bot.delete_message(message.chat.id, message.message_id)
-    except Exception:
-        pass
-
-    # 2) если висит старое предупреждение – убираем
-    old = warn_messages.pop(user_id, None)
-    if old:
-        old_chat_id, old_msg_id, old_timer = old
-        try:
-            await bot.delete_message(old_chat_id, old_msg_id)
-        except Exception:
-            pass
-        if old_timer.is_alive():
-            old_timer.cancel()
-
-    # 3) формируем новое предупреждение
-    bot_username = (await bot.get_me()).username
-    kb = types.InlineKeyboardMarkup(inline_keyboard=[
-        [
-            types.InlineKeyboardButton(
-                text="↩️ Перейти в бота / Принять соглашение",
-                url=f"https://t.me/{bot_username}?start=1"
-            )
-        ],
-        [
-            types.InlineKeyboardButton(
-                text="📄 Польз. соглашение ADIX",
-                url="https://telegra.ph/Polzovatelskoe-soglashenie-03-25-9"
-            )
-        ],
-        [
-            types.InlineKeyboardButton(
-                text="💬 Соглашение Чатов ADIX",
-                url="https://telegra.ph/Obshchie-polozheniya-03-25"
-            )
-        ]
-    ])
-    warn_text = (
-        "В этом чате нельзя писать, пока вы не примете пользовательское соглашение.\n"
-        "Нажав на кнопку «/start» в боте, вы автоматически соглашаетесь с условиями.\n\n"
-        "Перейдите в бота и нажмите /start."
-    )
-
-    warn_msg = await bot.send_message(
-        message.chat.id,
-        warn_text,
-        parse_mode="Markdown",
-        reply_markup=kb
-    )
-
-    # 4) таймер: удаляем предупреждение через 2 минуты
-    async def delete_warning(chat_id_val, msg_id_val, uid_val):
-        try:
-            await bot.delete_message(chat_id_val, msg_id_val)
-        except Exception:
-            pass
-        warn_messages.pop(uid_val, None)
-
-    def delete_warning_sync(chat_id_val, msg_id_val, uid_val):
-        asyncio.run(delete_warning(chat_id_val, msg_id_val, uid_val))
-
-    timer = threading.Timer(
-        120,
-        delete_warning_sync,
-        args=(message.chat.id, warn_msg.message_id, user_id)
-    )
-    timer.start()
-
-    # 5) сохраняем, чтобы потом корректно удалить/обновить
-    warn_messages[user_id] = WarnMessage(message.chat.id, warn_msg.message_id, timer)
-
 async def main() -> None:
+    create_app()
     # skip_pending=True, чтобы «очищать» старые «висящие» апдейты
     await dp.start_polling(bot, skip_updates=True)
 
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+callback_data: компактный формат и единый маршрутизатор.
+
+• Cb — описание типа кнопки: "<тег><версия>:<поле>:<поле>", целые числа в base36.
+  Смена формата = новая версия; старые кнопки (уже разосланные в чаты) продолжают
+  работать через legacy-префиксы вида "buy_ad_123".
+• CallbackRouter — один обработчик callback_query на весь Dispatcher.
+  Хендлер ищется по точному совпадению или по самому длинному префиксу (префиксное
+  дерево), то есть за один проход по строке callback_data, а не перебором лямбд.
+"""
+import inspect
+from typing import Callable, Dict, Optional, Tuple
+
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.event.bases import SkipHandler
+
+import metrics
+
+# Лимит Telegram на callback_data
+MAX_CALLBACK_BYTES = 64
+
+_B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def to_base36(value: int) -> str:
+    if value < 0:
+        return "-" + to_base36(-value)
+    out = ""
+    while True:
+        value, rem = divmod(value, 36)
+        out = _B36[rem] + out
+        if not value:
+            return out
+
+
+class Cb:
+    """
+    Тип callback_data с типизированными полями (int или str).
+
+        BUY_AD = Cb("b", int, legacy=("buy_ad_",))
+        BUY_AD.pack(123)          -> "b1:3f"
+        BUY_AD.unpack("b1:3f")    -> (123,)
+        BUY_AD.unpack("buy_ad_123") -> (123,)   # старая кнопка
+    """
+    SEP = ":"
+
+    def __init__(self, tag: str, *fields: type, version: int = 1, legacy: Tuple[str, ...] = ()):
+        self.tag = tag
+        self.fields = fields
+        self.prefix = f"{tag}{version}{self.SEP}"
+        self.legacy = tuple(legacy)
+
+    def pack(self, *values) -> str:
+        if len(values) != len(self.fields):
+            raise ValueError(f"{self.tag}: ожидалось {len(self.fields)} полей, получено {len(values)}")
+        parts = []
+        for kind, value in zip(self.fields, values):
+            if kind is int:
+                parts.append(to_base36(int(value)))
+            else:
+                value = str(value)
+                if self.SEP in value:
+                    raise ValueError(f"{self.tag}: символ «{self.SEP}» в строковом поле")
+                parts.append(value)
+        data = self.prefix + self.SEP.join(parts)
+        if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+            raise ValueError(f"{self.tag}: callback_data длиннее {MAX_CALLBACK_BYTES} байт: {data}")
+        return data
+
+    def unpack(self, data: str) -> tuple:
+        """Поля кнопки; ValueError, если строка не подходит под этот тип."""
+        if data.startswith(self.prefix):
+            raw = data[len(self.prefix):].split(self.SEP) if self.fields else []
+            base = 36
+        else:
+            legacy = next((p for p in self.legacy if data.startswith(p)), None)
+            if legacy is None:
+                raise ValueError(f"{self.tag}: чужая кнопка {data!r}")
+            raw = data[len(legacy):].split("_") if self.fields else []
+            base = 10
+        if len(raw) != len(self.fields):
+            raise ValueError(f"{self.tag}: неверное число полей в {data!r}")
+        return tuple(int(v, base) if kind is int else v for kind, v in zip(self.fields, raw))
+
+
+class _Route:
+    __slots__ = ("handler", "spec", "prefix", "wants_state", "wants_args")
+
+    def __init__(self, handler: Callable, spec: Optional[Cb], prefix: str):
+        params = inspect.signature(handler).parameters
+        self.handler = handler
+        self.spec = spec
+        self.prefix = prefix
+        self.wants_state = "state" in params
+        self.wants_args = "args" in params
+
+
+class CallbackRouter:
+    """Маршрутизатор callback_data: точные ключи + префиксное дерево."""
+
+    def __init__(self):
+        self._exact: Dict[str, _Route] = {}
+        self._trie: dict = {}
+
+    def route(self, *prefixes, exact: Tuple[str, ...] = ()):
+        """
+        Регистрирует хендлер на префиксы (строки или Cb, включая их legacy-префиксы)
+        и/или точные значения callback_data. Хендлер может принять `state` (FSMContext)
+        и `args` — распакованные поля Cb.
+        """
+        def decorator(handler):
+            for key in prefixes:
+                if isinstance(key, Cb):
+                    for prefix in (key.prefix,) + key.legacy:
+                        self._add_prefix(prefix, _Route(handler, key, prefix))
+                else:
+                    self._add_prefix(key, _Route(handler, None, key))
+            for key in exact:
+                if key in self._exact:
+                    raise RuntimeError(f"callback «{key}» уже обрабатывает {self._exact[key].handler.__qualname__}")
+                self._exact[key] = _Route(handler, None, key)
+            return handler
+        return decorator
+
+    def _add_prefix(self, prefix: str, route: _Route):
+        node = self._trie
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        if None in node:
+            raise RuntimeError(f"префикс «{prefix}» уже обрабатывает {node[None].handler.__qualname__}")
+        node[None] = route
+
+    def resolve(self, data: str) -> Optional[_Route]:
+        route = self._exact.get(data)
+        if route is not None:
+            return route
+        node, found = self._trie, None
+        for ch in data:
+            node = node.get(ch)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+    async def dispatch(self, call: types.CallbackQuery, **data):
+        route = self.resolve(call.data or "")
+        # для метрик апдейт должен числиться за конкретным хендлером, а не за dispatch
+        metrics.label_handler(route.handler if route else None)
+        if route is None:
+            raise SkipHandler()
+        kwargs = {}
+        if route.wants_state:
+            kwargs["state"] = data.get("state")
+        if route.wants_args:
+            try:
+                kwargs["args"] = route.spec.unpack(call.data) if route.spec else ()
+            except ValueError:
+                return await call.answer("Кнопка устарела.", show_alert=True)
+        return await route.handler(call, **kwargs)
+
+
+def get_router(dp: Dispatcher) -> CallbackRouter:
+    """Общий маршрутизатор Dispatcher'а; при первом вызове регистрируется в dp."""
+    router = dp.workflow_data.get("callback_router")
+    if router is None:
+        router = CallbackRouter()
+        dp["callback_router"] = router
+        dp.callback_query.register(router.dispatch)
+    return router
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Типы кнопок с id. Объявления в чатах живут долго — старые форматы
+#   оставляем как legacy, чтобы «Купить» под давними постами не ломалось.
+# ────────────────────────────────────────────────────────────────────
+BUY_AD = Cb("b", int, legacy=("buy_ad_",))
+DETAILS_AD = Cb("d", int, legacy=("details_ad_",))
+CONFIRM_BUY = Cb("cb", int, legacy=("confirm_buy_ad_",))
+CANCEL_BUY = Cb("xb", int, legacy=("cancel_buy_ad_",))
+CONFIRM_DEAL = Cb("cd", int, legacy=("confirm_deal_",))
+CANCEL_DEAL = Cb("xd", int, legacy=("cancel_deal_",))
+
+SEARCH_REGION = Cb("sr", int, legacy=("srch_region_",))
+SEARCH_CITY = Cb("sc", int, legacy=("srch_city_",))
+SEARCH_CATEGORY = Cb("sk", int, legacy=("srch_cat_",))
+SEARCH_SUBCATEGORY = Cb("ss", int, legacy=("srch_subcat_",))
+SEARCH_OPEN_AD = Cb("so", int, legacy=("srch_openad_",))
+# страница результатов: подписанный токен запроса (search_query.py) + курсор (id последнего показанного)
+SEARCH_PAGE = Cb("sp", str, int)
+# сохранённые поиски (saved_searches.py): сохранить по токену / удалить подписку
+SEARCH_SAVE = Cb("sv", str)
+SAVED_SEARCH_DELETE = Cb("sd", int)
+# очередь финансов (finance.py): вид заявок ("t" — пополнения, "w" — выводы) и страница
+FINANCE_VIEW = Cb("fv", str, int)
+FINANCE_TOGGLE = Cb("ft", str, int, int)        # вид, id заявки, страница
+FINANCE_SELECT_PAGE = Cb("fa", str, int)
+FINANCE_CLEAR = Cb("fc", str, int)
+FINANCE_APPLY = Cb("fd", str, int, int)         # вид, 1 — одобрить / 0 — отклонить, страница
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Неизменяемый справочник регионов/городов и категорий/подкатегорий.
+
+Строится один раз при импорте из config.CITY_STRUCTURE и config.MAIN_CATEGORIES.
+У каждого элемента есть стабильный целочисленный код — он зависит только от названия
+(и родителя), а не от позиции в списке, поэтому старые кнопки продолжают работать
+после правки config. В user_steps и callback_data храним только эти коды.
+"""
+import zlib
+from types import MappingProxyType
+from typing import NamedTuple, Optional, Tuple, Mapping
+
+from config import CITY_STRUCTURE, MAIN_CATEGORIES
+
+# разделитель региона и города в ads.city («Москва | ЗАО»)
+CITY_SEPARATOR = " | "
+
+
+class City(NamedTuple):
+    code: int
+    name: str
+    region_code: int
+    full_name: str          # значение для ads.city
+
+
+class Region(NamedTuple):
+    code: int
+    name: str
+    cities: Tuple[City, ...]
+
+
+class Subcategory(NamedTuple):
+    code: int
+    name: str
+    category_code: int
+
+
+class Category(NamedTuple):
+    code: int
+    name: str
+    subcategories: Tuple[Subcategory, ...]
+
+
+def stable_code(*parts: str) -> int:
+    """Короткий (24 бита) код по названию; одинаков между перезапусками и правками порядка."""
+    return zlib.crc32("\x1f".join(parts).encode("utf-8")) & 0xFFFFFF
+
+
+def _unique(kind: str, items) -> Mapping[int, tuple]:
+    by_code = {}
+    for item in items:
+        other = by_code.setdefault(item.code, item)
+        if other is not item:
+            raise RuntimeError(f"catalog: коллизия кодов {kind}: «{other.name}» и «{item.name}»")
+    return MappingProxyType(by_code)
+
+
+def _build_regions() -> Tuple[Region, ...]:
+    regions = []
+    for reg_name, city_names in CITY_STRUCTURE.items():
+        reg_code = stable_code("region", reg_name)
+        cities = tuple(
+            City(stable_code("city", reg_name, c_name), c_name, reg_code, f"{reg_name}{CITY_SEPARATOR}{c_name}")
+            for c_name in dict.fromkeys(city_names)
+        )
+        regions.append(Region(reg_code, reg_name, cities))
+    return tuple(regions)
+
+
+def _build_categories() -> Tuple[Category, ...]:
+    categories = []
+    for cat_name, sub_names in MAIN_CATEGORIES.items():
+        cat_code = stable_code("category", cat_name)
+        subs = tuple(
+            Subcategory(stable_code("subcategory", cat_name, s_name), s_name, cat_code)
+            for s_name in dict.fromkeys(sub_names)
+        )
+        categories.append(Category(cat_code, cat_name, subs))
+    return tuple(categories)
+
+
+REGIONS: Tuple[Region, ...] = _build_regions()
+CATEGORIES: Tuple[Category, ...] = _build_categories()
+
+REGION_BY_CODE = _unique("регионов", REGIONS)
+CITY_BY_CODE = _unique("городов", (c for r in REGIONS for c in r.cities))
+CATEGORY_BY_CODE = _unique("категорий", CATEGORIES)
+SUBCATEGORY_BY_CODE = _unique("подкатегорий", (s for c in CATEGORIES for s in c.subcategories))
+
+REGION_BY_NAME = MappingProxyType({r.name: r for r in REGIONS})
+CATEGORY_BY_NAME = MappingProxyType({c.name: c for c in CATEGORIES})
+CITY_BY_FULL_NAME = MappingProxyType({c.full_name: c for c in CITY_BY_CODE.values()})
+
+
+def region_of_city(city_code: int) -> Optional[Region]:
+    city = CITY_BY_CODE.get(city_code)
+    return REGION_BY_CODE[city.region_code] if city else None
+
+
+def parse_code(raw: str, mapping: Mapping[int, tuple]):
+    """Код из хвоста callback_data → элемент справочника или None (устаревшая/битая кнопка)."""
+    try:
+        return mapping.get(int(raw))
+    except (TypeError, ValueError):
+        return None
@@ -6,6 +6,9 @@ import os
 # ============================================================================
 # BOT_TOKEN = os.getenv("BOT_TOKEN", "7717741740:AAG4ZTVtnL08Mp9Ev9s4ooeodwd9GYAZpgc")
 BOT_TOKEN = os.getenv("BOT_TOKEN", "8110398918:AAFqgYOOLSYNyi8W3epKEqNnym4zTmLKltQ")
+# свой сервер Bot API (локальный telegram-bot-api или фейковый из benchmarks/loadtest.py);
+# пусто — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
 
 # ============================================================================
 # 2) Настройки подключения к базе данных
@@ -272,3 +275,109 @@ ADMIN_EXTENSION_CHAT_ID = -1002288960086  # куда летят заявки н
 ADMIN_PROFILE_CHAT_ID = -1002288960086   # чат, куда летят заявки на смену ФИО / ИНН / компании
 ADMIN_TOPUP_CHAT_ID = -1002586768630 # пополнение
 ADMIN_WITHDRAW_CHAT_ID = -1002586768630 # вывод
+
+# ============================================================================
+# 12) Срок жизни объявлений и фоновое обслуживание
+# ============================================================================
+AD_LIFETIME_DAYS = int(os.getenv("AD_LIFETIME_DAYS", "30"))            # срок размещения / продления
+AD_EXPIRY_REMIND_DAYS = int(os.getenv("AD_EXPIRY_REMIND_DAYS", "3"))   # за сколько дней напоминать владельцу
+AD_EXPIRY_BATCH_SIZE = int(os.getenv("AD_EXPIRY_BATCH_SIZE", "500"))   # строк за один UPDATE
+MAINTENANCE_INTERVAL_SEC = int(os.getenv("MAINTENANCE_INTERVAL_SEC", "600"))
+
+# ============================================================================
+# 13) Метрики латентности хендлеров (metrics.py)
+# ============================================================================
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))   # 0 — HTTP-эндпоинт /metrics выключен
+
+# ============================================================================
+# 14) Профилирование SQL (sqlprofiler.py), по умолчанию выключено
+# ============================================================================
+SQL_PROFILE = os.getenv("SQL_PROFILE", "0") == "1"
+SQL_SLOW_QUERY_MS = int(os.getenv("SQL_SLOW_QUERY_MS", "200"))       # порог «медленного» запроса
+SQL_NPLUS1_THRESHOLD = int(os.getenv("SQL_NPLUS1_THRESHOLD", "5"))   # повторов одного запроса за апдейт
+
+# ============================================================================
+# 15) Запуск бота
+# ============================================================================
+# Проверка схемы БД при старте: auto — сверить ревизию с последней миграцией
+# и предупредить в логе, off — не трогать БД при старте.
+# Сами миграции — отдельный шаг: «alembic upgrade head» (migrations/)
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "auto")
+
+# ============================================================================
+# 16) Архив переписки (archive.py): закрытые чаты и тикеты
+# ============================================================================
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))     # через сколько дней после закрытия
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))    # чатов/тикетов за одну транзакцию
+
+# ============================================================================
+# 17) Очередь модерации (moderation.py)
+# ============================================================================
+MODERATION_PAGE_SIZE = int(os.getenv("MODERATION_PAGE_SIZE", "5"))            # объявлений в пачке модератора
+MODERATION_CLAIM_TTL_MIN = int(os.getenv("MODERATION_CLAIM_TTL_MIN", "15"))    # сколько держится бронь пачки
+
+# ============================================================================
+# 18) Дубли объявлений (fingerprint.py)
+# ============================================================================
+# flag — отправить на модерацию с пометкой «возможный дубль»,
+# reject — не принимать объявление, текст которого почти совпадает с живым объявлением
+DUPLICATE_AD_ACTION = os.getenv("DUPLICATE_AD_ACTION", "flag")
+# с какого сходства наборов слов (0..1) текст считается дублем
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", "0.75"))
+
+# ============================================================================
+# 19) Отзывы о продавце (reputation.py)
+# ============================================================================
+SELLER_FEEDBACK_PAGE_SIZE = int(os.getenv("SELLER_FEEDBACK_PAGE_SIZE", "5"))   # отзывов на странице
+
+# ============================================================================
+# 20) Активность пользователей (activity.py)
+# ============================================================================
+ACTIVITY_FLUSH_SEC = int(os.getenv("ACTIVITY_FLUSH_SEC", "60"))   # как часто писать users.last_active
+
+# ============================================================================
+# 21) Антифлуд в чатах биржи (antiflood.py)
+# ============================================================================
+# пороги по умолчанию; для отдельного чата меняются командой «/admin flood»
+FLOOD_MAX_MESSAGES = int(os.getenv("FLOOD_MAX_MESSAGES", "5"))         # сообщений ...
+FLOOD_WINDOW_SEC = int(os.getenv("FLOOD_WINDOW_SEC", "10"))            # ... за столько секунд
+FLOOD_MAX_DUPLICATES = int(os.getenv("FLOOD_MAX_DUPLICATES", "2"))     # одинаковых сообщений подряд
+FLOOD_DUP_WINDOW_SEC = int(os.getenv("FLOOD_DUP_WINDOW_SEC", "3600"))  # повтор считается в пределах часа
+FLOOD_MUTE_SEC = int(os.getenv("FLOOD_MUTE_SEC", "600"))               # мьют на 2-м нарушении (на 3-м — ×6)
+FLOOD_STRIKE_TTL_SEC = int(os.getenv("FLOOD_STRIKE_TTL_SEC", "86400")) # через сколько нарушения забываются
+FLOOD_IDLE_TTL_SEC = int(os.getenv("FLOOD_IDLE_TTL_SEC", "86400"))     # сколько помнить молчащего пользователя
+
+# ============================================================================
+# 22) Результаты поиска (search_query.py)
+# ============================================================================
+# ключ подписи токенов поиска (кнопки «Показать ещё» и ссылки ?start=s_...);
+# пусто — выводится из BOT_TOKEN. Одинаковый у всех процессов бота.
+SEARCH_TOKEN_SECRET = os.getenv("SEARCH_TOKEN_SECRET", "")
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))   # объявлений на странице результатов
+
+# ============================================================================
+# 23) Кэш результатов поиска (search_cache.py)
+# ============================================================================
+SEARCH_CACHE_TTL_SEC = int(os.getenv("SEARCH_CACHE_TTL_SEC", "60"))   # сколько страница может быть устаревшей
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))       # страниц/счётчиков в памяти процесса
+
+# ============================================================================
+# 24) Сохранённые поиски и уведомления о новых объявлениях (saved_searches.py)
+# ============================================================================
+SAVED_SEARCH_LIMIT = int(os.getenv("SAVED_SEARCH_LIMIT", "10"))         # подписок на пользователя
+ALERT_FLUSH_SEC = int(os.getenv("ALERT_FLUSH_SEC", "60"))               # как часто рассылать накопленное
+ALERT_RATE_PER_SEC = int(os.getenv("ALERT_RATE_PER_SEC", "20"))         # сообщений в секунду (лимит Telegram — 30)
+ALERT_MAX_ADS_PER_MESSAGE = int(os.getenv("ALERT_MAX_ADS_PER_MESSAGE", "10"))  # кнопок объявлений в одном уведомлении
+
+# ============================================================================
+# 25) Проверка чеков пополнения на повторы (receipts.py)
+# ============================================================================
+RECEIPT_HASH_WORKERS = int(os.getenv("RECEIPT_HASH_WORKERS", "2"))          # процессов для dHash
+RECEIPT_DHASH_MAX_DISTANCE = int(os.getenv("RECEIPT_DHASH_MAX_DISTANCE", "3"))  # бит различия «почти того же» чека (≤ 3 — находится гарантированно)
+RECEIPT_MAX_BYTES = int(os.getenv("RECEIPT_MAX_BYTES", str(10 * 1024 * 1024)))  # чеки больше не скачиваем
+
+# ============================================================================
+# 26) Очередь пополнений и выводов для админов (finance.py)
+# ============================================================================
+FINANCE_PAGE_SIZE = int(os.getenv("FINANCE_PAGE_SIZE", "15"))   # заявок на странице очереди
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Счётчики объявлений для меню поиска (таблица ad_counters).
+
+Живое объявление = status == "approved" и is_active. Счётчик ведётся по ключу
+(city, category, subcategory) и обновляется в той же транзакции, что и само объявление:
+  • ORM-изменения (одобрение, деактивация, продление, удаление) ловит after_flush;
+  • массовые UPDATE мимо ORM (см. maintenance.py) вызывают apply_deltas() сами.
+rebuild() пересчитывает таблицу целиком — на старте бота, чтобы погасить любой дрейф.
+"""
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert
+
+from database import engine, SessionLocal, Ad, AdCounter
+
+CounterKey = Tuple[str, str, str]
+
+# в database.py эти колонки Ad объявлены с active_history=True: прежнее значение известно в after_flush
+_TRACKED = ("status", "is_active", "city", "category", "subcategory")
+_table = AdCounter.__table__
+
+
+def live_key(status, is_active, city, category, subcategory) -> Optional[CounterKey]:
+    """Ключ счётчика для объявления или None, если оно не участвует в поиске."""
+    # is_active=None бывает у ещё не записанного объекта — в БД будет default=True
+    if status != "approved" or is_active is False:
+        return None
+    return city or "", category or "", subcategory or ""
+
+
+def apply_deltas(conn, deltas: Dict[CounterKey, int]):
+    """
+    Прибавляет дельты к счётчикам одним INSERT ... ON CONFLICT DO UPDATE.
+    `conn` — соединение текущей транзакции (session.connection() или engine.begin()).
+    """
+    rows = [
+        {"city": k[0], "category": k[1], "subcategory": k[2], "cnt": d}
+        for k, d in deltas.items() if d
+    ]
+    if not rows:
+        return
+    stmt = insert(_table).values(rows)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=[_table.c.city, _table.c.category, _table.c.subcategory],
+        set_={"cnt": _table.c.cnt + stmt.excluded.cnt}
+    ))
+
+
+def deltas_for_removed(rows: Iterable[tuple]) -> Dict[CounterKey, int]:
+    """Дельты для строк (status, city, category, subcategory), которые перестали быть активными."""
+    deltas: Dict[CounterKey, int] = Counter()
+    for status, city, category, subcategory in rows:
+        key = live_key(status, True, city, category, subcategory)
+        if key:
+            deltas[key] -= 1
+    return deltas
+
+
+def rebuild():
+    """Полный пересчёт ad_counters по таблице ads."""
+    key = (
+        func.coalesce(Ad.city, ""),
+        func.coalesce(Ad.category, ""),
+        func.coalesce(Ad.subcategory, ""),
+    )
+    live = select(*key, func.count()).where(
+        Ad.status == "approved",
+        Ad.is_active == True
+    ).group_by(*key)
+    with engine.begin() as conn:
+        conn.execute(delete(_table))
+        conn.execute(_table.insert().from_select(["city", "category", "subcategory", "cnt"], live))
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Инкрементальное обновление через ORM
+# ────────────────────────────────────────────────────────────────────
+def _values(conn, state, old: bool) -> tuple:
+    """Значения отслеживаемых колонок до (old=True) или после flush."""
+    values, missing = [], []
+    for i, key in enumerate(_TRACKED):
+        hist = state.attrs[key].history
+        if hist.unchanged:
+            values.append(hist.unchanged[0])
+        elif hist.added or hist.deleted:
+            if old:
+                # пустой deleted при наличии added означает, что прежде было None
+                values.append(hist.deleted[0] if hist.deleted else None)
+            else:
+                values.append(hist.added[0] if hist.added else None)
+        else:
+            values.append(None)
+            missing.append(i)
+    if missing and state.identity:
+        # не загруженные и не менявшиеся колонки одинаковы «до» и «после» — берём из БД
+        row = conn.execute(
+            select(*(getattr(Ad, k) for k in _TRACKED)).where(Ad.id == state.identity[0])
+        ).first()
+        if row:
+            for i in missing:
+                values[i] = row[i]
+    return tuple(values)
+
+
+def keys_before_after(conn, obj: Ad) -> Tuple[Optional[CounterKey], Optional[CounterKey]]:
+    """Ключи счётчика изменённого объявления до и после flush (None — не в поиске)."""
+    state = inspect(obj)
+    return live_key(*_values(conn, state, old=True)), live_key(*_values(conn, state, old=False))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session, flush_context):
+    deltas: Dict[CounterKey, int] = Counter()
+    conn = None
+
+    for obj in session.new:
+        if isinstance(obj, Ad):
+            key = live_key(obj.status, obj.is_active, obj.city, obj.category, obj.subcategory)
+            if key:
+                deltas[key] += 1
+
+    for obj in session.dirty:
+        if not isinstance(obj, Ad):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[k].history.has_changes() for k in _TRACKED):
+            continue
+        conn = conn or session.connection()
+        old_key, new_key = keys_before_after(conn, obj)
+        if old_key != new_key:
+            if old_key:
+                deltas[old_key] -= 1
+            if new_key:
+                deltas[new_key] += 1
+
+    for obj in session.deleted:
+        if isinstance(obj, Ad):
+            conn = conn or session.connection()
+            key = live_key(*_values(conn, inspect(obj), old=True))
+            if key:
+                deltas[key] -= 1
+
+    if any(deltas.values()):
+        apply_deltas(conn or session.connection(), deltas)
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Чтение для меню поиска
+# ────────────────────────────────────────────────────────────────────
+def location_matcher(city: Optional[str], region_wide: bool, is_custom: bool) -> Callable[[str], bool]:
+    """Повторяет фильтр по месту из search.do_search, но над ключами счётчиков."""
+    if city is None:
+        return lambda c: True
+    needle = city.lower()
+    if is_custom:
+        return lambda c: needle in c.lower()
+    if region_wide:
+        return lambda c: c.lower().startswith(needle)
+    return lambda c: c == city
+
+
+def _load(category: Optional[str] = None) -> List[tuple]:
+    with SessionLocal() as sess:
+        q = sess.query(AdCounter.city, AdCounter.category, AdCounter.subcategory, AdCounter.cnt) \
+                .filter(AdCounter.cnt > 0)
+        if category is not None:
+            q = q.filter(AdCounter.category == category)
+        return q.all()
+
+
+def city_totals() -> Dict[str, int]:
+    """Число живых объявлений по каждому значению ads.city."""
+    totals: Dict[str, int] = Counter()
+    for city, _, _, cnt in _load():
+        totals[city] += cnt
+    return totals
+
+
+def region_counts(regions: Iterable[str], totals: Dict[str, int]) -> Dict[str, int]:
+    """Поиск «по всему региону» идёт по префиксу города — считаем так же."""
+    return {
+        reg: sum(cnt for city, cnt in totals.items() if city.lower().startswith(reg.lower()))
+        for reg in regions
+    }
+
+
+def category_counts(city: Optional[str], region_wide: bool, is_custom: bool) -> Dict[str, int]:
+    match = location_matcher(city, region_wide, is_custom)
+    counts: Dict[str, int] = Counter()
+    for c_city, category, _, cnt in _load():
+        if match(c_city):
+            counts[category] += cnt
+    return counts
+
+
+def subcategory_counts(category: str, city: Optional[str], region_wide: bool, is_custom: bool) -> Dict[str, int]:
+    match = location_matcher(city, region_wide, is_custom)
+    counts: Dict[str, int] = Counter()
+    for c_city, _, subcategory, cnt in _load(category):
+        if match(c_city):
+            counts[subcategory] += cnt
+    return counts
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
+import os
+
 from sqlalchemy import (
     create_engine, Column, Integer, BigInteger, String, Text,
-    Numeric, ForeignKey, DateTime, Boolean, Float
+    Numeric, ForeignKey, DateTime, Boolean, Float, Index, LargeBinary, false, text
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import column_property, relationship, sessionmaker
 from datetime import datetime
 from config import DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASS
 
@@ -16,6 +18,10 @@ Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # снятие истёкших банов (maintenance.py): только забаненные
+        Index("ix_users_banned_ban_until", "ban_until", postgresql_where=text("is_banned")),
+    )
 
     id = Column(BigInteger, primary_key=True, index=True)
     username = Column(String, nullable=True)
@@ -41,6 +47,14 @@ class User(Base):
 
 class Ad(Base):
     __tablename__ = "ads"
+    __table_args__ = (
+        # «Мои объявления»: выборка страницы объявлений пользователя по дате
+        Index("ix_ads_user_id_created_at", "user_id", "created_at"),
+        # фоновая чистка: активные объявления с истёкшим сроком
+        Index("ix_ads_is_active_expires_at", "is_active", "expires_at"),
+        # очередь модерации: ожидающие объявления по возрасту (moderation.py)
+        Index("ix_ads_pending_created_at", "created_at", postgresql_where=text("status = 'pending'")),
+    )
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
@@ -50,15 +64,20 @@ class Ad(Base):
 
     price = Column(Numeric(10, 2), nullable=True)
     quantity = Column(Integer, default=1)
-    category = Column(String, nullable=True)
-    subcategory = Column(String, nullable=True)
-    city = Column(String, nullable=True)
+    # active_history: при присваивании ORM подгружает прежнее значение — counters.py вычитает из старого ключа
+    category = column_property(Column(String, nullable=True), active_history=True)
+    subcategory = column_property(Column(String, nullable=True), active_history=True)
+    city = column_property(Column(String, nullable=True), active_history=True)
     photos = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    status = Column(String, nullable=False, default='pending')
+    status = column_property(Column(String, nullable=False, default='pending'), active_history=True)
     ad_type = Column(String, nullable=False, default='standard')
-    is_active = Column(Boolean, default=True, nullable=False)
+    is_active = column_property(Column(Boolean, default=True, nullable=False), active_history=True)
     selected_chat_ids = Column(Text, nullable=True)
+    expires_at = Column(DateTime, nullable=True)                    # до какого момента объявление активно (UTC)
+    expiry_reminded = Column(Boolean, default=False, server_default=false(), nullable=False)  # напоминание о скором окончании отправлено
+    claimed_by = Column(BigInteger, nullable=True)      # модератор, взявший объявление в работу (moderation.py)
+    claimed_until = Column(DateTime, nullable=True)     # до какого момента действует бронь
 
     user = relationship("User", back_populates="ads")
     feedbacks = relationship("AdFeedback", back_populates="ad", cascade="all, delete-orphan")
@@ -67,10 +86,15 @@ class Ad(Base):
 
 class AdFeedback(Base):
     __tablename__ = "ad_feedback"
+    __table_args__ = (
+        # страницы «Отзывы о продавце»: одобренные отзывы продавца, новые сверху (reputation.py)
+        Index("ix_ad_feedback_seller_id_status_id", "seller_id", "status", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     ad_id = Column(Integer, ForeignKey("ads.id"), nullable=False)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    seller_id = Column(BigInteger, nullable=True)       # владелец объявления (копия ads.user_id)
 
     rating = Column(Integer, nullable=True)
     comment = Column(Text, nullable=True)
@@ -93,6 +117,10 @@ class ChatGroup(Base):
     price_pin    = Column(Float,   default=0.0)
     participants = Column(Integer, default=0)
     is_active    = Column(Boolean, default=True)
+    # пороги антифлуда (antiflood.py); NULL — значение по умолчанию из config
+    flood_max_messages   = Column(Integer, nullable=True)
+    flood_window_sec     = Column(Integer, nullable=True)
+    flood_max_duplicates = Column(Integer, nullable=True)
 
 
 class ScheduledPost(Base):
@@ -120,6 +148,10 @@ class Sale(Base):
 
 class TopUp(Base):
     __tablename__ = "topups"
+    __table_args__ = (
+        # очередь финансов: только ожидающие заявки (finance.py)
+        Index("ix_topups_pending_id", "id", postgresql_where=text("status = 'pending'")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
@@ -128,31 +160,59 @@ class TopUp(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     payment_system = Column(String, nullable=True)
     card_number    = Column(String, nullable=True)
+    receipt_file_id = Column(String, nullable=True)                     # скрин/файл чека (receipts.py)
+    receipt_file_unique_id = Column(String, nullable=True, index=True)  # одинаков для одного файла — повторный чек
 
 
 class Withdrawal(Base):
     __tablename__ = "withdrawals"
+    __table_args__ = (
+        # очередь финансов: только ожидающие заявки (finance.py)
+        Index("ix_withdrawals_pending_id", "id", postgresql_where=text("status = 'pending'")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     amount = Column(Numeric(10, 2), default=0)
     status = Column(String, default="pending")
     created_at = Column(DateTime, default=datetime.utcnow)
+    payment_system = Column(String, nullable=True)
+    card_number    = Column(String, nullable=True)
+    # сумма списана с баланса при заявке (finance.reserve_withdrawal); у старых заявок — при одобрении
+    reserved = Column(Boolean, default=False, server_default=false(), nullable=False)
 
 
 class SupportTicket(Base):
     __tablename__ = "support_tickets"
+    __table_args__ = (
+        # входящие админа: открытые тикеты по последней активности
+        Index("ix_support_tickets_status_last_activity_at", "status", "last_activity_at"),
+        # «Мои обращения» пользователя
+        Index("ix_support_tickets_user_id_last_activity_at", "user_id", "last_activity_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     status = Column(String, default="open")
     created_at = Column(DateTime, default=datetime.utcnow)
+    closed_at = Column(DateTime, nullable=True)   # от него считается срок до архивации (archive.py)
+
+    # денормализовано для списков: обновляется вместе с каждым сообщением (support.add_ticket_message)
+    last_activity_at = Column(DateTime, default=datetime.utcnow)
+    last_message_preview = Column(String(100), nullable=True)
+    message_count = Column(Integer, default=0, server_default="0", nullable=False)
+    unread_by_admin = Column(Integer, default=0, server_default="0", nullable=False)
+    unread_by_user = Column(Integer, default=0, server_default="0", nullable=False)
 
     messages = relationship("SupportMessage", back_populates="ticket", cascade="all, delete-orphan")
 
 
 class SupportMessage(Base):
     __tablename__ = "support_messages"
+    __table_args__ = (
+        # переписка тикета по порядку
+        Index("ix_support_messages_ticket_id_created_at", "ticket_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     ticket_id = Column(Integer, ForeignKey("support_tickets.id"), nullable=False)
@@ -172,6 +232,7 @@ class AdChat(Base):
     seller_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     status = Column(String, default="open")
     created_at = Column(DateTime, default=datetime.utcnow)
+    closed_at = Column(DateTime, nullable=True)   # от него считается срок до архивации (archive.py)
 
     ad = relationship("Ad", back_populates="chats")
     messages = relationship("AdChatMessage", back_populates="chat", cascade="all, delete-orphan")
@@ -179,6 +240,10 @@ class AdChat(Base):
 
 class AdChatMessage(Base):
     __tablename__ = "ad_chat_messages"
+    __table_args__ = (
+        # переписка чата по порядку
+        Index("ix_ad_chat_messages_chat_id_created_at", "chat_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     chat_id = Column(Integer, ForeignKey("ad_chats.id"), nullable=False)
@@ -200,9 +265,159 @@ class AdComplaint(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
-def init_db():
+class AdCounter(Base):
+    """
+    Счётчики живых (одобренных и активных) объявлений для меню поиска.
+    NULL в city/category/subcategory храним как пустую строку — это часть ключа.
+    Поддерживаются инкрементально модулем counters.py.
+    """
+    __tablename__ = "ad_counters"
+
+    city = Column(String, primary_key=True, default="")
+    category = Column(String, primary_key=True, default="")
+    subcategory = Column(String, primary_key=True, default="")
+    cnt = Column(Integer, nullable=False, default=0)
+
+
+class MessageArchive(Base):
+    """
+    Переписка закрытого чата (kind="ad_chat") или тикета (kind="ticket"),
+    вынесенная из горячих таблиц: zlib-сжатый JSON [[sender_id, text, created_at], …].
+    Пишется и читается модулем archive.py.
+    """
+    __tablename__ = "message_archives"
+
+    kind = Column(String(16), primary_key=True)
+    parent_id = Column(Integer, primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    first_at = Column(DateTime, nullable=True)
+    last_at = Column(DateTime, nullable=True)
+    payload = Column(LargeBinary, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AdFingerprint(Base):
+    """
+    MinHash-подпись текста объявления и её 8 полос (fingerprint.py).
+    Индекс на каждой полосе — поиск почти-дублей это точные совпадения полос.
+    """
+    __tablename__ = "ad_fingerprints"
+
+    ad_id = Column(Integer, ForeignKey("ads.id", ondelete="CASCADE"), primary_key=True)
+    signature = Column(LargeBinary, nullable=False)     # 32 значения по 4 байта
+    band0 = Column(Integer, nullable=False, index=True)
+    band1 = Column(Integer, nullable=False, index=True)
+    band2 = Column(Integer, nullable=False, index=True)
+    band3 = Column(Integer, nullable=False, index=True)
+    band4 = Column(Integer, nullable=False, index=True)
+    band5 = Column(Integer, nullable=False, index=True)
+    band6 = Column(Integer, nullable=False, index=True)
+    band7 = Column(Integer, nullable=False, index=True)
+
+
+class AdPhotoFingerprint(Base):
+    """file_unique_id фото объявления — одинаковые фото у разных объявлений (fingerprint.py)."""
+    __tablename__ = "ad_photo_fingerprints"
+
+    file_unique_id = Column(String, primary_key=True)
+    ad_id = Column(Integer, ForeignKey("ads.id", ondelete="CASCADE"), primary_key=True)
+
+
+class SellerReputation(Base):
+    """
+    Агрегат отзывов о продавце (reputation.py): одобренные отзывы, оценки
+    и последние отзывы в JSON. Обновляется при одобрении отзыва.
+    """
+    __tablename__ = "seller_reputation"
+
+    seller_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    feedback_count = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    last_feedback_at = Column(DateTime, nullable=True)
+    recent = Column(Text, nullable=False, default="[]")      # [[id, rating, comment, created_at], ...]
+
+
+class SavedSearch(Base):
+    """
+    Сохранённый поиск покупателя (saved_searches.py): при одобрении подходящего
+    объявления приходит уведомление. Фильтр разложен по колонкам — по ним подписки
+    ищутся индексом, а не перебором; token — тот же поиск для ссылки ?start=s_...
+    """
+    __tablename__ = "saved_searches"
+    __table_args__ = (
+        Index("ix_saved_searches_user_id_token", "user_id", "token", unique=True),
+        # поиск подписчиков нового объявления: (категория, подкатегория) → вид места → место
+        Index("ix_saved_searches_match", "category", "subcategory", "location_kind", "location"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    token = Column(String, nullable=False)
+    location_kind = Column(String, nullable=False)              # any / city / region / custom
+    location = Column(String, nullable=False, default="")       # ads.city, регион или свой город (в нижнем регистре)
+    category = Column(String, nullable=False, default="")       # "" — все категории
+    subcategory = Column(String, nullable=False, default="")    # "" — все подкатегории
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ReceiptFingerprint(Base):
+    """
+    Отпечаток чека пополнения (receipts.py): sha256 файла и dHash картинки,
+    порезанный на 4 полосы по 16 бит — почти одинаковые чеки ищутся по индексам полос.
+    """
+    __tablename__ = "receipt_fingerprints"
+
+    topup_id = Column(Integer, ForeignKey("topups.id", ondelete="CASCADE"), primary_key=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    dhash = Column(BigInteger, nullable=True)           # None — не картинка (PDF и т.п.)
+    band0 = Column(Integer, nullable=True, index=True)
+    band1 = Column(Integer, nullable=True, index=True)
+    band2 = Column(Integer, nullable=True, index=True)
+    band3 = Column(Integer, nullable=True, index=True)
+
+
+# Схемой управляют миграции Alembic (migrations/, alembic.ini), а не create_all при старте
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+
+def alembic_config():
+    from alembic.config import Config
+
+    cfg = Config(ALEMBIC_INI)
+    cfg.set_main_option("script_location", MIGRATIONS_DIR)
+    return cfg
+
+
+def upgrade_db(revision: str = "head"):
+    """То же, что «alembic upgrade head»: для reset_db.py и нагрузочного стенда."""
+    from alembic import command
+
+    command.upgrade(alembic_config(), revision)
+
+
+def check_schema(mode: str = "auto"):
+    """
+    Сверяет ревизию схемы в БД с последней миграцией. Ничего не создаёт и не меняет:
+    миграции — отдельный шаг деплоя («alembic upgrade head»).
+
+    mode: "auto" — один SELECT из alembic_version, при расхождении предупреждение в лог;
+          "off"  — не трогаем БД при старте.
+    """
+    if mode == "off":
+        return
     try:
-        Base.metadata.create_all(bind=engine)
-        print("Таблицы успешно созданы/обновлены.")
+        from alembic.runtime.migration import MigrationContext
+        from alembic.script import ScriptDirectory
+
+        head = ScriptDirectory.from_config(alembic_config()).get_current_head()
+        with engine.connect() as conn:
+            current = MigrationContext.configure(conn).get_current_revision()
+        if current != head:
+            print(f"ВНИМАНИЕ: схема БД на ревизии {current or '—'}, последняя миграция {head}. "
+                  f"Выполните «alembic upgrade head».")
+        else:
+            print(f"Схема БД актуальна (ревизия {head}).")
     except Exception as e:
-        print(f"Ошибка при создании таблиц: {e}")
\ No newline at end of file
+        print(f"Ошибка при проверке схемы БД: {e}")
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Финансы: резерв суммы вывода при заявке и очередь пополнений/выводов для админов.
+
+Деньги — только Decimal, а баланс меняется арифметикой в SQL (balance = balance ± сумма),
+без чтения в Python и записи обратно: параллельные списания и зачисления не затирают друг друга.
+
+Вывод резервируется сразу при заявке: reserve_withdrawal() списывает сумму одним
+UPDATE ... WHERE balance >= сумма, поэтому несколькими заявками подряд нельзя заказать
+больше баланса. Одобрение такого вывода баланс уже не трогает, отклонение — возвращает
+резерв. Заявки, созданные до резерва (withdrawals.reserved = false), списываются при
+одобрении, как раньше.
+
+Очередь («Финансы» в админ-меню или «/admin finance»): ожидающие пополнения или выводы
+постранично, с итогами; заявки отмечаются кнопками и решаются пачкой через decide() —
+одной транзакцией, по одному UPDATE на заявки и на балансы. Занятые строки (их как раз
+решает другой админ) пропускаются (SKIP LOCKED), решённые — не подходят под status = 'pending',
+так что деньги по одной заявке не проводятся дважды. Пользователю — одно сообщение на пачку.
+Кнопки под карточками заявок в чатах админов (admin.py) идут через тот же decide().
+"""
+import asyncio
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation, ROUND_DOWN
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from sqlalchemy import bindparam, func, select, update
+
+import callbacks
+import receipts
+from config import ADMIN_IDS, FINANCE_PAGE_SIZE
+from database import SessionLocal, ReceiptFingerprint, TopUp, User, Withdrawal
+from utils import rus_status
+
+TOPUP = "t"
+WITHDRAW = "w"
+KINDS = {TOPUP: TopUp, WITHDRAW: Withdrawal}
+TITLES = {TOPUP: "Пополнения", WITHDRAW: "Выводы"}
+
+CENT = Decimal("0.01")
+# пауза между уведомлениями пользователям после решения пачкой
+NOTIFY_DELAY_SEC = 0.05
+
+# (админ, вид заявок) → отмеченные id; состояние экрана, как user_steps
+_selected: Dict[Tuple[int, str], Set[int]] = defaultdict(set)
+
+
+class Decision(NamedTuple):
+    id: int
+    user_id: int
+    amount: Decimal
+    delta: Decimal       # на сколько изменился баланс пользователя
+
+
+def parse_amount(text: str) -> Decimal:
+    """Сумма из ввода пользователя («1 500,5» → 1500.50). ValueError, если это не сумма."""
+    try:
+        value = Decimal((text or "").replace(" ", "").replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"не сумма: {text!r}")
+    if not value.is_finite():
+        raise ValueError(f"не сумма: {text!r}")
+    return value.quantize(CENT, rounding=ROUND_DOWN)
+
+
+def money(value) -> str:
+    return f"{Decimal(value or 0):,.2f}".replace(",", " ")
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Резерв и решения
+# ────────────────────────────────────────────────────────────────────
+def reserve_withdrawal(user_id: int, amount: Decimal, card_number: str) -> Optional[Tuple[int, Decimal]]:
+    """
+    Создаёт заявку на вывод, списав сумму с баланса.
+    (id заявки, остаток на балансе) или None — средств не хватает.
+    """
+    with SessionLocal() as sess:
+        balance = sess.execute(
+            update(User)
+            .where(User.id == user_id, User.balance >= amount)
+            .values(balance=User.balance - amount)
+            .returning(User.balance)
+            .execution_options(synchronize_session=False)
+        ).scalar()
+        if balance is None:
+            return None
+        wd = Withdrawal(user_id=user_id, amount=amount, status="pending", card_number=card_number, reserved=True)
+        sess.add(wd)
+        sess.commit()
+        return wd.id, balance
+
+
+def _delta(kind: str, approve: bool, amount: Decimal, reserved: bool) -> Decimal:
+    if kind == TOPUP:
+        return amount if approve else Decimal(0)
+    if reserved:
+        return Decimal(0) if approve else amount
+    # старая заявка без резерва: списываем при одобрении
+    return -amount if approve else Decimal(0)
+
+
+def decide(kind: str, ids: Iterable[int], approve: bool) -> Tuple[List[Decision], List[int], Dict[int, Decimal]]:
+    """
+    Одобряет/отклоняет заявки одной транзакцией.
+    Возвращает (решённые, id пропущенных — уже решены или решаются другим админом,
+    {пользователь: баланс после решения}).
+    """
+    model = KINDS[kind]
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return [], [], {}
+    columns = [model.id, model.user_id, model.amount] + ([Withdrawal.reserved] if kind == WITHDRAW else [])
+    with SessionLocal() as sess:
+        rows = sess.execute(
+            select(*columns)
+            .where(model.id.in_(ids), model.status == "pending")
+            .order_by(model.id)
+            .with_for_update(skip_locked=True)
+        ).all()
+        done = [
+            Decision(row.id, row.user_id, row.amount,
+                     _delta(kind, approve, row.amount, getattr(row, "reserved", False)))
+            for row in rows
+        ]
+        balances = {}
+        if done:
+            sess.execute(
+                update(model)
+                .where(model.id.in_([d.id for d in done]))
+                .values(status="approved" if approve else "rejected")
+                .execution_options(synchronize_session=False)
+            )
+            deltas = defaultdict(Decimal)
+            for d in done:
+                if d.delta:
+                    deltas[d.user_id] += d.delta
+            if deltas:
+                users = User.__table__
+                # один executemany; пользователи по порядку id — одинаковый порядок блокировок у всех админов
+                sess.execute(
+                    update(users)
+                    .where(users.c.id == bindparam("uid"))
+                    .values(balance=func.coalesce(users.c.balance, 0) + bindparam("delta")),
+                    [{"uid": uid, "delta": deltas[uid]} for uid in sorted(deltas)]
+                )
+            balances = dict(sess.execute(
+                select(User.id, User.balance).where(User.id.in_({d.user_id for d in done}))
+            ).all())
+        sess.commit()
+    done_ids = {d.id for d in done}
+    return done, [i for i in ids if i not in done_ids], balances
+
+
+def _user_message(kind: str, approve: bool, items: List[Decision], balance) -> str:
+    numbers = ", ".join(f"#{d.id}" for d in items)
+    total = money(sum(d.amount for d in items))
+    status = rus_status("approved" if approve else "rejected")
+    if kind == TOPUP:
+        text = (f"Ваше пополнение {numbers} на сумму {total} руб. «{status}»." if len(items) == 1
+                else f"Ваши пополнения {numbers} на сумму {total} руб. «{status}».")
+    elif approve:
+        text = f"Ваши средства ({total} руб.) отправлены на вывод! Заявки: {numbers}."
+    else:
+        text = (f"Ваша заявка на вывод {numbers} «{status}»." if len(items) == 1
+                else f"Ваши заявки на вывод {numbers} «{status}».")
+        refunded = sum(d.delta for d in items)
+        if refunded:
+            text += f"\nЗарезервированные {money(refunded)} руб. возвращены на баланс."
+    if any(d.delta for d in items) and balance is not None:
+        text += f"\nНовый баланс: {money(balance)} руб."
+    return text
+
+
+async def notify_users(bot: Bot, kind: str, done: List[Decision], approve: bool, balances: Dict[int, Decimal]):
+    """Одно сообщение пользователю на все его заявки из пачки."""
+    by_user: Dict[int, List[Decision]] = defaultdict(list)
+    for d in done:
+        by_user[d.user_id].append(d)
+    for user_id, items in by_user.items():
+        text = _user_message(kind, approve, items, balances.get(user_id))
+        for attempt in range(2):
+            try:
+                await bot.send_message(user_id, text)
+                break
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                # пользователь мог заблокировать бота — остальных всё равно уведомляем
+                print(f"Не удалось уведомить {user_id}: {e}")
+                break
+        if len(by_user) > 1:
+            await asyncio.sleep(NOTIFY_DELAY_SEC)
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Очередь
+# ────────────────────────────────────────────────────────────────────
+def pending_totals() -> Dict[str, Tuple[int, Decimal]]:
+    """{вид: (ожидает заявок, на сумму)}."""
+    totals = {}
+    with SessionLocal() as sess:
+        for kind, model in KINDS.items():
+            totals[kind] = sess.execute(
+                select(func.count(), func.coalesce(func.sum(model.amount), 0)).where(model.status == "pending")
+            ).one()
+    return totals
+
+
+def pending_page(kind: str, page: int) -> Tuple[List[tuple], bool]:
+    """Страница ожидающих заявок (старые сверху) и есть ли следующая."""
+    model = KINDS[kind]
+    with SessionLocal() as sess:
+        rows = sess.execute(
+            select(model.id, model.user_id, User.username, model.amount,
+                   model.payment_system, model.card_number, model.created_at)
+            .join(User, User.id == model.user_id, isouter=True)
+            .where(model.status == "pending")
+            .order_by(model.id)
+            .offset(page * FINANCE_PAGE_SIZE)
+            .limit(FINANCE_PAGE_SIZE + 1)
+        ).all()
+    return rows[:FINANCE_PAGE_SIZE], len(rows) > FINANCE_PAGE_SIZE
+
+
+def receipt_flags(topup_ids: List[int]) -> Dict[int, str]:
+    """Пометки чеков (receipts.py): ⚠️ — чек уже присылали, ⏳ — ещё не проверен."""
+    if not topup_ids:
+        return {}
+    flags = {}
+    with SessionLocal() as sess:
+        rows = sess.execute(
+            select(TopUp.id, TopUp.receipt_file_id, TopUp.receipt_file_unique_id,
+                   ReceiptFingerprint.sha256, ReceiptFingerprint.dhash)
+            .join(ReceiptFingerprint, ReceiptFingerprint.topup_id == TopUp.id, isouter=True)
+            .where(TopUp.id.in_(topup_ids))
+        ).all()
+        for topup_id, file_id, file_unique_id, sha256, image_hash in rows:
+            if sha256 is None:
+                if file_id:
+                    flags[topup_id] = "⏳"
+            elif receipts.find_duplicates(sess, topup_id, file_unique_id or "", sha256, image_hash):
+                flags[topup_id] = "⚠️"
+    return flags
+
+
+def selection_totals(kind: str, admin_id: int) -> Tuple[int, Decimal]:
+    """Отмеченные ещё ожидающие заявки: (сколько, на сумму). Решённые из отметок убираем."""
+    selected = _selected[(admin_id, kind)]
+    if not selected:
+        return 0, Decimal(0)
+    model = KINDS[kind]
+    with SessionLocal() as sess:
+        rows = sess.execute(
+            select(model.id, model.amount).where(model.id.in_(selected), model.status == "pending")
+        ).all()
+    selected.intersection_update(row.id for row in rows)
+    return len(rows), sum((row.amount for row in rows), Decimal(0))
+
+
+def _row_line(kind: str, row, flag: str) -> str:
+    who = f"@{row.username}" if row.username else str(row.user_id)
+    details = " ".join(v for v in (row.payment_system, row.card_number) if v)
+    line = f"#{row.id} · {who} · {money(row.amount)} руб."
+    if details:
+        line += f" · {details}"
+    if row.created_at:
+        line += f" · {row.created_at:%d.%m %H:%M}"
+    return f"{flag} {line}" if flag else line
+
+
+async def show_queue(bot: Bot, chat_id: int, admin_id: int, kind: str = TOPUP, page: int = 0,
+                     message_id: Optional[int] = None):
+    """Экран очереди: итоги, страница заявок с отметками и кнопки решений."""
+    page = max(0, page)
+    totals = pending_totals()
+    rows, has_next = pending_page(kind, page)
+    if not rows and page:
+        # страница опустела после решений — показываем предыдущую
+        return await show_queue(bot, chat_id, admin_id, kind, page - 1, message_id)
+    flags = receipt_flags([row.id for row in rows]) if kind == TOPUP else {}
+    selected = _selected[(admin_id, kind)]
+    count, total = selection_totals(kind, admin_id)
+
+    lines = [
+        f"💰 Финансы — {TITLES[kind].lower()}",
+        "Ожидают: " + ", ".join(
+            f"{TITLES[k].lower()} {n} на {money(s)} руб." for k, (n, s) in totals.items()
+        ),
+    ]
+    buttons: List[List[types.InlineKeyboardButton]] = []
+    if rows:
+        lines.append(f"\nСтраница {page + 1}:")
+        for row in rows:
+            lines.append(_row_line(kind, row, flags.get(row.id, "")))
+            mark = "☑️" if row.id in selected else "⬜"
+            buttons.append([ types.InlineKeyboardButton(
+                text=f"{mark} #{row.id} · {money(row.amount)} руб. {flags.get(row.id, '')}".rstrip(),
+                callback_data=callbacks.FINANCE_TOGGLE.pack(kind, row.id, page)
+            ) ])
+        if flags:
+            lines.append("\n⚠️ — чек уже присылали (не отмечается «всей страницей»), ⏳ — чек ещё проверяется.")
+        buttons.append([
+            types.InlineKeyboardButton(text="Отметить страницу", callback_data=callbacks.FINANCE_SELECT_PAGE.pack(kind, page)),
+            types.InlineKeyboardButton(text="Снять отметки", callback_data=callbacks.FINANCE_CLEAR.pack(kind, page)),
+        ])
+    else:
+        lines.append("\nОжидающих заявок нет.")
+    if count:
+        lines.append(f"\nОтмечено: {count} на {money(total)} руб.")
+        buttons.append([
+            types.InlineKeyboardButton(text=f"✅ Одобрить ({count})", callback_data=callbacks.FINANCE_APPLY.pack(kind, 1, page)),
+            types.InlineKeyboardButton(text=f"❌ Отклонить ({count})", callback_data=callbacks.FINANCE_APPLY.pack(kind, 0, page)),
+        ])
+
+    nav = []
+    if page:
+        nav.append(types.InlineKeyboardButton(text="⬅️", callback_data=callbacks.FINANCE_VIEW.pack(kind, page - 1)))
+    if has_next:
+        nav.append(types.InlineKeyboardButton(text="➡️", callback_data=callbacks.FINANCE_VIEW.pack(kind, page + 1)))
+    if nav:
+        buttons.append(nav)
+    other = WITHDRAW if kind == TOPUP else TOPUP
+    buttons.append([
+        types.InlineKeyboardButton(text=f"↔️ {TITLES[other]}", callback_data=callbacks.FINANCE_VIEW.pack(other, 0)),
+        types.InlineKeyboardButton(text="🔄 Обновить", callback_data=callbacks.FINANCE_VIEW.pack(kind, page)),
+    ])
+
+    text = "\n".join(lines)[:4000]
+    kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
+    if message_id:
+        try:
+            return await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=kb)
+        except TelegramAPIError as e:
+            if "message is not modified" not in str(e):
+                raise
+            return None
+    return await bot.send_message(chat_id, text, reply_markup=kb)
+
+
+def register_finance_handlers(bot: Bot, dp: Dispatcher):
+    cb = callbacks.get_router(dp)
+
+    @dp.message(lambda m: m.text == "Финансы")
+    async def finance_queue_menu(message: types.Message):
+        if message.chat.id not in ADMIN_IDS:
+            return None
+        return await show_queue(bot, message.chat.id, message.chat.id)
+
+    @cb.route(callbacks.FINANCE_VIEW, callbacks.FINANCE_TOGGLE, callbacks.FINANCE_SELECT_PAGE,
+              callbacks.FINANCE_CLEAR, callbacks.FINANCE_APPLY)
+    async def finance_queue_action(call: types.CallbackQuery, args: tuple):
+        admin_id = call.from_user.id
+        if admin_id not in ADMIN_IDS:
+            return await bot.answer_callback_query(call.id, "Нет прав.", show_alert=True)
+        kind, page = args[0], args[-1]
+        if kind not in KINDS:
+            return await bot.answer_callback_query(call.id, "Кнопка устарела.", show_alert=True)
+        selected = _selected[(admin_id, kind)]
+        data = call.data
+
+        done, approve, balances = [], False, {}
+        if data.startswith(callbacks.FINANCE_TOGGLE.prefix):
+            selected ^= {args[1]}
+            await bot.answer_callback_query(call.id)
+        elif data.startswith(callbacks.FINANCE_SELECT_PAGE.prefix):
+            rows, _ = pending_page(kind, page)
+            flags = receipt_flags([row.id for row in rows]) if kind == TOPUP else {}
+            selected.update(row.id for row in rows if flags.get(row.id) != "⚠️")
+            await bot.answer_callback_query(call.id)
+        elif data.startswith(callbacks.FINANCE_CLEAR.prefix):
+            selected.clear()
+            await bot.answer_callback_query(call.id)
+        elif data.startswith(callbacks.FINANCE_APPLY.prefix):
+            approve = bool(args[1])
+            done, skipped, balances = decide(kind, sorted(selected), approve)
+            selected.clear()
+            total = money(sum(d.amount for d in done))
+            note = f"{'Одобрено' if approve else 'Отклонено'}: {len(done)} на {total} руб."
+            if skipped:
+                note += f", пропущено (уже решены или решаются другим админом): {len(skipped)}"
+            print(f"finance: админ {admin_id} {'одобрил' if approve else 'отклонил'} "
+                  f"{TITLES[kind].lower()} {[d.id for d in done]}")
+            await bot.answer_callback_query(call.id, note, show_alert=bool(skipped))
+        else:
+            await bot.answer_callback_query(call.id)
+
+        await show_queue(bot, call.message.chat.id, admin_id, kind, page, call.message.message_id)
+        # уведомления — после обновления экрана: на сотнях заявок они идут не мгновенно
+        if done:
+            await notify_users(bot, kind, done, approve, balances)
+        return None
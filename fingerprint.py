@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Отпечатки объявлений для поиска дублей при подаче.
+
+Текст нормализуется (регистр, ё, пунктуация, пробелы) и разбивается на множество слов.
+По нему считаем MinHash из NUM_HASHES значений: доля совпавших позиций двух подписей —
+оценка сходства Жаккара их множеств слов. Подпись режем на BANDS полос по ROWS значений
+и каждую полосу сворачиваем в одно число: у похожих текстов хотя бы одна полоса почти
+наверняка совпадает целиком, у непохожих — почти никогда. Поэтому кандидаты ищутся
+точными совпадениями по индексам полос, а не перебором объявлений, и уже потом
+проверяются по всей подписи (DUPLICATE_SIMILARITY).
+Фото сравниваем по file_unique_id (он одинаков для одного и того же файла у всех ботов).
+
+Учитываются только живые объявления: на модерации или одобренные и активные.
+"""
+import hashlib
+import random
+import re
+import struct
+from dataclasses import dataclass, field
+from typing import Iterable, List, Sequence
+
+from sqlalchemy import or_, select
+
+from config import DUPLICATE_SIMILARITY
+from database import Ad, AdFingerprint, AdPhotoFingerprint
+
+NUM_HASHES = 32
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+# у коротких текстов оценка слишком шумная — для них дублем считаем только совпадение всех слов
+MIN_TOKENS = 5
+# сколько кандидатов по полосам проверять, не больше
+MAX_CANDIDATES = 50
+
+_PRIME = (1 << 61) - 1
+_MAX32 = (1 << 32) - 1
+# фиксированные коэффициенты хэш-функций h(x) = (a*x + b) mod p — одинаковые во всех процессах
+_rnd = random.Random(20261019)
+_COEFFS = [(_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+_SIGNATURE = struct.Struct(f">{NUM_HASHES}I")
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class Fingerprint:
+    minhash: List[int]                # NUM_HASHES беззнаковых 32-битных значений
+    tokens: int                       # число разных слов
+    photo_uids: List[str] = field(default_factory=list)
+
+    @property
+    def bands(self) -> List[int]:
+        return [_band(self.minhash[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+    @property
+    def min_similarity(self) -> float:
+        return DUPLICATE_SIMILARITY if self.tokens >= MIN_TOKENS else 1.0
+
+
+def normalize(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or "").lower().replace("ё", "е"))
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _band(values: Sequence[int]) -> int:
+    """Полоса подписи → знаковое 32-битное число для INTEGER-колонки."""
+    digest = hashlib.blake2b(struct.pack(f">{len(values)}I", *values), digest_size=4).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def minhash(tokens: Iterable[str]) -> List[int]:
+    hashes = [_hash64(t) for t in set(tokens)]
+    if not hashes:
+        return [_MAX32] * NUM_HASHES
+    return [min((a * h + b) % _PRIME for h in hashes) & _MAX32 for a, b in _COEFFS]
+
+
+def make(text: str, photo_uids: Iterable[str] = ()) -> Fingerprint:
+    tokens = set(normalize(text))
+    return Fingerprint(minhash(tokens), len(tokens), sorted(set(u for u in photo_uids if u)))
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """Оценка сходства Жаккара по двум подписям."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def _live(query, ad_id_col):
+    return query.join(Ad, Ad.id == ad_id_col).where(
+        Ad.status.in_(("pending", "approved")), Ad.is_active == True
+    )
+
+
+def find_duplicates(sess, fp: Fingerprint, limit: int = 5):
+    """
+    Живые объявления, похожие на отпечаток.
+    Возвращает (id с почти тем же текстом, id только с общими фото) — списки по возрастанию.
+    """
+    text_ids = set()
+    if fp.tokens:
+        columns = [getattr(AdFingerprint, f"band{i}") for i in range(BANDS)]
+        rows = sess.execute(
+            _live(select(AdFingerprint.ad_id, AdFingerprint.signature), AdFingerprint.ad_id)
+            .where(or_(*(col == value for col, value in zip(columns, fp.bands))))
+            .limit(MAX_CANDIDATES)
+        ).all()
+        text_ids = {
+            ad_id for ad_id, signature in rows
+            if similarity(_SIGNATURE.unpack(signature), fp.minhash) >= fp.min_similarity
+        }
+
+    photo_ids = set()
+    if fp.photo_uids:
+        photo_ids = set(sess.execute(
+            _live(select(AdPhotoFingerprint.ad_id).distinct(), AdPhotoFingerprint.ad_id)
+            .where(AdPhotoFingerprint.file_unique_id.in_(fp.photo_uids))
+            .limit(MAX_CANDIDATES)
+        ).scalars().all()) - text_ids
+    return sorted(text_ids)[:limit], sorted(photo_ids)[:limit]
+
+
+def record(sess, ad_id: int, fp: Fingerprint):
+    """Сохраняет отпечаток нового объявления (в транзакции самого объявления)."""
+    bands = {f"band{i}": value for i, value in enumerate(fp.bands)}
+    sess.add(AdFingerprint(ad_id=ad_id, signature=_SIGNATURE.pack(*fp.minhash), **bands))
+    for uid in fp.photo_uids:
+        sess.add(AdPhotoFingerprint(file_unique_id=uid, ad_id=ad_id))
+
+
+def duplicate_note(text_ids: List[int], photo_ids: List[int]) -> str:
+    """Строка-предупреждение для модератора (пустая, если дублей нет)."""
+    parts = []
+    if text_ids:
+        parts.append("текст как у " + ", ".join(f"#{i}" for i in text_ids))
+    if photo_ids:
+        parts.append("те же фото, что у " + ", ".join(f"#{i}" for i in photo_ids))
+    return f"⚠️ Возможный дубль: {'; '.join(parts)}\n" if parts else ""
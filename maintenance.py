@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Фоновое обслуживание БД: снятие объявлений с истёкшим сроком,
+напоминания владельцам о скором окончании размещения, снятие истёкших банов
+и перенос переписки давно закрытых чатов/тикетов в архив (archive.py).
+
+Всё делается пачками UPDATE ... RETURNING, без загрузки объектов в сессию,
+а владельцы получают одно сообщение на все свои объявления сразу.
+Работа с БД синхронная и идёт в потоке (asyncio.to_thread), чтобы не останавливать
+цикл событий; в цикле — только отправка сообщений.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from aiogram import Bot
+from sqlalchemy import select, update
+
+import archive
+import counters
+import search_cache
+from config import AD_EXPIRY_BATCH_SIZE, AD_EXPIRY_REMIND_DAYS, MAINTENANCE_INTERVAL_SEC
+from database import SessionLocal, Ad, User
+
+# пауза между личными сообщениями, чтобы не упираться в лимиты Telegram
+NOTIFY_DELAY_SEC = 0.05
+
+
+def _batched_update(where, values: dict, *returning, on_batch: Optional[Callable] = None) -> List[tuple]:
+    """
+    Обновляет строки ads, подходящие под `where`, пачками по AD_EXPIRY_BATCH_SIZE.
+    Каждая пачка — отдельная короткая транзакция; занятые строки пропускаем (SKIP LOCKED).
+    on_batch(sess, rows) вызывается внутри транзакции пачки, до коммита.
+    Возвращает список кортежей `returning` по всем обновлённым строкам.
+    """
+    result: List[tuple] = []
+    while True:
+        batch_ids = (
+            select(Ad.id)
+            .where(*where)
+            .order_by(Ad.expires_at)
+            .limit(AD_EXPIRY_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        with SessionLocal() as sess:
+            rows = sess.execute(
+                update(Ad)
+                .where(Ad.id.in_(batch_ids))
+                .values(**values)
+                .returning(*returning)
+                .execution_options(synchronize_session=False)
+            ).all()
+            if on_batch and rows:
+                on_batch(sess, rows)
+            sess.commit()
+        result.extend(tuple(r) for r in rows)
+        if len(rows) < AD_EXPIRY_BATCH_SIZE:
+            return result
+
+
+def _group_by_owner(rows: List[tuple]) -> Dict[int, List[tuple]]:
+    by_owner: Dict[int, List[tuple]] = defaultdict(list)
+    for row in rows:
+        by_owner[row[1]].append(row)
+    return by_owner
+
+
+async def _notify(bot: Bot, user_id: int, text: str):
+    try:
+        await bot.send_message(user_id, text)
+    except Exception as e:
+        # пользователь мог заблокировать бота — это не повод останавливать рассылку
+        print(f"Не удалось уведомить {user_id}: {e}")
+    await asyncio.sleep(NOTIFY_DELAY_SEC)
+
+
+def _on_expired_batch(sess, batch: List[tuple]):
+    # UPDATE идёт мимо ORM, поэтому счётчики и кэш поиска правим сами, в той же транзакции
+    deltas = counters.deltas_for_removed(r[2:] for r in batch)
+    counters.apply_deltas(sess.connection(), deltas)
+    search_cache.mark_dirty(sess, deltas)
+
+
+async def expire_ads(bot: Bot) -> int:
+    """Деактивирует опубликованные объявления с истёкшим сроком. Возвращает их количество."""
+    now = datetime.utcnow()
+    # срок идёт только у одобренных: ожидающие модерации и отклонённые не трогаем
+    rows = await asyncio.to_thread(
+        _batched_update,
+        (Ad.is_active == True, Ad.status == "approved", Ad.expires_at <= now),
+        {"is_active": False},
+        Ad.id, Ad.user_id, Ad.status, Ad.city, Ad.category, Ad.subcategory,
+        on_batch=_on_expired_batch
+    )
+    for owner_id, owner_rows in _group_by_owner(rows).items():
+        ids = ", ".join(f"#{ad_id}" for ad_id in sorted(r[0] for r in owner_rows))
+        await _notify(
+            bot, owner_id,
+            f"⛔️ Срок размещения истёк, объявления сняты с публикации: {ids}.\n"
+            f"Продлить их можно в «Личный кабинет» → «Мои объявления»."
+        )
+    return len(rows)
+
+
+async def remind_expiring_ads(bot: Bot) -> int:
+    """Одно напоминание на владельца о объявлениях, которые скоро истекут."""
+    now = datetime.utcnow()
+    rows = await asyncio.to_thread(
+        _batched_update,
+        (
+            Ad.is_active == True,
+            Ad.status == "approved",
+            Ad.expiry_reminded == False,
+            Ad.expires_at > now,
+            Ad.expires_at <= now + timedelta(days=AD_EXPIRY_REMIND_DAYS),
+        ),
+        {"expiry_reminded": True},
+        Ad.id, Ad.user_id, Ad.expires_at
+    )
+    for owner_id, owner_rows in _group_by_owner(rows).items():
+        lines = "\n".join(
+            f"#{ad_id} — до {expires_at:%d.%m.%Y}" for ad_id, _, expires_at in sorted(owner_rows)
+        )
+        await _notify(
+            bot, owner_id,
+            f"⏳ Скоро закончится срок размещения объявлений:\n{lines}\n\n"
+            f"Продлить их можно в «Личный кабинет» → «Мои объявления»."
+        )
+    return len(rows)
+
+
+def _lift_bans(now: datetime) -> List[int]:
+    with SessionLocal() as sess:
+        user_ids = sess.execute(
+            update(User)
+            .where(User.is_banned == True, User.ban_until <= now)
+            .values(is_banned=False, ban_reason=None, ban_until=None)
+            .returning(User.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        sess.commit()
+    return user_ids
+
+
+async def lift_expired_bans(bot: Bot) -> int:
+    """Снимает все истёкшие временные баны одним UPDATE и сообщает пользователям."""
+    user_ids = await asyncio.to_thread(_lift_bans, datetime.utcnow())
+    for user_id in user_ids:
+        await _notify(bot, user_id, "✅ Срок блокировки истёк, ограничения сняты.")
+    return len(user_ids)
+
+
+async def run_maintenance(bot: Bot):
+    try:
+        expired = await expire_ads(bot)
+        reminded = await remind_expiring_ads(bot)
+        unbanned = await lift_expired_bans(bot)
+        archived = await asyncio.to_thread(archive.archive_closed)
+        if expired or reminded or unbanned or archived:
+            print(f"maintenance: снято {expired}, напоминаний {reminded}, разбанено {unbanned}, в архив {archived}")
+    except Exception as e:
+        print("Ошибка в run_maintenance:", e)
+
+
+async def maintenance_loop(bot: Bot):
+    """
+    Фоновая задача обслуживания (запускается в on_startup, см. bot.py).
+    Раз в MAINTENANCE_INTERVAL_SEC секунд снимаем истёкшие объявления и баны, шлём напоминания.
+    """
+    while True:
+        await run_maintenance(bot)
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SEC)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Метрики латентности: сколько времени занимает каждый хендлер и из чего это время
+складывается — запросы к БД, вызовы Telegram Bot API и всё остальное.
+
+• MetricsMiddleware (outer, dp.update) меряет апдейт целиком и считает ошибки;
+• внутренняя мидлварь на каждом типе событий подписывает апдейт именем хендлера
+  (для callback_query имя уточняет CallbackRouter, см. callbacks.py);
+• события engine и мидлварь сессии бота добавляют время БД / API к текущему апдейту
+  через contextvar. Запросы вне апдейтов (фоновые потоки) идут в отдельные гистограммы.
+
+Всё хранится в памяти процесса: фиксированные бакеты, несколько счётчиков на хендлер.
+Отдаётся командой «/admin stats» и (если задан METRICS_PORT) текстом Prometheus на /metrics.
+"""
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from sqlalchemy import event
+
+from database import engine
+
+# верхние границы бакетов, секунды (последний бакет — +Inf)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+UNHANDLED = "unhandled"
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри бакета."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class _HandlerStats:
+    __slots__ = ("latency", "db_seconds", "db_queries", "api_seconds", "api_calls", "errors")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.api_seconds = 0.0
+        self.api_calls = 0
+        self.errors = 0
+
+
+class _UpdateTiming:
+    """Накопитель времени одного апдейта (живёт в contextvar)."""
+    __slots__ = ("handler", "db_seconds", "db_queries", "api_seconds", "api_calls")
+
+    def __init__(self):
+        self.handler = UNHANDLED
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.api_seconds = 0.0
+        self.api_calls = 0
+
+
+_current: ContextVar[Optional[_UpdateTiming]] = ContextVar("metrics_update", default=None)
+
+# БД и Bot API трогают и фоновые потоки, поэтому общий lock
+_lock = threading.Lock()
+_handlers: Dict[str, _HandlerStats] = {}
+_api_methods: Dict[str, Histogram] = {}
+_db_background = Histogram()
+
+
+def handler_name(callback: Callable) -> str:
+    return f"{callback.__module__}.{callback.__name__}"
+
+
+def label_handler(callback: Optional[Callable]):
+    """Подписывает текущий апдейт именем хендлера (None — апдейт никто не обработал)."""
+    timing = _current.get()
+    if timing is not None:
+        timing.handler = handler_name(callback) if callback else UNHANDLED
+
+
+def current_handler() -> Optional[str]:
+    """Имя хендлера текущего апдейта (None — вне апдейта)."""
+    timing = _current.get()
+    return timing.handler if timing is not None else None
+
+
+def _record_update(timing: _UpdateTiming, elapsed: float, failed: bool):
+    with _lock:
+        stats = _handlers.get(timing.handler)
+        if stats is None:
+            stats = _handlers[timing.handler] = _HandlerStats()
+        stats.latency.observe(elapsed)
+        stats.db_seconds += timing.db_seconds
+        stats.db_queries += timing.db_queries
+        stats.api_seconds += timing.api_seconds
+        stats.api_calls += timing.api_calls
+        if failed:
+            stats.errors += 1
+
+
+# ─────────────────────────── мидлвари ───────────────────────────
+class MetricsMiddleware(BaseMiddleware):
+    """Outer-мидлварь апдейта: полное время обработки и ошибки."""
+
+    async def __call__(self, handler: Callable[..., Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+        timing = _UpdateTiming()
+        token = _current.set(timing)
+        start = perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _current.reset(token)
+            _record_update(timing, perf_counter() - start, failed)
+
+
+class _HandlerLabelMiddleware(BaseMiddleware):
+    """Внутренняя мидлварь: к этому моменту aiogram уже выбрал хендлер."""
+
+    async def __call__(self, handler: Callable[..., Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+        label_handler(data["handler"].callback)
+        return await handler(event, data)
+
+
+class _ApiTimingMiddleware(BaseRequestMiddleware):
+    """Время каждого вызова Bot API — по методам и в копилку текущего апдейта."""
+
+    async def __call__(self, make_request, bot: Bot, method):
+        start = perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            elapsed = perf_counter() - start
+            timing = _current.get()
+            if timing is not None:
+                timing.api_seconds += elapsed
+                timing.api_calls += 1
+            name = type(method).__name__
+            with _lock:
+                hist = _api_methods.get(name)
+                if hist is None:
+                    hist = _api_methods[name] = Histogram()
+                hist.observe(elapsed)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = perf_counter() - started
+    timing = _current.get()
+    if timing is not None:
+        timing.db_seconds += elapsed
+        timing.db_queries += 1
+    else:
+        with _lock:
+            _db_background.observe(elapsed)
+
+
+def install(dp: Dispatcher, bot: Bot):
+    """Подключает сбор метрик к Dispatcher, сессии бота и engine."""
+    dp.update.outer_middleware(MetricsMiddleware())
+    label = _HandlerLabelMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(label)
+    bot.session.middleware(_ApiTimingMiddleware())
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ─────────────────────────── вывод ───────────────────────────
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}"
+
+
+def summary_text(limit: int = 15) -> str:
+    """Короткая сводка для «/admin stats»: самые медленные хендлеры по p99."""
+    with _lock:
+        rows = sorted(_handlers.items(), key=lambda kv: kv[1].latency.quantile(0.99), reverse=True)[:limit]
+        api = sorted(_api_methods.items(), key=lambda kv: kv[1].total, reverse=True)[:5]
+        lines = ["Латентность хендлеров (мс, p50/p95/p99):"]
+        for name, st in rows:
+            lat = st.latency
+            lines.append(
+                f"• {name}: n={lat.count}, {_ms(lat.quantile(0.5))}/{_ms(lat.quantile(0.95))}/{_ms(lat.quantile(0.99))}, "
+                f"БД {_ms(st.db_seconds / lat.count)} мс ({st.db_queries / lat.count:.1f} запр.), "
+                f"API {_ms(st.api_seconds / lat.count)} мс, ошибок {st.errors}"
+            )
+        if not rows:
+            lines.append("пока нет данных")
+        if api:
+            lines.append("\nBot API (мс, p50/p99):")
+            for name, hist in api:
+                lines.append(f"• {name}: n={hist.count}, {_ms(hist.quantile(0.5))}/{_ms(hist.quantile(0.99))}")
+        if _db_background.count:
+            lines.append(
+                f"\nБД вне апдейтов: {_db_background.count} запр., p99 {_ms(_db_background.quantile(0.99))} мс"
+            )
+    return "\n".join(lines)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _histogram_lines(metric: str, labels: str, hist: Histogram) -> List[str]:
+    sep = "," if labels else ""
+    out, cumulative = [], 0
+    for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+        cumulative += n
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        out.append(f'{metric}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    out.append(f"{metric}_sum{suffix} {hist.total}")
+    out.append(f"{metric}_count{suffix} {hist.count}")
+    return out
+
+
+def render_prometheus() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    with _lock:
+        lines = [
+            "# HELP adix_handler_seconds Полное время обработки апдейта по хендлерам.",
+            "# TYPE adix_handler_seconds histogram",
+        ]
+        for name, st in _handlers.items():
+            lines += _histogram_lines("adix_handler_seconds", f'handler="{_escape(name)}"', st.latency)
+        for metric, attr, kind in (
+            ("adix_handler_db_seconds_total", "db_seconds", "counter"),
+            ("adix_handler_db_queries_total", "db_queries", "counter"),
+            ("adix_handler_api_seconds_total", "api_seconds", "counter"),
+            ("adix_handler_api_calls_total", "api_calls", "counter"),
+            ("adix_handler_errors_total", "errors", "counter"),
+        ):
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, st in _handlers.items():
+                lines.append(f'{metric}{{handler="{_escape(name)}"}} {getattr(st, attr)}')
+        lines += [
+            "# HELP adix_telegram_api_seconds Время вызовов Bot API по методам.",
+            "# TYPE adix_telegram_api_seconds histogram",
+        ]
+        for name, hist in _api_methods.items():
+            lines += _histogram_lines("adix_telegram_api_seconds", f'method="{_escape(name)}"', hist)
+        lines += [
+            "# HELP adix_db_background_seconds Запросы к БД вне апдейтов (фоновые потоки).",
+            "# TYPE adix_db_background_seconds histogram",
+        ]
+        lines += _histogram_lines("adix_db_background_seconds", "", _db_background)
+    return "\n".join(lines) + "\n"
+
+
+async def start_http_server(host: str, port: int):
+    """Поднимает GET /metrics на aiohttp (он уже есть как зависимость aiogram)."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,52 @@
+"""
+Окружение Alembic: подключение из database.py, метаданные моделей — для --autogenerate.
+
+Каждая миграция идёт в своей транзакции (transaction_per_migration), чтобы
+create_index_concurrently (migrations/online.py) мог выйти из неё в autocommit.
+"""
+import os
+import sys
+
+from alembic import context
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Base, DATABASE_URI, engine  # noqa: E402
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    """«alembic upgrade head --sql»: только печатает SQL, в БД не ходит."""
+    context.configure(
+        url=DATABASE_URI,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    lock_timeout = config.get_main_option("lock_timeout")
+    with engine.connect() as connection:
+        if lock_timeout:
+            connection.execute(text(f"SET lock_timeout = '{lock_timeout}'"))
+            connection.commit()
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            compare_server_default=True,
+            transaction_per_migration=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,21 @@
+"""
+Операции для миграций без простоя.
+
+CREATE/DROP INDEX CONCURRENTLY не блокируют запись в таблицу, но не могут идти
+внутри транзакции — выполняем их в autocommit-блоке Alembic. Если такое создание
+индекса прервалось, PostgreSQL оставляет INVALID-индекс: повторный upgrade его
+не пересоздаст (IF NOT EXISTS), его нужно сначала удалить drop_index_concurrently.
+"""
+from typing import Sequence
+
+from alembic import op
+
+
+def create_index_concurrently(name: str, table: str, columns: Sequence, **kw):
+    with op.get_context().autocommit_block():
+        op.create_index(name, table, list(columns), postgresql_concurrently=True, if_not_exists=True, **kw)
+
+
+def drop_index_concurrently(name: str, table: str):
+    with op.get_context().autocommit_block():
+        op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,196 @@
+"""Начальная схема: таблицы, которые создавал init_db (create_all) до перехода на миграции.
+
+Revision ID: 0001_initial
+Revises:
+Create Date: 2026-10-19
+
+Новая БД: «alembic upgrade head».
+Существующая БД (создавалась init_db/create_all) совпадает с этой ревизией:
+«alembic stamp 0001_initial», затем «alembic upgrade head» — следующие ревизии
+(начиная с 0001a_ad_expiry_counters) добавят то, чего в ней ещё нет.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_initial"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chat_groups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('title', sa.String(), nullable=False),
+    sa.Column('region', sa.String(), nullable=False),
+    sa.Column('price_1', sa.Float(), nullable=True),
+    sa.Column('price_5', sa.Float(), nullable=True),
+    sa.Column('price_10', sa.Float(), nullable=True),
+    sa.Column('price_pin', sa.Float(), nullable=True),
+    sa.Column('participants', sa.Integer(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chat_id')
+    )
+    op.create_index(op.f('ix_chat_groups_id'), 'chat_groups', ['id'], unique=False)
+    op.create_table('users',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('username', sa.String(), nullable=True),
+    sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('ref_id', sa.BigInteger(), nullable=True),
+    sa.Column('is_banned', sa.Boolean(), nullable=True),
+    sa.Column('inn', sa.String(), nullable=True),
+    sa.Column('full_name', sa.String(), nullable=True),
+    sa.Column('company_name', sa.String(), nullable=True),
+    sa.Column('ban_reason', sa.String(), nullable=True),
+    sa.Column('ban_until', sa.DateTime(), nullable=True),
+    sa.Column('last_active', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ref_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_table('ads',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('inline_button_text', sa.String(), nullable=True),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=True),
+    sa.Column('category', sa.String(), nullable=True),
+    sa.Column('subcategory', sa.String(), nullable=True),
+    sa.Column('city', sa.String(), nullable=True),
+    sa.Column('photos', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('ad_type', sa.String(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=False),
+    sa.Column('selected_chat_ids', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ads_id'), 'ads', ['id'], unique=False)
+    op.create_table('support_tickets',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('topups',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('payment_system', sa.String(), nullable=True),
+    sa.Column('card_number', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('withdrawals',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('ad_chats',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('ad_id', sa.Integer(), nullable=False),
+    sa.Column('buyer_id', sa.BigInteger(), nullable=False),
+    sa.Column('seller_id', sa.BigInteger(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ad_id'], ['ads.id'], ),
+    sa.ForeignKeyConstraint(['buyer_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['seller_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('ad_complaints',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('ad_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ad_id'], ['ads.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('ad_feedback',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('ad_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.BigInteger(), nullable=False),
+    sa.Column('rating', sa.Integer(), nullable=True),
+    sa.Column('comment', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['ad_id'], ['ads.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('sales',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('ad_id', sa.Integer(), nullable=False),
+    sa.Column('buyer_id', sa.BigInteger(), nullable=False),
+    sa.Column('seller_id', sa.BigInteger(), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=10, scale=2), nullable=True),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ad_id'], ['ads.id'], ),
+    sa.ForeignKeyConstraint(['buyer_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['seller_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('scheduled_posts',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('ad_id', sa.Integer(), nullable=False),
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('next_post_time', sa.DateTime(), nullable=False),
+    sa.Column('posts_left', sa.Integer(), nullable=True),
+    sa.Column('interval_minutes', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['ad_id'], ['ads.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('support_messages',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('sender_id', sa.BigInteger(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['ticket_id'], ['support_tickets.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('ad_chat_messages',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('sender_id', sa.BigInteger(), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['chat_id'], ['ad_chats.id'], ),
+    sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ad_chat_messages')
+    op.drop_table('support_messages')
+    op.drop_table('scheduled_posts')
+    op.drop_table('sales')
+    op.drop_table('ad_feedback')
+    op.drop_table('ad_complaints')
+    op.drop_table('ad_chats')
+    op.drop_table('withdrawals')
+    op.drop_table('topups')
+    op.drop_table('support_tickets')
+    op.drop_index(op.f('ix_ads_id'), table_name='ads')
+    op.drop_table('ads')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_table('users')
+    op.drop_index(op.f('ix_chat_groups_id'), table_name='chat_groups')
+    op.drop_table('chat_groups')
@@ -0,0 +1,56 @@
+"""Срок размещения объявлений и счётчики поиска: ads.expires_at/expiry_reminded, ad_counters, индексы ads.
+
+Revision ID: 0001a_ad_expiry_counters
+Revises: 0001_initial
+Create Date: 2026-10-19
+
+Раньше эти объекты добавлял init_db при старте бота; теперь — эта ревизия, в том
+числе для БД, помеченной «alembic stamp 0001_initial».
+
+expires_at добавляется nullable без DEFAULT, expiry_reminded — с константным
+DEFAULT false: в PostgreSQL это изменение только каталога, таблица не переписывается.
+Уже одобренным объявлениям expires_at считается от created_at (AD_LIFETIME_DAYS),
+чтобы их снимал фоновый обход maintenance.py; ожидающие модерации получат срок
+при одобрении (utils.renew_ad_expiry), отклонённым он не нужен. ad_counters создаётся пустой —
+counters.rebuild() заполняет её при старте бота. Индексы ads строятся CONCURRENTLY.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from config import AD_LIFETIME_DAYS
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0001a_ad_expiry_counters"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("ads", sa.Column("expires_at", sa.DateTime(), nullable=True))
+    op.add_column("ads", sa.Column("expiry_reminded", sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.execute(
+        sa.text("UPDATE ads SET expires_at = created_at + make_interval(days => :days) "
+                "WHERE expires_at IS NULL AND created_at IS NOT NULL AND status = 'approved'")
+        .bindparams(days=AD_LIFETIME_DAYS)
+    )
+
+    op.create_table(
+        "ad_counters",
+        sa.Column("city", sa.String(), nullable=False),
+        sa.Column("category", sa.String(), nullable=False),
+        sa.Column("subcategory", sa.String(), nullable=False),
+        sa.Column("cnt", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("city", "category", "subcategory"),
+    )
+
+    create_index_concurrently("ix_ads_is_active_expires_at", "ads", ["is_active", "expires_at"])
+    create_index_concurrently("ix_ads_user_id_created_at", "ads", ["user_id", "created_at"])
+
+
+def downgrade():
+    drop_index_concurrently("ix_ads_user_id_created_at", "ads")
+    drop_index_concurrently("ix_ads_is_active_expires_at", "ads")
+    op.drop_table("ad_counters")
+    op.drop_column("ads", "expiry_reminded")
+    op.drop_column("ads", "expires_at")
@@ -0,0 +1,50 @@
+"""Архив переписки: closed_at у чатов и тикетов, message_archives, индексы сообщений.
+
+Revision ID: 0002_message_archive
+Revises: 0001a_ad_expiry_counters
+Create Date: 2026-10-19
+
+Уже закрытым чатам/тикетам closed_at ставим на момент миграции — они уйдут
+в архив через ARCHIVE_AFTER_DAYS, как и закрытые после неё.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0002_message_archive"
+down_revision = "0001a_ad_expiry_counters"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # nullable без DEFAULT — в PostgreSQL это изменение только каталога, таблица не переписывается
+    op.add_column("ad_chats", sa.Column("closed_at", sa.DateTime(), nullable=True))
+    op.add_column("support_tickets", sa.Column("closed_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE ad_chats SET closed_at = now() WHERE status = 'closed' AND closed_at IS NULL")
+    op.execute("UPDATE support_tickets SET closed_at = now() WHERE status = 'closed' AND closed_at IS NULL")
+
+    op.create_table(
+        "message_archives",
+        sa.Column("kind", sa.String(length=16), nullable=False),
+        sa.Column("parent_id", sa.Integer(), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("first_at", sa.DateTime(), nullable=True),
+        sa.Column("last_at", sa.DateTime(), nullable=True),
+        sa.Column("payload", sa.LargeBinary(), nullable=False),
+        sa.Column("archived_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("kind", "parent_id"),
+    )
+
+    # таблицы сообщений уже большие — индексы строим без блокировки записи
+    create_index_concurrently("ix_ad_chat_messages_chat_id_created_at", "ad_chat_messages", ["chat_id", "created_at"])
+    create_index_concurrently("ix_support_messages_ticket_id_created_at", "support_messages", ["ticket_id", "created_at"])
+
+
+def downgrade():
+    drop_index_concurrently("ix_support_messages_ticket_id_created_at", "support_messages")
+    drop_index_concurrently("ix_ad_chat_messages_chat_id_created_at", "ad_chat_messages")
+    op.drop_table("message_archives")
+    op.drop_column("support_tickets", "closed_at")
+    op.drop_column("ad_chats", "closed_at")
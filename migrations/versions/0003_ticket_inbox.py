@@ -0,0 +1,60 @@
+"""Входящие поддержки: активность, превью и непрочитанные прямо в support_tickets.
+
+Revision ID: 0003_ticket_inbox
+Revises: 0002_message_archive
+Create Date: 2026-10-19
+
+Существующим тикетам активность, превью и число сообщений заполняем
+из support_messages (или из архива), непрочитанные начинаем с нуля.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0003_ticket_inbox"
+down_revision = "0002_message_archive"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # константный DEFAULT в PostgreSQL 11+ тоже не переписывает таблицу
+    op.add_column("support_tickets", sa.Column("last_activity_at", sa.DateTime(), nullable=True))
+    op.add_column("support_tickets", sa.Column("last_message_preview", sa.String(length=100), nullable=True))
+    for name in ("message_count", "unread_by_admin", "unread_by_user"):
+        op.add_column("support_tickets", sa.Column(name, sa.Integer(), server_default="0", nullable=False))
+
+    op.execute("""
+        UPDATE support_tickets t
+           SET message_count = m.cnt, last_activity_at = m.last_at
+          FROM (SELECT ticket_id, count(*) AS cnt, max(created_at) AS last_at
+                  FROM support_messages GROUP BY ticket_id) m
+         WHERE t.id = m.ticket_id
+    """)
+    op.execute("""
+        UPDATE support_tickets t
+           SET last_message_preview = left(regexp_replace(m.text, '\\s+', ' ', 'g'), 100)
+          FROM (SELECT DISTINCT ON (ticket_id) ticket_id, text
+                  FROM support_messages ORDER BY ticket_id, created_at DESC, id DESC) m
+         WHERE t.id = m.ticket_id
+    """)
+    op.execute("""
+        UPDATE support_tickets t
+           SET message_count = a.message_count, last_activity_at = a.last_at
+          FROM message_archives a
+         WHERE a.kind = 'ticket' AND a.parent_id = t.id
+    """)
+    op.execute("UPDATE support_tickets SET last_activity_at = created_at WHERE last_activity_at IS NULL")
+
+    create_index_concurrently("ix_support_tickets_status_last_activity_at", "support_tickets",
+                              ["status", "last_activity_at"])
+    create_index_concurrently("ix_support_tickets_user_id_last_activity_at", "support_tickets",
+                              ["user_id", "last_activity_at"])
+
+
+def downgrade():
+    drop_index_concurrently("ix_support_tickets_user_id_last_activity_at", "support_tickets")
+    drop_index_concurrently("ix_support_tickets_status_last_activity_at", "support_tickets")
+    for name in ("unread_by_user", "unread_by_admin", "message_count", "last_message_preview", "last_activity_at"):
+        op.drop_column("support_tickets", name)
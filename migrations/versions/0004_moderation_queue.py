@@ -0,0 +1,29 @@
+"""Очередь модерации: бронь объявлений за модератором и индекс ожидающих.
+
+Revision ID: 0004_moderation_queue
+Revises: 0003_ticket_inbox
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0004_moderation_queue"
+down_revision = "0003_ticket_inbox"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("ads", sa.Column("claimed_by", sa.BigInteger(), nullable=True))
+    op.add_column("ads", sa.Column("claimed_until", sa.DateTime(), nullable=True))
+    # частичный индекс: в нём только ожидающие модерации, он остаётся крошечным
+    create_index_concurrently("ix_ads_pending_created_at", "ads", ["created_at"],
+                              postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    drop_index_concurrently("ix_ads_pending_created_at", "ads")
+    op.drop_column("ads", "claimed_until")
+    op.drop_column("ads", "claimed_by")
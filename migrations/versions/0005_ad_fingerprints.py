@@ -0,0 +1,46 @@
+"""Отпечатки объявлений для поиска дублей (fingerprint.py).
+
+Revision ID: 0005_ad_fingerprints
+Revises: 0004_moderation_queue
+Create Date: 2026-10-19
+
+Таблицы новые и пустые — индексы создаются вместе с ними, без CONCURRENTLY.
+Отпечатки заводятся для объявлений, поданных после миграции.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_ad_fingerprints"
+down_revision = "0004_moderation_queue"
+branch_labels = None
+depends_on = None
+
+BANDS = [f"band{i}" for i in range(8)]
+
+
+def upgrade():
+    op.create_table(
+        "ad_fingerprints",
+        sa.Column("ad_id", sa.Integer(), nullable=False),
+        sa.Column("signature", sa.LargeBinary(), nullable=False),
+        *(sa.Column(band, sa.Integer(), nullable=False) for band in BANDS),
+        sa.ForeignKeyConstraint(["ad_id"], ["ads.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("ad_id"),
+    )
+    for band in BANDS:
+        op.create_index(op.f(f"ix_ad_fingerprints_{band}"), "ad_fingerprints", [band], unique=False)
+
+    op.create_table(
+        "ad_photo_fingerprints",
+        sa.Column("file_unique_id", sa.String(), nullable=False),
+        sa.Column("ad_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["ad_id"], ["ads.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("file_unique_id", "ad_id"),
+    )
+
+
+def downgrade():
+    op.drop_table("ad_photo_fingerprints")
+    for band in reversed(BANDS):
+        op.drop_index(op.f(f"ix_ad_fingerprints_{band}"), table_name="ad_fingerprints")
+    op.drop_table("ad_fingerprints")
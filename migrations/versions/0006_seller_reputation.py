@@ -0,0 +1,66 @@
+"""Репутация продавца: seller_id в ad_feedback и агрегат seller_reputation.
+
+Revision ID: 0006_seller_reputation
+Revises: 0005_ad_fingerprints
+Create Date: 2026-10-19
+
+seller_id существующих отзывов и агрегаты по уже одобренным отзывам
+заполняются из ads / ad_feedback.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0006_seller_reputation"
+down_revision = "0005_ad_fingerprints"
+branch_labels = None
+depends_on = None
+
+# сколько последних отзывов кладём в агрегат при заполнении (SELLER_FEEDBACK_PAGE_SIZE по умолчанию)
+RECENT = 5
+
+
+def upgrade():
+    op.add_column("ad_feedback", sa.Column("seller_id", sa.BigInteger(), nullable=True))
+    op.execute("""
+        UPDATE ad_feedback f
+           SET seller_id = a.user_id
+          FROM ads a
+         WHERE a.id = f.ad_id AND f.seller_id IS NULL
+    """)
+
+    op.create_table(
+        "seller_reputation",
+        sa.Column("seller_id", sa.BigInteger(), nullable=False),
+        sa.Column("feedback_count", sa.Integer(), nullable=False),
+        sa.Column("rating_count", sa.Integer(), nullable=False),
+        sa.Column("rating_sum", sa.Integer(), nullable=False),
+        sa.Column("last_feedback_at", sa.DateTime(), nullable=True),
+        sa.Column("recent", sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(["seller_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("seller_id"),
+    )
+    op.execute(f"""
+        INSERT INTO seller_reputation
+               (seller_id, feedback_count, rating_count, rating_sum, last_feedback_at, recent)
+        SELECT f.seller_id, count(*), count(f.rating), coalesce(sum(f.rating), 0), max(f.created_at),
+               (SELECT coalesce(json_agg(json_build_array(r.id, r.rating, r.comment,
+                                                          to_char(r.created_at, 'YYYY-MM-DD"T"HH24:MI:SS'))
+                                         ORDER BY r.id DESC), '[]')::text
+                  FROM (SELECT id, rating, comment, created_at
+                          FROM ad_feedback
+                         WHERE seller_id = f.seller_id AND status = 'approved'
+                         ORDER BY id DESC LIMIT {RECENT}) r)
+          FROM ad_feedback f
+         WHERE f.status = 'approved' AND f.seller_id IS NOT NULL
+         GROUP BY f.seller_id
+    """)
+
+    create_index_concurrently("ix_ad_feedback_seller_id_status_id", "ad_feedback", ["seller_id", "status", "id"])
+
+
+def downgrade():
+    drop_index_concurrently("ix_ad_feedback_seller_id_status_id", "ad_feedback")
+    op.drop_table("seller_reputation")
+    op.drop_column("ad_feedback", "seller_id")
@@ -0,0 +1,23 @@
+"""Частичный индекс для снятия истёкших банов (maintenance.lift_expired_bans).
+
+Revision ID: 0007_ban_expiry_index
+Revises: 0006_seller_reputation
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0007_ban_expiry_index"
+down_revision = "0006_seller_reputation"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index_concurrently("ix_users_banned_ban_until", "users", ["ban_until"],
+                              postgresql_where=sa.text("is_banned"))
+
+
+def downgrade():
+    drop_index_concurrently("ix_users_banned_ban_until", "users")
@@ -0,0 +1,25 @@
+"""Пороги антифлуда для отдельных чатов биржи (antiflood.py).
+
+Revision ID: 0008_chat_flood_rules
+Revises: 0007_ban_expiry_index
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_chat_flood_rules"
+down_revision = "0007_ban_expiry_index"
+branch_labels = None
+depends_on = None
+
+COLUMNS = ("flood_max_messages", "flood_window_sec", "flood_max_duplicates")
+
+
+def upgrade():
+    for name in COLUMNS:
+        op.add_column("chat_groups", sa.Column(name, sa.Integer(), nullable=True))
+
+
+def downgrade():
+    for name in reversed(COLUMNS):
+        op.drop_column("chat_groups", name)
@@ -0,0 +1,41 @@
+"""Сохранённые поиски и уведомления о новых объявлениях (saved_searches.py).
+
+Revision ID: 0009_saved_searches
+Revises: 0008_chat_flood_rules
+Create Date: 2026-10-19
+
+Таблица новая и пустая — индексы создаются вместе с ней, без CONCURRENTLY.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0009_saved_searches"
+down_revision = "0008_chat_flood_rules"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "saved_searches",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.BigInteger(), nullable=False),
+        sa.Column("token", sa.String(), nullable=False),
+        sa.Column("location_kind", sa.String(), nullable=False),
+        sa.Column("location", sa.String(), nullable=False),
+        sa.Column("category", sa.String(), nullable=False),
+        sa.Column("subcategory", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_saved_searches_user_id_token", "saved_searches", ["user_id", "token"], unique=True)
+    op.create_index(
+        "ix_saved_searches_match", "saved_searches", ["category", "subcategory", "location_kind", "location"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_saved_searches_match", table_name="saved_searches")
+    op.drop_index("ix_saved_searches_user_id_token", table_name="saved_searches")
+    op.drop_table("saved_searches")
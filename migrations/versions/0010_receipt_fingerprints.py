@@ -0,0 +1,51 @@
+"""Чеки пополнений: file_id в topups и отпечатки для поиска повторных чеков (receipts.py).
+
+Revision ID: 0010_receipt_fingerprints
+Revises: 0009_saved_searches
+Create Date: 2026-10-19
+
+Колонки topups добавляются nullable — без переписывания таблицы; индекс по
+file_unique_id строится CONCURRENTLY. Таблица отпечатков новая и пустая.
+Старые заявки без сохранённого чека в поиске повторов не участвуют.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0010_receipt_fingerprints"
+down_revision = "0009_saved_searches"
+branch_labels = None
+depends_on = None
+
+BANDS = [f"band{i}" for i in range(4)]
+
+
+def upgrade():
+    op.add_column("topups", sa.Column("receipt_file_id", sa.String(), nullable=True))
+    op.add_column("topups", sa.Column("receipt_file_unique_id", sa.String(), nullable=True))
+
+    op.create_table(
+        "receipt_fingerprints",
+        sa.Column("topup_id", sa.Integer(), nullable=False),
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("dhash", sa.BigInteger(), nullable=True),
+        *(sa.Column(band, sa.Integer(), nullable=True) for band in BANDS),
+        sa.ForeignKeyConstraint(["topup_id"], ["topups.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("topup_id"),
+    )
+    op.create_index(op.f("ix_receipt_fingerprints_sha256"), "receipt_fingerprints", ["sha256"], unique=False)
+    for band in BANDS:
+        op.create_index(op.f(f"ix_receipt_fingerprints_{band}"), "receipt_fingerprints", [band], unique=False)
+
+    create_index_concurrently("ix_topups_receipt_file_unique_id", "topups", ["receipt_file_unique_id"])
+
+
+def downgrade():
+    drop_index_concurrently("ix_topups_receipt_file_unique_id", "topups")
+    for band in reversed(BANDS):
+        op.drop_index(op.f(f"ix_receipt_fingerprints_{band}"), table_name="receipt_fingerprints")
+    op.drop_index(op.f("ix_receipt_fingerprints_sha256"), table_name="receipt_fingerprints")
+    op.drop_table("receipt_fingerprints")
+    op.drop_column("topups", "receipt_file_unique_id")
+    op.drop_column("topups", "receipt_file_id")
@@ -0,0 +1,40 @@
+"""Очередь финансов: реквизиты и резерв в withdrawals, индексы ожидающих заявок.
+
+Revision ID: 0011_finance_queue
+Revises: 0010_receipt_fingerprints
+Create Date: 2026-10-19
+
+reserved добавляется с константным DEFAULT false — PostgreSQL не переписывает таблицу.
+Уже созданные заявки получают reserved = false: их сумма не была списана при заявке,
+поэтому finance.decide списывает её при одобрении (как раньше). Индексы частичные
+(только status = 'pending') и строятся CONCURRENTLY.
+Перед downgrade ожидающие заявки с резервом нужно решить: старый код списал бы их сумму второй раз.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.online import create_index_concurrently, drop_index_concurrently
+
+revision = "0011_finance_queue"
+down_revision = "0010_receipt_fingerprints"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("withdrawals", sa.Column("payment_system", sa.String(), nullable=True))
+    op.add_column("withdrawals", sa.Column("card_number", sa.String(), nullable=True))
+    op.add_column("withdrawals", sa.Column("reserved", sa.Boolean(), server_default=sa.false(), nullable=False))
+
+    create_index_concurrently("ix_topups_pending_id", "topups", ["id"],
+                              postgresql_where=sa.text("status = 'pending'"))
+    create_index_concurrently("ix_withdrawals_pending_id", "withdrawals", ["id"],
+                              postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade():
+    drop_index_concurrently("ix_withdrawals_pending_id", "withdrawals")
+    drop_index_concurrently("ix_topups_pending_id", "topups")
+    op.drop_column("withdrawals", "reserved")
+    op.drop_column("withdrawals", "card_number")
+    op.drop_column("withdrawals", "payment_system")
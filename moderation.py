@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Очередь модерации объявлений.
+
+Модератор открывает «/admin queue» (или кнопку «Очередь модерации»), берёт себе пачку
+ожидающих объявлений и одобряет/отклоняет их по одному или всей страницей.
+Пачка бронируется за модератором (ads.claimed_by / claimed_until) на
+MODERATION_CLAIM_TTL_MIN минут: другие модераторы её не получают, а если бронь
+истекла — объявления снова уходят в общую очередь.
+
+Решение по объявлению принимается только через decide(): оно меняет лишь ещё не
+рассмотренные объявления (status == "pending") и не трогает чужую действующую бронь,
+так что два модератора — в очереди или по кнопкам в группе — не решат одно
+объявление дважды. Счётчики поиска обновляются ORM-хуком counters.py.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramAPIError
+from sqlalchemy import func, or_, select, update
+
+import saved_searches
+from config import ADMIN_IDS, MODERATION_PAGE_SIZE, MODERATION_CLAIM_TTL_MIN
+from database import SessionLocal, Ad
+from utils import rus_status, renew_ad_expiry
+from callbacks import get_router
+
+# пауза между уведомлениями владельцам после массового решения
+NOTIFY_DELAY_SEC = 0.05
+
+
+def _claim_free(moderator_id: int, now: datetime):
+    """Объявление свободно для модератора: без брони, бронь его или истекла."""
+    return or_(Ad.claimed_by.is_(None), Ad.claimed_by == moderator_id, Ad.claimed_until < now)
+
+
+def claim_batch(moderator_id: int, limit: int = MODERATION_PAGE_SIZE) -> List[int]:
+    """
+    Бронирует за модератором до `limit` самых старых ожидающих объявлений
+    (уже взятые им — в первую очередь и с продлением брони). Занятые строки
+    пропускаем (SKIP LOCKED), так что параллельные модераторы получают разные пачки.
+    """
+    now = datetime.utcnow()
+    batch_ids = (
+        select(Ad.id)
+        .where(Ad.status == "pending", _claim_free(moderator_id, now))
+        .order_by((Ad.claimed_by == moderator_id).desc().nullslast(), Ad.created_at, Ad.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    with SessionLocal() as sess:
+        ids = sess.execute(
+            update(Ad)
+            .where(Ad.id.in_(batch_ids))
+            .values(claimed_by=moderator_id, claimed_until=now + timedelta(minutes=MODERATION_CLAIM_TTL_MIN))
+            .returning(Ad.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        sess.commit()
+    return sorted(ids)
+
+
+def release(moderator_id: int):
+    """Возвращает в общую очередь всё, что забронировано модератором."""
+    with SessionLocal() as sess:
+        sess.execute(
+            update(Ad)
+            .where(Ad.claimed_by == moderator_id, Ad.status == "pending")
+            .values(claimed_by=None, claimed_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        sess.commit()
+
+
+def claimed_ads(moderator_id: int) -> List[tuple]:
+    """Действующая бронь модератора: (id, ad_type, category, city, price, text, claimed_until)."""
+    now = datetime.utcnow()
+    with SessionLocal() as sess:
+        return sess.execute(
+            select(Ad.id, Ad.ad_type, Ad.category, Ad.city, Ad.price, Ad.text, Ad.claimed_until)
+            .where(Ad.claimed_by == moderator_id, Ad.claimed_until >= now, Ad.status == "pending")
+            .order_by(Ad.created_at, Ad.id)
+        ).all()
+
+
+def queue_stats() -> Tuple[int, int]:
+    """(всего ожидает, из них под чьей-то действующей бронью)."""
+    now = datetime.utcnow()
+    with SessionLocal() as sess:
+        pending, claimed = sess.execute(
+            select(func.count(), func.count().filter(Ad.claimed_until >= now))
+            .where(Ad.status == "pending")
+        ).one()
+    return pending, claimed
+
+
+def decide(ad_ids: Iterable[int], moderator_id: int, approve: bool) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """
+    Одобряет/отклоняет объявления одной транзакцией.
+    Возвращает ([(ad_id, user_id) решённых], [ad_id пропущенных — уже решены или в чужой брони]).
+    """
+    ad_ids = list(dict.fromkeys(ad_ids))
+    now = datetime.utcnow()
+    with SessionLocal() as sess:
+        ads = (sess.query(Ad)
+                   .filter(Ad.id.in_(ad_ids), Ad.status == "pending", _claim_free(moderator_id, now))
+                   .with_for_update(skip_locked=True)
+                   .all())
+        for ad in ads:
+            if approve:
+                ad.status = "approved"
+                renew_ad_expiry(ad)
+            else:
+                ad.status = "rejected"
+            ad.claimed_by = None
+            ad.claimed_until = None
+        done = [(ad.id, ad.user_id) for ad in ads]
+        sess.commit()
+    done_ids = {ad_id for ad_id, _ in done}
+    return done, [ad_id for ad_id in ad_ids if ad_id not in done_ids]
+
+
+async def notify_owners(bot: Bot, done: List[Tuple[int, int]], approve: bool):
+    status = rus_status("approved" if approve else "rejected")
+    for ad_id, user_id in done:
+        try:
+            await bot.send_message(user_id, f"Ваше объявление #{ad_id} «{status}»" + ("!" if approve else " админом."))
+        except Exception as e:
+            # пользователь мог заблокировать бота — остальных всё равно уведомляем
+            print(f"Не удалось уведомить {user_id}: {e}")
+        if len(done) > 1:
+            await asyncio.sleep(NOTIFY_DELAY_SEC)
+
+
+def _ad_line(ad_id, ad_type, category, city, price, text) -> str:
+    kind = "Ф2" if ad_type == "format2" else "Ф1"
+    price_info = f"{price} руб." if price is not None else "—"
+    snippet = " ".join((text or "").split())
+    if len(snippet) > 200:
+        snippet = snippet[:200] + "…"
+    return f"#{ad_id} [{kind}] {category or '—'} / {city or '—'} — {price_info}\n{snippet}"
+
+
+async def show_queue(bot: Bot, chat_id: int, moderator_id: int, message_id: Optional[int] = None):
+    """Экран очереди: статистика и текущая пачка модератора с кнопками решений."""
+    pending, claimed = queue_stats()
+    mine = claimed_ads(moderator_id)
+
+    lines = [f"Очередь модерации: ожидают {pending}, в работе у модераторов {claimed}."]
+    buttons: List[List[types.InlineKeyboardButton]] = []
+    if mine:
+        until = min(row[-1] for row in mine)
+        lines.append(f"\nВаша пачка ({len(mine)}), бронь до {until:%H:%M} UTC:")
+        for row in mine:
+            lines.append("\n" + _ad_line(*row[:-1]))
+            buttons.append([
+                types.InlineKeyboardButton(text=f"✅ #{row[0]}", callback_data=f"mq:a:{row[0]}"),
+                types.InlineKeyboardButton(text=f"❌ #{row[0]}", callback_data=f"mq:r:{row[0]}"),
+            ])
+        buttons.append([
+            types.InlineKeyboardButton(text="✅ Одобрить все", callback_data="mq:approve_all"),
+            types.InlineKeyboardButton(text="❌ Отклонить все", callback_data="mq:reject_all"),
+        ])
+        buttons.append([ types.InlineKeyboardButton(text="🔓 Вернуть в очередь", callback_data="mq:release") ])
+    elif pending > claimed:
+        buttons.append([ types.InlineKeyboardButton(text="📥 Взять пачку", callback_data="mq:claim") ])
+    else:
+        lines.append("\nСвободных объявлений нет.")
+    buttons.append([ types.InlineKeyboardButton(text="🔄 Обновить", callback_data="mq:refresh") ])
+
+    text = "\n".join(lines)[:4000]
+    kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
+    if message_id:
+        try:
+            return await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, reply_markup=kb)
+        except TelegramAPIError as e:
+            if "message is not modified" not in str(e):
+                raise
+            return None
+    return await bot.send_message(chat_id, text, reply_markup=kb)
+
+
+def register_moderation_handlers(bot: Bot, dp: Dispatcher):
+    cb = get_router(dp)
+
+    @dp.message(lambda m: m.text == "Очередь модерации")
+    async def moderation_queue_menu(message: types.Message):
+        if message.chat.id not in ADMIN_IDS:
+            return None
+        return await show_queue(bot, message.chat.id, message.chat.id)
+
+    @cb.route("mq:a:", "mq:r:", exact=("mq:claim", "mq:release", "mq:refresh", "mq:approve_all", "mq:reject_all"))
+    async def moderation_queue_action(call: types.CallbackQuery):
+        moderator_id = call.from_user.id
+        if moderator_id not in ADMIN_IDS:
+            return await bot.answer_callback_query(call.id, "Нет прав для модерации.", show_alert=True)
+
+        data = call.data
+        if data == "mq:claim":
+            ids = claim_batch(moderator_id)
+            await bot.answer_callback_query(call.id, f"Взято объявлений: {len(ids)}" if ids else "Свободных объявлений нет.")
+        elif data == "mq:release":
+            release(moderator_id)
+            await bot.answer_callback_query(call.id, "Пачка возвращена в очередь.")
+        elif data == "mq:refresh":
+            await bot.answer_callback_query(call.id)
+        else:
+            if data in ("mq:approve_all", "mq:reject_all"):
+                approve = data == "mq:approve_all"
+                ad_ids = [row[0] for row in claimed_ads(moderator_id)]
+            else:
+                approve = data.startswith("mq:a:")
+                try:
+                    ad_ids = [int(data[len("mq:a:"):])]
+                except ValueError:
+                    return await bot.answer_callback_query(call.id, "Некорректный ID объявления.", show_alert=True)
+            done, skipped = decide(ad_ids, moderator_id, approve)
+            note = f"{'Одобрено' if approve else 'Отклонено'}: {len(done)}"
+            if skipped:
+                note += f", пропущено (уже решены или у другого модератора): {len(skipped)}"
+            await bot.answer_callback_query(call.id, note, show_alert=bool(skipped))
+            if approve:
+                saved_searches.on_approved(ad_id for ad_id, _ in done)
+            await notify_owners(bot, done, approve)
+
+        return await show_queue(bot, call.message.chat.id, moderator_id, call.message.message_id)
@@ -1,17 +1,23 @@
 #!/usr/bin/env python3
 import dataclasses
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from typing import List, Dict
 
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.exceptions import TelegramAPIError
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from config import ADMIN_IDS, MARKIROVKA_GROUP_ID, ADMIN_EXTENSION_CHAT_ID, ADMIN_WITHDRAW_CHAT_ID, ADMIN_TOPUP_CHAT_ID, \
-    ADMIN_PROFILE_CHAT_ID
-from database import SessionLocal, User, Ad, TopUp, Withdrawal, AdChat, AdChatMessage, ChatGroup
-from utils import main_menu_keyboard, rus_status
+from config import MARKIROVKA_GROUP_ID, ADMIN_EXTENSION_CHAT_ID, ADMIN_WITHDRAW_CHAT_ID, ADMIN_TOPUP_CHAT_ID, \
+    ADMIN_PROFILE_CHAT_ID, AD_LIFETIME_DAYS
+from database import SessionLocal, User, Ad, TopUp, AdChat, AdChatMessage, ChatGroup
+from utils import main_menu_keyboard, rus_status, detect_region
+from callbacks import get_router
+import finance
+import receipts
+import render
+import users
 
 
 class ProfileStates(StatesGroup):
@@ -34,7 +40,19 @@ class ProfileChange:
 
 # заявки, ожидающие одобрения админом
 pending_profile_changes: Dict[int, ProfileChange] = {}
+
+# «Мои объявления»: размер страницы и фильтры по статусу
+MY_ADS_PAGE_SIZE = 10
+MY_ADS_FILTERS = {
+    "all": "Все",
+    "pending": "На модерации",
+    "approved": "Одобренные",
+    "inactive": "Неактивные",
+}
+
 def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
+    cb = get_router(dp)
+
     # ------------------- Главное меню / Личный кабинет -------------------
     @dp.message(lambda m: m.text == "📜Личный кабинет")
     async def cabinet_menu(message: types.Message):
@@ -48,6 +66,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 types.KeyboardButton(text="Вывод баланса")
             ],
             [
+                types.KeyboardButton(text="🔔 Мои подписки"),
                 types.KeyboardButton(text="🔙 Главное меню")
             ]
         ])
@@ -60,27 +79,86 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
     # ------------------- Мои объявления -------------------
     @dp.message(lambda m: m.text == "Мои объявления")
     async def my_ads(message: types.Message):
-        user_id = message.chat.id
-        with SessionLocal() as sess:
-            ads = sess.query(Ad).filter_by(user_id=user_id).all()
+        return await show_my_ads_page(message.chat.id)
 
-        if not ads:
+    async def show_my_ads_page(user_id: int, status_filter: str = "all", page: int = 0, message_id: int = None):
+        """
+        Страница списка «Мои объявления».
+        Из БД берём только одну страницу (+1 строка, чтобы понять, есть ли следующая)
+        и только лёгкие колонки — без текста и фото.
+        Если передан message_id — редактируем существующее сообщение.
+        """
+        if status_filter not in MY_ADS_FILTERS:
+            status_filter = "all"
+        page = max(0, page)
+
+        with SessionLocal() as sess:
+            q = sess.query(Ad.id, Ad.status, Ad.is_active).filter(Ad.user_id == user_id)
+            if status_filter == "pending":
+                q = q.filter(Ad.status == "pending")
+            elif status_filter == "approved":
+                q = q.filter(Ad.status == "approved", Ad.is_active == True)
+            elif status_filter == "inactive":
+                q = q.filter(Ad.is_active == False)
+            rows = (q.order_by(Ad.created_at.desc(), Ad.id.desc())
+                     .offset(page * MY_ADS_PAGE_SIZE)
+                     .limit(MY_ADS_PAGE_SIZE + 1)
+                     .all())
+
+        has_next = len(rows) > MY_ADS_PAGE_SIZE
+        rows = rows[:MY_ADS_PAGE_SIZE]
+
+        if not rows and status_filter == "all" and page == 0:
+            if message_id:
+                await bot.delete_message(user_id, message_id)
             return await bot.send_message(user_id, "У вас нет объявлений.", reply_markup=main_menu_keyboard())
 
-        buttons: List[List[types.InlineKeyboardButton]] = []
-        for ad in ads:
-            status_ru = rus_status(ad.status)
-            note = "" if ad.is_active else " / Неактивно"
-            btn = f"#{ad.id} ({status_ru}{note})"
-            buttons.append([ types.InlineKeyboardButton(text=btn, callback_data=f"profile_my_ad_{ad.id}") ])
+        buttons: List[List[types.InlineKeyboardButton]] = [[
+            types.InlineKeyboardButton(
+                text=f"• {label}" if key == status_filter else label,
+                callback_data=f"profile_myads_pg_{key}_0"
+            ) for key, label in MY_ADS_FILTERS.items()
+        ]]
+        for ad_id, status, is_active in rows:
+            status_ru = rus_status(status)
+            note = "" if is_active else " / Неактивно"
+            btn = f"#{ad_id} ({status_ru}{note})"
+            buttons.append([ types.InlineKeyboardButton(text=btn, callback_data=f"profile_my_ad_{ad_id}") ])
+
+        nav = []
+        if page > 0:
+            nav.append(types.InlineKeyboardButton(text="⏪ Назад", callback_data=f"profile_myads_pg_{status_filter}_{page - 1}"))
+        if has_next:
+            nav.append(types.InlineKeyboardButton(text="Вперёд ⏩", callback_data=f"profile_myads_pg_{status_filter}_{page + 1}"))
+        if nav:
+            buttons.append(nav)
         buttons.append([ types.InlineKeyboardButton(text="Закрыть", callback_data="profile_myads_close") ])
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-        return await bot.send_message(user_id, "Ваши объявления:", reply_markup=kb)
+
+        text = f"Ваши объявления (стр. {page + 1}):" if rows else "В этом разделе объявлений нет."
+        if message_id:
+            return await bot.edit_message_text(text, chat_id=user_id, message_id=message_id, reply_markup=kb)
+        return await bot.send_message(user_id, text, reply_markup=kb)
+
+    @cb.route("profile_myads_pg_")
+    async def handle_my_ads_page(call: types.CallbackQuery):
+        # profile_myads_pg_{filter}_{page}
+        status_filter, _, page_str = call.data.replace("profile_myads_pg_", "").rpartition("_")
+        try:
+            page = int(page_str)
+        except ValueError:
+            return await bot.answer_callback_query(call.id, "Некорректная страница.", show_alert=True)
+
+        await bot.answer_callback_query(call.id)
+        try:
+            return await show_my_ads_page(call.from_user.id, status_filter, page, call.message.message_id)
+        except TelegramAPIError as e:
+            if "message is not modified" not in str(e):
+                raise
+            return None
 
     # ---------- Просмотр одного объявления и кнопка «Продлить» ----------
-    @dp.callback_query(
-        lambda c: c.data.startswith("profile_my_ad_") or c.data == "profile_myads_close"
-    )
+    @cb.route("profile_my_ad_", exact=("profile_myads_close",))
     async def handle_profile_my_ads(call: types.CallbackQuery):
         user_id = call.from_user.id
         data = call.data
@@ -98,10 +176,11 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         if not ad or ad.user_id != user_id:
             return await bot.answer_callback_query(call.id, "Объявление не найдено.", show_alert=True)
 
-        # расчёт дней
-        days_passed = (datetime.now(timezone.utc) - ad.created_at).days
-        days_left   = max(0, 30 - days_passed)
-        expired     = days_passed >= 30
+        # срок размещения (expires_at ведёт фоновая чистка, см. maintenance.py)
+        now         = datetime.utcnow()
+        expires_at  = ad.expires_at or (ad.created_at + timedelta(days=AD_LIFETIME_DAYS))
+        expired     = expires_at <= now
+        days_left   = max(0, (expires_at - now).days)
         price       = ad.price or Decimal("0")
         fee         = (price * Decimal("0")).quantize(Decimal("0"))
 
@@ -111,6 +190,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             f"{ad.text}\n\n"
             f"Цена: {price} ₽\n"
             f"Размещено: {ad.created_at.strftime('%d.%m.%Y')}\n"
+            f"Активно до: {expires_at.strftime('%d.%m.%Y')}\n"
             + ("⛔️ Срок истёк!\n" if expired else f"Осталось дней: {days_left}\n")
         )
 
@@ -118,7 +198,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         # кнопка продления, если уже неактивно, срок вышел или осталось <5 дней
         if not ad.is_active or expired or days_left < 5:
             buttons.append([ types.InlineKeyboardButton(
-                text=f"Продлить на 30 дней (Бесплатно)",
+                text=f"Продлить на {AD_LIFETIME_DAYS} дней (Бесплатно)",
                 callback_data=f"extend_ad_{ad.id}"
             ) ])
         buttons.append([ types.InlineKeyboardButton(text="🔙 Назад", callback_data="profile_back_to_ads") ])
@@ -130,14 +210,14 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         return await bot.answer_callback_query(call.id)
 
     # ------------------- «Назад» к списку объявлений -------------------
-    @dp.callback_query(lambda c: c.data == "profile_back_to_ads")
+    @cb.route(exact=("profile_back_to_ads",))
     async def back_to_ads(call: types.CallbackQuery):
         await bot.answer_callback_query(call.id)
         # просто вызываем логику «Мои объявления»
         await my_ads(call.message)
 
     # ------------------- Запрос на продление -------------------
-    @dp.callback_query(lambda c: c.data.startswith("extend_ad_"))
+    @cb.route("extend_ad_")
     async def extend_ad_callback(call: types.CallbackQuery):
         user_id = call.from_user.id
         ad_id   = int(call.data.split("_")[-1])
@@ -156,99 +236,13 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await bot.answer_callback_query(call.id)
         await bot.send_message(
             ADMIN_EXTENSION_CHAT_ID,
-            f"Пользователь @{call.from_user.username or user_id} запрашивает продление объявления #{ad_id} на 30 дней.",
+            f"Пользователь @{call.from_user.username or user_id} запрашивает продление объявления #{ad_id} на {AD_LIFETIME_DAYS} дней.",
             reply_markup=kb_admin
         )
         return await bot.send_message(user_id, "Запрос на продление отправлен администрации. Ожидайте решения.")
 
-    # ------------------- Обработчик одобрения/отклонения -------------------
-    @dp.callback_query(
-        lambda c: c.data.startswith("approve_ext_") or c.data.startswith("reject_ext_")
-    )
-    async def handle_extension_decision(call: types.CallbackQuery):
-        admin_id = call.from_user.id
-        if admin_id not in ADMIN_IDS:
-            return await bot.answer_callback_query(call.id, "Нет прав.", show_alert=True)
-
-        action, _, ad_id_str = call.data.partition("_ext_")
-        ad_id = int(ad_id_str)
-
-        with SessionLocal() as sess:
-            ad = sess.query(Ad).get(ad_id)
-            if not ad:
-                return await bot.answer_callback_query(call.id, "Объявление не найдено.", show_alert=True)
-
-            # удаляем кнопки под заявкой
-            await bot.edit_message_reply_markup(chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=None)
-
-            if action == "approve":
-                ad.is_active  = True
-                ad.created_at = datetime.now(timezone.utc)
-                sess.commit()
-                await bot.send_message(call.message.chat.id, f"✅ Продление #{ad_id} одобрено.")
-                await bot.send_message(ad.user_id, f"Ваше объявление #{ad_id} продлено на 30 дней и снова активно!")
-            else:
-                await bot.send_message(call.message.chat.id, f"❌ Продление #{ad_id} отклонено.")
-                await bot.send_message(ad.user_id, f"Продление объявления #{ad_id} было отклонено.")
-
-        await bot.answer_callback_query(call.id)
-
-        # Повторяем логику my_ads
-        with SessionLocal() as session:
-            chat_id = call.message.chat.id
-            user = session.query(User).filter_by(id=chat_id).first()
-            if not user:
-                return await bot.send_message(chat_id, "Вы не зарегистрированы.", reply_markup=main_menu_keyboard())
-
-            ads_list = session.query(Ad).filter_by(user_id=user.id).all()
-            if not ads_list:
-                return await bot.send_message(chat_id, "У вас нет объявлений.", reply_markup=main_menu_keyboard())
-
-            buttons = [
-                [ types.InlineKeyboardButton(
-                    text=f"Объявление #{ad_obj.id} ({rus_status(ad_obj.status)})",
-                    callback_data=f"profile_my_ad_{ad_obj.id}"
-                ) ] for ad_obj in ads_list
-            ]
-            buttons.append([ types.InlineKeyboardButton(text="Закрыть", callback_data="profile_myads_close") ])
-            kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-            return await bot.send_message(chat_id, "Ваши объявления:", reply_markup=kb)
-
-    # ---------- продление на 30 дней --------------------
-    @dp.callback_query(lambda c: c.data.startswith("extend_ad_"))
-    async def extend_ad_callback(call: types.CallbackQuery):
-        """
-        Пользователь запросил бесплатное продление на 30 дней.
-        Отправляем заявку в админ-чат.
-        """
-        ad_id = int(call.data.replace("extend_ad_", ""))
-        user_id = call.from_user.id
-
-        # Проверяем владельца и существование
-        with SessionLocal() as sess:
-            ad = sess.query(Ad).get(ad_id)
-            if not ad or ad.user_id != user_id:
-                return await bot.answer_callback_query(call.id, "Объявление не найдено.", show_alert=True)
-
-        # Формируем запрос для админа
-        kb_admin = types.InlineKeyboardMarkup(inline_keyboard=[[
-            types.InlineKeyboardButton(text="✅ Одобрить продление", callback_data=f"approve_ext_{ad_id}"),
-            types.InlineKeyboardButton(text="❌ Отклонить продление", callback_data=f"reject_ext_{ad_id}")
-        ]])
-        await bot.answer_callback_query(call.id)
-        await bot.send_message(
-            ADMIN_EXTENSION_CHAT_ID,
-            f"Пользователь @{call.from_user.username or user_id} (ID {user_id})\n"
-            f"запрашивает бесплатное продление объявления #{ad_id} на 30 дней.",
-            reply_markup=kb_admin
-        )
-        return await bot.send_message(
-            user_id,
-            "Запрос на продление отправлен администрации. Ожидайте решения."
-        )
-
     # ------------------- Разместить существующее объявление на бирже -------------------
-    @dp.callback_query(lambda call: call.data.startswith("profile_myad_exchange_"))
+    @cb.route("profile_myad_exchange_")
     async def profile_myad_exchange_callback(call: types.CallbackQuery, state: FSMContext):
         """
         Запуск "мини-флоу" для существующего объявления, чтобы перевести его в Формат2.
@@ -347,7 +341,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await state.clear()
         return await check_and_ask_missing_profile_data(chat_id, state)
 
-    @dp.callback_query(lambda call: call.data == "exchange_company_skip")
+    @cb.route(exact=("exchange_company_skip",))
     async def exchange_company_skip(call: types.CallbackQuery, state: FSMContext):
         chat_id = call.message.chat.id
         await bot.delete_message(chat_id, call.message.message_id)
@@ -392,7 +386,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         await state.clear()
         return await check_and_ask_missing_profile_data(chat_id, state)
 
-    @dp.callback_query(lambda call: call.data == "cancel_exchange_flow")
+    @cb.route(exact=("cancel_exchange_flow",))
     async def cancel_exchange_flow(call: types.CallbackQuery, state: FSMContext):
         chat_id = call.message.chat.id
         await bot.delete_message(chat_id, call.message.message_id)
@@ -411,7 +405,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ])
         await bot.send_message(chat_id, "Выберите регион для размещения:", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data in ["exchg_region_moscow", "exchg_region_mo", "exchg_region_rf"])
+    @cb.route(exact=("exchg_region_moscow", "exchg_region_mo", "exchg_region_rf"))
     async def handle_exchange_region_choice(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -431,15 +425,6 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
     async def ask_exchange_chatgroup(chat_id):
         region_key = user_steps[chat_id]["region"]
 
-        def detect_region(title: str) -> str:
-            low = title.lower()
-            if "москв" in low and "область" not in low:
-                return "moscow"
-            elif "область" in low:
-                return "mo"
-            else:
-                return "rf"
-
         with SessionLocal() as session:
             all_chats = session.query(ChatGroup).filter_by(is_active=True).all()
 
@@ -458,7 +443,8 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         user_steps[chat_id]["exchg_chat_page"] = 0
         await show_exchange_chats_page(chat_id)
 
-    async def show_exchange_chats_page(chat_id):
+    async def show_exchange_chats_page(chat_id, message_id: int = None):
+        """Страница списка чатов; при листании правим то же сообщение (отложенно, см. render.py)."""
         data = user_steps[chat_id]
         chats = data["exchg_chat_list"]
         page = data["exchg_chat_page"]
@@ -469,7 +455,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         sublist = chats[start_i:end_i]
 
         buttons = [
-            [ types.InlineKeyboardButton(text=f"{c.title} (Цена: {c.price} руб.)", callback_data=f"exchg_pickchat_{c.id}") ]
+            [ types.InlineKeyboardButton(text=f"{c.title} (Цена: {c.price_1:.0f} руб.)", callback_data=f"exchg_pickchat_{c.id}") ]
             for c in sublist
         ]
         if page > 0:
@@ -478,9 +464,13 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             buttons.append([ types.InlineKeyboardButton(text="Вперёд⏩", callback_data="exchg_chatpage_next") ])
         buttons.append([ types.InlineKeyboardButton(text="Отмена", callback_data="cancel_exchange_flow") ])
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
-        await bot.send_message(chat_id, f"Выберите чат для размещения (стр. {page + 1}):", reply_markup=kb)
+        text = f"Выберите чат для размещения (стр. {page + 1}):"
+        if message_id:
+            return render.schedule(bot, chat_id, message_id, text, kb)
+        sent = await bot.send_message(chat_id, text, reply_markup=kb)
+        render.remember(chat_id, sent.message_id, text, kb)
 
-    @dp.callback_query(lambda call: call.data in ["exchg_chatpage_prev", "exchg_chatpage_next"])
+    @cb.route(exact=("exchg_chatpage_prev", "exchg_chatpage_next"))
     async def handle_exchg_chatpage_nav(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -491,11 +481,10 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         else:
             user_steps[chat_id]["exchg_chat_page"] += 1
 
-        await bot.delete_message(chat_id, call.message.message_id)
         await bot.answer_callback_query(call.id)
-        await show_exchange_chats_page(chat_id)
+        await show_exchange_chats_page(chat_id, call.message.message_id)
 
-    @dp.callback_query(lambda call: call.data.startswith("exchg_pickchat_"))
+    @cb.route("exchg_pickchat_")
     async def handle_exchg_pick_chat(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -513,8 +502,9 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 return await bot.answer_callback_query(call.id, "Чат не найден", show_alert=True)
 
         user_steps[chat_id]["chatgroup_id"] = cg_id
-        user_steps[chat_id]["chatgroup_price"] = float(cg.price)
+        user_steps[chat_id]["chatgroup_price"] = float(cg.price_1)
 
+        render.cancel(chat_id, call.message.message_id)
         await bot.delete_message(chat_id, call.message.message_id)
         await bot.answer_callback_query(call.id)
         return await ask_exchange_post_count(chat_id)
@@ -535,7 +525,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ])
         await bot.send_message(chat_id, "Сколько размещений хотите оплатить?", reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("exchg_cnt_"))
+    @cb.route("exchg_cnt_")
     async def handle_exchg_cnt(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -580,7 +570,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ]])
         await bot.send_message(chat_id, text, reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data == "exchg_pay_now")
+    @cb.route(exact=("exchg_pay_now",))
     async def handle_exchg_pay_now(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -616,7 +606,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             reply_markup=kb
         )
 
-    @dp.callback_query(lambda call: call.data == "exchg_pay_marking")
+    @cb.route(exact=("exchg_pay_marking",))
     async def handle_exchg_pay_marking(call: types.CallbackQuery):
         chat_id = call.message.chat.id
         if chat_id not in user_steps:
@@ -750,14 +740,14 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         ])
         return await bot.send_message(user_id, txt, parse_mode="HTML", reply_markup=kb)
 
-    @dp.callback_query(lambda c: c.data == "back_to_main")
+    @cb.route(exact=("back_to_main",))
     async def back_from_profile(call: types.CallbackQuery):
         await bot.delete_message(call.message.chat.id, call.message.message_id)
         await bot.send_message(call.message.chat.id, "Главное меню:", reply_markup=main_menu_keyboard())
         await bot.answer_callback_query(call.id)
 
     # ---------- шаг 1: пользователь хочет изменить поле ----------
-    @dp.callback_query(lambda c: c.data.startswith("edit_profile_"))
+    @cb.route("edit_profile_")
     async def ask_new_profile_value(call: types.CallbackQuery, state: FSMContext):
         field = call.data.replace("edit_profile_", "")  # fio / inn / company
         user_steps[call.from_user.id] = {"edit_field": field}
@@ -811,7 +801,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         return None
 
     # ---------- шаг 3: админ одобряет / отклоняет ----------
-    @dp.callback_query(lambda c: c.data.startswith(("approve_profile_", "reject_profile_")))
+    @cb.route("approve_profile_", "reject_profile_")
     async def admin_profile_decision(call: types.CallbackQuery):
         approve = call.data.startswith("approve_profile_")
         change_id = int(call.data.split("_")[-1])
@@ -873,7 +863,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
     async def process_topup_amount(message: types.Message, state: FSMContext):
         chat_id = message.chat.id
         try:
-            amount = float(message.text.replace(",", "."))
+            amount = finance.parse_amount(message.text)
             if not 50 <= amount <= 100000:
                 raise ValueError
         except ValueError:
@@ -906,7 +896,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         )
 
     # ---------- шаг 1: пользователь выбрал карту ----------
-    @dp.callback_query(lambda c: c.data.startswith("topup_card_"))
+    @cb.route("topup_card_")
     async def handle_choose_card(call: types.CallbackQuery):
         chat_id = call.from_user.id
         card_type, tmp_id = call.data.split("_")[2:]  # sber / tnk / alfa
@@ -942,13 +932,12 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         uid = message.chat.id
         flow = user_steps[uid]["topup"]
 
-        # берём file_id
-        if message.content_type == "photo":
-            file_id = message.photo[-1].file_id
-        else:
-            file_id = message.document.file_id
+        # берём file_id (file_unique_id — для поиска повторных чеков, см. receipts.py)
+        receipt = message.photo[-1] if message.content_type == "photo" else message.document
 
-        flow["receipt_file_id"] = file_id
+        flow["receipt_file_id"] = receipt.file_id
+        flow["receipt_file_unique_id"] = receipt.file_unique_id
+        flow["receipt_is_photo"] = message.content_type == "photo"
 
         kb = types.InlineKeyboardMarkup(inline_keyboard=[[
             types.InlineKeyboardButton(text="✅ Подтвердить перевод", callback_data=f"topup_confirm_{flow['tmp_id']}"),
@@ -959,7 +948,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                                "или «Отменить».", reply_markup=kb)
 
     # ---------- шаг 3: подтверждение / отмена ----------
-    @dp.callback_query(lambda c: c.data.startswith(("topup_confirm_", "topup_cancel_")))
+    @cb.route("topup_confirm_", "topup_cancel_")
     async def finish_topup_flow(call: types.CallbackQuery):
         uid = call.from_user.id
         flow = user_steps.get(uid, {}).get("topup")
@@ -981,7 +970,9 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 amount=amount,
                 status="pending",
                 payment_system=flow["card_system"],
-                card_number=flow["card_number"]
+                card_number=flow["card_number"],
+                receipt_file_id=flow["receipt_file_id"],
+                receipt_file_unique_id=flow["receipt_file_unique_id"]
             )
             sess.add(topup)
             sess.commit()
@@ -1009,13 +1000,20 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             types.InlineKeyboardButton(text="✅ Одобрить", callback_data=f"approve_topup_{topup_id}"),
             types.InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reject_topup_{topup_id}")
         ]])
-        await bot.send_photo(
+        send_receipt = bot.send_photo if flow["receipt_is_photo"] else bot.send_document
+        card = await send_receipt(
             ADMIN_TOPUP_CHAT_ID,
             flow["receipt_file_id"],
             caption=caption,
             parse_mode="HTML",
             reply_markup=kb_admin
         )
+        # проверка на повторный чек — в фоне; найдёт повтор — допишет предупреждение в карточку
+        receipts.submit(receipts.ReceiptJob(
+            topup_id, flow["receipt_file_id"], flow["receipt_file_unique_id"],
+            card_chat_id=card.chat.id, card_message_id=card.message_id,
+            card_caption=caption, card_markup=kb_admin
+        ))
 
         # чистим шаг
         user_steps.pop(uid, None)
@@ -1038,7 +1036,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         """
         uid = message.chat.id
         try:
-            amount = float(message.text.replace(",", "."))
+            amount = finance.parse_amount(message.text)
             if amount < 100:
                 raise ValueError
         except ValueError:
@@ -1050,7 +1048,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             if not user:
                 await state.clear()
                 return await bot.send_message(uid, "Вы не зарегистрированы.", reply_markup=main_menu_keyboard())
-            if float(user.balance) < amount:
+            if (user.balance or 0) < amount:
                 await state.clear()
                 return await bot.send_message(uid, f"Недостаточно средств (баланс: {user.balance} руб.).",
                                               reply_markup=main_menu_keyboard())
@@ -1081,24 +1079,21 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
 
         amount = flow["amount"]
 
-        # создаём запись в БД (сохраняем номер карты в дополнительных полях)
-        with SessionLocal() as sess:
-            wd = Withdrawal(user_id=uid,
-                            amount=amount,
-                            status="pending")
-            # добавим две пользовательские колонки, если вы уже
-            # расширяли модель Withdrawal (иначе удалите эти строки)
-            wd.card_number = card
-            wd.payment_system = None
-            sess.add(wd)
-            sess.commit()
-            wd_id = wd.id
+        # создаём заявку и сразу резервируем сумму — баланс мог измениться с шага 2
+        await state.clear()
+        reserved = finance.reserve_withdrawal(uid, amount, card)
+        if reserved is None:
+            user_steps.pop(uid, None)
+            return await bot.send_message(uid, "Недостаточно средств для вывода этой суммы.",
+                                          reply_markup=main_menu_keyboard())
+        wd_id, balance_left = reserved
 
         # уведомляем пользователя
-        await state.clear()
         await bot.send_message(uid,
                                f"✅ Заявка на вывод #{wd_id} на сумму {amount} руб. "
-                               "отправлена администратору.\nОжидайте подтверждения.",
+                               "отправлена администратору.\nОжидайте подтверждения.\n"
+                               f"Сумма зарезервирована, на балансе: {balance_left} руб. "
+                               "Если заявку отклонят, она вернётся на баланс.",
                                reply_markup=main_menu_keyboard())
 
         # ------- сообщение для администраторов -------
@@ -1174,7 +1169,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             return None
 
     # ------------------- открыть выбранный чат -------------------
-    @dp.callback_query(lambda call: call.data.startswith("open_chat_"))
+    @cb.route("open_chat_")
     async def open_chat_callback(call: types.CallbackQuery):
         """
         Показывает историю диалога и даёт кнопки «✏️ Написать» / «🔒 Закрыть чат».
@@ -1225,7 +1220,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         )
         return await bot.answer_callback_query(call.id)
 
-    @dp.callback_query(lambda call: call.data.startswith("chat_write_"))
+    @cb.route("chat_write_")
     async def chat_write_callback(call: types.CallbackQuery, state: FSMContext):
         user_id = call.from_user.id
         ch_id_str = call.data.replace("chat_write_", "")
@@ -1264,11 +1259,9 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 user_steps.pop(user_id, None)
                 return None
 
-            # страхуемся: оба участника точно в users
+            # страхуемся: оба участника точно в users (известные — без запросов, см. users.py)
             for uid in (chat.buyer_id, chat.seller_id):
-                if not sess.query(User).filter_by(id=uid).first():
-                    sess.add(User(id=uid))
-            sess.flush()  # FK safety
+                users.ensure_user(uid, sess=sess)
 
             # сохраняем сообщение
             sess.add(AdChatMessage(chat_id=ch_id,
@@ -1288,7 +1281,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         user_steps.pop(user_id, None)
         return None
 
-    @dp.callback_query(lambda call: call.data.startswith("chat_close_"))
+    @cb.route("chat_close_")
     async def close_chat_callback(call: types.CallbackQuery):
         user_id = call.from_user.id
         ch_id_str = call.data.replace("chat_close_", "")
@@ -1305,6 +1298,7 @@ def register_profile_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 return await bot.answer_callback_query(call.id, "Нет доступа к чату.", show_alert=True)
 
             chat_obj.status = "closed"
+            chat_obj.closed_at = datetime.utcnow()
             session.commit()
             await bot.answer_callback_query(call.id, "Чат закрыт.")
             other_id = chat_obj.seller_id if user_id == chat_obj.buyer_id else chat_obj.buyer_id
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Проверка чеков пополнения на повторное использование.
+
+После подтверждения пополнения (profile.finish_topup_flow) карточка с чеком уходит
+админам сразу, а сама проверка ставится в очередь submit() и идёт в фоне:
+  1) чек скачивается через Bot API;
+  2) sha256 файла считается в цикле событий (это быстро), а dHash картинки —
+     в пуле процессов (ProcessPoolExecutor), чтобы декодирование не тормозило бота;
+  3) отпечаток сохраняется в receipt_fingerprints, и ищутся другие заявки
+     с тем же файлом (file_unique_id, sha256) или почти той же картинкой:
+     dHash различается не больше чем на RECEIPT_DHASH_MAX_DISTANCE бит
+     (запросы к БД — в потоке через asyncio.to_thread);
+     dHash режем на 4 полосы по 16 бит: при расстоянии ≤ 3 хотя бы одна полоса
+     совпадает целиком, поэтому кандидаты — точные совпадения по индексам полос;
+  4) если повторы нашлись, в подпись карточки админа добавляется предупреждение.
+
+dHash (difference hash): картинка в оттенках серого 9×8, бит = «пиксель ярче соседа справа».
+Он устойчив к пережатию и масштабированию скриншота. Для него нужен Pillow; без него
+(и для PDF-чеков) остаются точные совпадения файла.
+"""
+import asyncio
+import hashlib
+import io
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, NamedTuple, Optional
+
+from aiogram import Bot
+from sqlalchemy import or_, select
+
+from config import RECEIPT_DHASH_MAX_DISTANCE, RECEIPT_HASH_WORKERS, RECEIPT_MAX_BYTES, ADMIN_TOPUP_CHAT_ID
+from database import SessionLocal, ReceiptFingerprint, TopUp, User
+from utils import rus_status
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+# сколько кандидатов по полосам проверять, не больше
+MAX_CANDIDATES = 50
+# сколько повторов показывать в предупреждении
+MAX_SHOWN = 5
+
+
+@dataclass
+class ReceiptJob:
+    topup_id: int
+    file_id: str
+    file_unique_id: str
+    # карточка заявки у админов: её подпись дополняем предупреждением
+    card_chat_id: Optional[int] = None
+    card_message_id: Optional[int] = None
+    card_caption: Optional[str] = None
+    card_markup: object = None
+
+
+class Duplicate(NamedTuple):
+    topup_id: int
+    user_id: int
+    username: Optional[str]
+    status: str
+    amount: object
+    exact: bool          # тот же файл, а не «почти такая же картинка»
+
+
+_queue: "asyncio.Queue[ReceiptJob]" = None
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Хэши
+# ────────────────────────────────────────────────────────────────────
+def dhash(data: bytes) -> Optional[int]:
+    """
+    64-битный dHash картинки (знаковый — под BigInteger) или None, если это не картинка.
+    Выполняется в процессе пула — поэтому функция модульная и Pillow импортируется здесь.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            pixels = list(img.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def bands(value: int) -> List[int]:
+    """dHash → BANDS полос по BAND_BITS бит."""
+    value &= (1 << 64) - 1
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & mask for i in range(BANDS)]
+
+
+def distance(a: int, b: int) -> int:
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Поиск повторов
+# ────────────────────────────────────────────────────────────────────
+def find_duplicates(sess, topup_id: int, file_unique_id: str, sha256: str, image_hash: Optional[int]) -> List[Duplicate]:
+    """Другие заявки с тем же файлом или почти той же картинкой (сначала точные, затем по id)."""
+    exact_ids = set(sess.execute(
+        select(TopUp.id).where(TopUp.receipt_file_unique_id == file_unique_id, TopUp.id != topup_id)
+        .limit(MAX_CANDIDATES)
+    ).scalars())
+    exact_ids |= set(sess.execute(
+        select(ReceiptFingerprint.topup_id)
+        .where(ReceiptFingerprint.sha256 == sha256, ReceiptFingerprint.topup_id != topup_id)
+        .limit(MAX_CANDIDATES)
+    ).scalars())
+
+    near_ids = set()
+    if image_hash is not None:
+        columns = [getattr(ReceiptFingerprint, f"band{i}") for i in range(BANDS)]
+        rows = sess.execute(
+            select(ReceiptFingerprint.topup_id, ReceiptFingerprint.dhash)
+            .where(or_(*(col == value for col, value in zip(columns, bands(image_hash)))),
+                   ReceiptFingerprint.topup_id != topup_id)
+            .limit(MAX_CANDIDATES)
+        ).all()
+        near_ids = {
+            other_id for other_id, other_hash in rows
+            if distance(other_hash, image_hash) <= RECEIPT_DHASH_MAX_DISTANCE
+        } - exact_ids
+
+    ids = sorted(exact_ids) + sorted(near_ids)
+    if not ids:
+        return []
+    info = {
+        row.id: row for row in sess.execute(
+            select(TopUp.id, TopUp.user_id, User.username, TopUp.status, TopUp.amount)
+            .join(User, User.id == TopUp.user_id, isouter=True)
+            .where(TopUp.id.in_(ids))
+        )
+    }
+    return [
+        Duplicate(i, info[i].user_id, info[i].username, info[i].status, info[i].amount, i in exact_ids)
+        for i in ids if i in info
+    ]
+
+
+def record(sess, topup_id: int, sha256: str, image_hash: Optional[int]):
+    values = {f"band{i}": band for i, band in enumerate(bands(image_hash))} if image_hash is not None else {}
+    sess.merge(ReceiptFingerprint(topup_id=topup_id, sha256=sha256, dhash=image_hash, **values))
+
+
+def duplicate_note(duplicates: List[Duplicate]) -> str:
+    """Предупреждение для карточки админа (пустое, если повторов нет)."""
+    if not duplicates:
+        return ""
+    lines = ["⚠️ Этот чек уже присылали:"]
+    for d in duplicates[:MAX_SHOWN]:
+        who = f"@{d.username}" if d.username else str(d.user_id)
+        kind = "тот же файл" if d.exact else "почти такой же снимок"
+        lines.append(f"• заявка #{d.topup_id} — {who}, {d.amount} руб., «{rus_status(d.status)}» ({kind})")
+    if len(duplicates) > MAX_SHOWN:
+        lines.append(f"• и ещё {len(duplicates) - MAX_SHOWN}")
+    return "\n".join(lines)
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Фоновая обработка
+# ────────────────────────────────────────────────────────────────────
+def submit(job: ReceiptJob):
+    """Ставит чек в очередь проверки (не ждёт её)."""
+    if _queue is None:
+        print(f"receipts: очередь не запущена, чек заявки #{job.topup_id} не проверен")
+        return
+    _queue.put_nowait(job)
+
+
+async def _download(bot: Bot, file_id: str) -> Optional[bytes]:
+    file = await bot.get_file(file_id)
+    if file.file_size and file.file_size > RECEIPT_MAX_BYTES:
+        return None
+    buf = io.BytesIO()
+    await bot.download_file(file.file_path, buf)
+    return buf.getvalue()
+
+
+def _check(job: ReceiptJob, sha256: str, image_hash: Optional[int]) -> List[Duplicate]:
+    with SessionLocal() as sess:
+        duplicates = find_duplicates(sess, job.topup_id, job.file_unique_id, sha256, image_hash)
+        record(sess, job.topup_id, sha256, image_hash)
+        sess.commit()
+    return duplicates
+
+
+async def process(bot: Bot, job: ReceiptJob) -> List[Duplicate]:
+    data = await _download(bot, job.file_id)
+    if data is None:
+        print(f"receipts: чек заявки #{job.topup_id} больше {RECEIPT_MAX_BYTES} байт — не проверяем")
+        return []
+    sha256 = hashlib.sha256(data).hexdigest()
+    image_hash = await asyncio.get_running_loop().run_in_executor(_pool, dhash, data)
+
+    duplicates = await asyncio.to_thread(_check, job, sha256, image_hash)
+    note = duplicate_note(duplicates)
+    if note:
+        await _flag_card(bot, job, note)
+    return duplicates
+
+
+def _topup_pending(topup_id: int) -> bool:
+    with SessionLocal() as sess:
+        return sess.execute(select(TopUp.status).where(TopUp.id == topup_id)).scalar() == "pending"
+
+
+async def _flag_card(bot: Bot, job: ReceiptJob, note: str):
+    pending = await asyncio.to_thread(_topup_pending, job.topup_id)
+    if pending and job.card_message_id and job.card_caption:
+        try:
+            return await bot.edit_message_caption(
+                chat_id=job.card_chat_id, message_id=job.card_message_id,
+                caption=f"{note}\n\n{job.card_caption}", parse_mode="HTML", reply_markup=job.card_markup
+            )
+        except Exception as e:
+            print(f"receipts: не удалось дополнить карточку заявки #{job.topup_id}: {e}")
+    # заявку уже решили или карточку не отредактировать — отдельным сообщением
+    await bot.send_message(
+        job.card_chat_id or ADMIN_TOPUP_CHAT_ID, f"Заявка #{job.topup_id}\n{note}",
+        reply_to_message_id=job.card_message_id
+    )
+
+
+def _unchecked_jobs() -> List[ReceiptJob]:
+    """Ожидающие заявки, чек которых не успели проверить до перезапуска (очередь — в памяти)."""
+    with SessionLocal() as sess:
+        rows = sess.execute(
+            select(TopUp.id, TopUp.receipt_file_id, TopUp.receipt_file_unique_id)
+            .join(ReceiptFingerprint, ReceiptFingerprint.topup_id == TopUp.id, isouter=True)
+            .where(TopUp.status == "pending", TopUp.receipt_file_id != None, ReceiptFingerprint.topup_id == None)
+            .order_by(TopUp.id)
+        ).all()
+    return [ReceiptJob(topup_id, file_id, file_unique_id or "") for topup_id, file_id, file_unique_id in rows]
+
+
+async def worker_loop(bot: Bot):
+    """Фоновая задача (запускается в on_startup, см. bot.py)."""
+    global _queue, _pool
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=RECEIPT_HASH_WORKERS)
+    try:
+        for job in await asyncio.to_thread(_unchecked_jobs):
+            _queue.put_nowait(job)
+    except Exception as e:
+        print("receipts: не удалось поднять непроверенные чеки:", e)
+    while True:
+        job = await _queue.get()
+        try:
+            await process(bot, job)
+        except Exception as e:
+            print(f"receipts: ошибка проверки чека заявки #{job.topup_id}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def shutdown():
+    """Гасит пул процессов (on_shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
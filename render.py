@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Отложенная перерисовка сообщений со списками (страницы чатов, чекбоксы, «Показать ещё»).
+
+Хендлер сразу отвечает на callback, меняет состояние и вызывает schedule() — сама
+правка уходит через DEBOUNCE_SEC. Если за это время пришли ещё нажатия, в Telegram
+отправится только последнее состояние: серия быстрых кликов = одна правка.
+Перед отправкой сравниваем хэш текста и разметки с тем, что уже показано, —
+правки «без изменений» (message is not modified) не отправляются вовсе.
+На RetryAfter ждём и отправляем самое свежее состояние.
+"""
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import Bot, types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+# сколько ждать следующих нажатий перед правкой
+DEBOUNCE_SEC = 0.3
+# сколько последних показанных состояний помнить
+SHOWN_CACHE_SIZE = 10_000
+
+Key = Tuple[int, int]
+
+
+class _Pending:
+    __slots__ = ("text", "reply_markup", "parse_mode", "digest", "fallback")
+
+    def __init__(self, text, reply_markup, parse_mode, digest, fallback):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.parse_mode = parse_mode
+        self.digest = digest
+        self.fallback = fallback
+
+
+_pending: Dict[Key, _Pending] = {}
+_workers: Dict[Key, asyncio.Task] = {}
+_shown: "OrderedDict[Key, str]" = OrderedDict()
+
+
+def _digest(text: Optional[str], reply_markup: Optional[types.InlineKeyboardMarkup], parse_mode: Optional[str]) -> str:
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else ""
+    return hashlib.blake2b(f"{text}\x00{markup}\x00{parse_mode}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _set_shown(key: Key, digest: str):
+    _shown[key] = digest
+    _shown.move_to_end(key)
+    while len(_shown) > SHOWN_CACHE_SIZE:
+        _shown.popitem(last=False)
+
+
+def remember(chat_id: int, message_id: int, text: Optional[str],
+             reply_markup: Optional[types.InlineKeyboardMarkup] = None, parse_mode: Optional[str] = None):
+    """Запоминает, что сейчас показано в только что отправленном сообщении."""
+    _set_shown((chat_id, message_id), _digest(text, reply_markup, parse_mode))
+
+
+def schedule(bot: Bot, chat_id: int, message_id: int, text: Optional[str],
+             reply_markup: Optional[types.InlineKeyboardMarkup] = None, parse_mode: Optional[str] = None,
+             fallback: Optional[Callable[[], Awaitable]] = None):
+    """
+    Ставит перерисовку сообщения в очередь (не ждёт её).
+    text=None — меняется только клавиатура. fallback() вызывается, если сообщение
+    нельзя отредактировать (удалено, слишком старое и т.п.) — например, чтобы прислать новое.
+    """
+    key = (chat_id, message_id)
+    _pending[key] = _Pending(text, reply_markup, parse_mode, _digest(text, reply_markup, parse_mode), fallback)
+    if key not in _workers:
+        _workers[key] = asyncio.create_task(_worker(bot, key))
+
+
+def cancel(chat_id: int, message_id: int) -> Optional[_Pending]:
+    """
+    Отменяет ещё не отправленную перерисовку (сообщение сейчас удалят).
+    Возвращает отменённое состояние — если сообщение переотправляют, показать стоит его.
+    """
+    return _pending.pop((chat_id, message_id), None)
+
+
+async def _worker(bot: Bot, key: Key):
+    chat_id, message_id = key
+    try:
+        while key in _pending:
+            await asyncio.sleep(DEBOUNCE_SEC)
+            state = _pending.pop(key, None)
+            if state is None or _shown.get(key) == state.digest:
+                continue
+            try:
+                if state.text is None:
+                    await bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id,
+                                                        reply_markup=state.reply_markup)
+                else:
+                    await bot.edit_message_text(state.text, chat_id=chat_id, message_id=message_id,
+                                                reply_markup=state.reply_markup, parse_mode=state.parse_mode)
+                _set_shown(key, state.digest)
+            except TelegramRetryAfter as e:
+                # подождём и отправим самое свежее состояние (если новых нажатий не было — это же)
+                _pending.setdefault(key, state)
+                await asyncio.sleep(e.retry_after)
+            except TelegramBadRequest as e:
+                if "message is not modified" in str(e):
+                    _set_shown(key, state.digest)
+                elif state.fallback is not None:
+                    _pending.pop(key, None)
+                    await state.fallback()
+                else:
+                    print(f"render: не удалось обновить сообщение {message_id} в {chat_id}: {e}")
+    except Exception as e:
+        print(f"render: ошибка перерисовки {message_id} в {chat_id}: {e}")
+    finally:
+        _workers.pop(key, None)
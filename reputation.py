@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Репутация продавца: «Отзывы о продавце» под объявлением.
+
+Агрегат ведётся на продавца в seller_reputation: число одобренных отзывов,
+сумма и число оценок (средняя = сумма / число) и последние отзывы в JSON.
+Обновляется инкрементально при одобрении отзыва (admin.handle_feedback_moderation),
+в той же транзакции, — так что открыть репутацию продавца это чтение одной строки.
+Следующие страницы отзывов читаются из ad_feedback по индексу (seller_id, status, id).
+"""
+import json
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramAPIError
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from config import SELLER_FEEDBACK_PAGE_SIZE
+from database import SessionLocal, Ad, AdFeedback, SellerReputation
+from callbacks import get_router
+
+_table = SellerReputation.__table__
+
+
+class FeedbackItem(NamedTuple):
+    id: int
+    rating: Optional[int]
+    comment: Optional[str]
+    created_at: Optional[datetime]
+
+
+def _pack(items: List[FeedbackItem]) -> str:
+    return json.dumps(
+        [[i.id, i.rating, i.comment, i.created_at.isoformat() if i.created_at else None] for i in items],
+        ensure_ascii=False
+    )
+
+
+def _unpack(raw: Optional[str]) -> List[FeedbackItem]:
+    return [
+        FeedbackItem(fb_id, rating, comment, datetime.fromisoformat(ts) if ts else None)
+        for fb_id, rating, comment, ts in json.loads(raw or "[]")
+    ]
+
+
+def apply_approved(sess, fb: AdFeedback):
+    """
+    Учитывает только что одобренный отзыв в агрегате продавца. Коммит — за вызывающим.
+    Строка продавца блокируется upsert'ом до конца транзакции, поэтому
+    параллельные одобрения не теряют друг друга в списке последних отзывов.
+    """
+    if fb.seller_id is None:
+        fb.seller_id = sess.execute(select(Ad.user_id).where(Ad.id == fb.ad_id)).scalar_one()
+    has_rating = fb.rating is not None
+
+    stmt = insert(_table).values(
+        seller_id=fb.seller_id, feedback_count=1, rating_count=int(has_rating),
+        rating_sum=fb.rating or 0, last_feedback_at=fb.created_at, recent="[]"
+    )
+    recent = sess.execute(stmt.on_conflict_do_update(
+        index_elements=[_table.c.seller_id],
+        set_={
+            "feedback_count": _table.c.feedback_count + 1,
+            "rating_count": _table.c.rating_count + stmt.excluded.rating_count,
+            "rating_sum": _table.c.rating_sum + stmt.excluded.rating_sum,
+            "last_feedback_at": func.greatest(_table.c.last_feedback_at, stmt.excluded.last_feedback_at),
+        }
+    ).returning(_table.c.recent)).scalar_one()
+
+    # последние отзывы храним в том же порядке, что и страницы из ad_feedback (id по убыванию)
+    items = [i for i in _unpack(recent) if i.id != fb.id]
+    items.append(FeedbackItem(fb.id, fb.rating, fb.comment, fb.created_at))
+    items.sort(key=lambda i: i.id, reverse=True)
+    sess.execute(
+        update(_table)
+        .where(_table.c.seller_id == fb.seller_id)
+        .values(recent=_pack(items[:SELLER_FEEDBACK_PAGE_SIZE]))
+    )
+
+
+def feedback_page(seller_id: int, page: int = 0) -> Tuple[Optional[SellerReputation], List[FeedbackItem], bool]:
+    """(агрегат продавца или None, отзывы страницы, есть ли следующая страница)."""
+    size = SELLER_FEEDBACK_PAGE_SIZE
+    with SessionLocal() as sess:
+        rep = sess.get(SellerReputation, seller_id)
+        if rep is None:
+            return None, [], False
+        sess.expunge(rep)
+
+        items = _unpack(rep.recent)
+        if page > 0 or len(items) < min(size, rep.feedback_count):
+            items = [
+                FeedbackItem(*row) for row in sess.execute(
+                    select(AdFeedback.id, AdFeedback.rating, AdFeedback.comment, AdFeedback.created_at)
+                    .where(AdFeedback.seller_id == seller_id, AdFeedback.status == "approved")
+                    .order_by(AdFeedback.id.desc())
+                    .offset(page * size)
+                    .limit(size)
+                ).all()
+            ]
+    return rep, items[:size], rep.feedback_count > (page + 1) * size
+
+
+def _stars(rating: int) -> str:
+    rating = max(0, min(5, rating))
+    return "★" * rating + "☆" * (5 - rating)
+
+
+def reputation_text(rep: Optional[SellerReputation], items: List[FeedbackItem], page: int) -> str:
+    if rep is None or not rep.feedback_count:
+        return "Отзывов о продавце пока нет."
+    lines = ["Отзывы о продавце"]
+    if rep.rating_count:
+        lines.append(f"Оценка: {rep.rating_sum / rep.rating_count:.1f} из 5 ({rep.rating_count} оценок)")
+    lines.append(f"Отзывов: {rep.feedback_count}" + (f", стр. {page + 1}" if page else ""))
+    for item in items:
+        head = _stars(item.rating) if item.rating is not None else "без оценки"
+        if item.created_at:
+            head += f" · {item.created_at:%d.%m.%y}"
+        comment = (item.comment or "").strip()
+        if len(comment) > 500:
+            comment = comment[:500] + "…"
+        lines.append(f"\n{head}" + (f"\n{comment}" if comment else ""))
+    return "\n".join(lines)
+
+
+def register_reputation_handlers(bot: Bot, dp: Dispatcher):
+    cb = get_router(dp)
+
+    @cb.route("viewfeedback_seller_")
+    async def view_seller_feedback(call: types.CallbackQuery):
+        """
+        viewfeedback_seller_{seller_id}         — новое сообщение с первой страницей;
+        viewfeedback_seller_{seller_id}_{page}  — листание, правим то же сообщение.
+        """
+        parts = call.data[len("viewfeedback_seller_"):].split("_")
+        try:
+            seller_id = int(parts[0])
+            page = max(0, int(parts[1])) if len(parts) > 1 else None
+        except ValueError:
+            return await bot.answer_callback_query(call.id, "Некорректный продавец.", show_alert=True)
+
+        rep, items, has_next = feedback_page(seller_id, page or 0)
+        text = reputation_text(rep, items, page or 0)
+
+        nav = []
+        if page:
+            nav.append(types.InlineKeyboardButton(text="⏪ Назад", callback_data=f"viewfeedback_seller_{seller_id}_{page - 1}"))
+        if has_next:
+            nav.append(types.InlineKeyboardButton(text="Вперёд ⏩", callback_data=f"viewfeedback_seller_{seller_id}_{(page or 0) + 1}"))
+        buttons = [nav] if nav else []
+        buttons.append([ types.InlineKeyboardButton(text="❌ Закрыть", callback_data="delete_msg") ])
+        kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
+
+        await bot.answer_callback_query(call.id)
+        if page is None:
+            return await bot.send_message(call.message.chat.id, text, reply_markup=kb)
+        try:
+            return await bot.edit_message_text(text, chat_id=call.message.chat.id, message_id=call.message.message_id,
+                                               reply_markup=kb)
+        except TelegramAPIError as e:
+            if "message is not modified" not in str(e):
+                raise
+            return None
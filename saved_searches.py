@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Сохранённые поиски и уведомления о новых объявлениях.
+
+Под результатами поиска есть кнопка «🔔 Сохранить поиск»: фильтр из токена
+(search_query.py) раскладывается по колонкам saved_searches. Когда модератор одобряет
+объявления (moderation.decide — из очереди или по кнопкам в группе), on_approved()
+находит подписчиков индексом ix_saved_searches_match, а не перебором подписок:
+для ключа объявления (город, категория, подкатегория) подходят лишь
+(категория, подкатегория) ∈ {(к, п), (к, ""), ("", "")} и место «любое», этот город,
+регион-префикс города или свой город — подстрока.
+
+Найденное копится в памяти (пользователь → новые объявления) и раз в ALERT_FLUSH_SEC
+уходит одним сообщением на пользователя не быстрее ALERT_RATE_PER_SEC сообщений
+в секунду. Очередь не переживает перезапуск — уведомления best effort, сами
+объявления всегда доступны поиском.
+"""
+import asyncio
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import and_, delete, func, literal, or_, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+import callbacks
+import catalog
+import search_query
+import users
+from config import ALERT_FLUSH_SEC, ALERT_MAX_ADS_PER_MESSAGE, ALERT_RATE_PER_SEC, SAVED_SEARCH_LIMIT
+from database import SessionLocal, Ad, SavedSearch
+
+LOCATION_ANY = "any"
+LOCATION_CITY = "city"
+LOCATION_REGION = "region"
+LOCATION_CUSTOM = "custom"
+
+_table = SavedSearch.__table__
+
+# пользователь → {ad_id: подпись кнопки}, ещё не отправленные
+_pending: Dict[int, "OrderedDict[int, str]"] = defaultdict(OrderedDict)
+
+
+def filter_columns(query: search_query.SearchQuery) -> dict:
+    """Фильтр запроса в колонках saved_searches."""
+    city, region_wide, is_custom = query.location()
+    if city is None:
+        kind, location = LOCATION_ANY, ""
+    elif is_custom:
+        kind, location = LOCATION_CUSTOM, city.lower()
+    elif region_wide:
+        kind, location = LOCATION_REGION, city
+    else:
+        kind, location = LOCATION_CITY, city
+    category, subcategory = query.category_names()
+    return {
+        "location_kind": kind,
+        "location": location,
+        "category": category or "",
+        "subcategory": subcategory or "",
+    }
+
+
+def save(user_id: int, token: str, query: search_query.SearchQuery) -> bool:
+    """Сохраняет поиск. False — достигнут SAVED_SEARCH_LIMIT (повторное сохранение — не ошибка)."""
+    with SessionLocal() as sess:
+        saved = sess.execute(
+            select(func.count()).select_from(_table).where(_table.c.user_id == user_id)
+        ).scalar_one()
+        if saved >= SAVED_SEARCH_LIMIT:
+            return False
+        users.ensure_user(user_id, sess=sess)
+        sess.execute(
+            insert(_table)
+            .values(user_id=user_id, token=token, **filter_columns(query))
+            .on_conflict_do_nothing(index_elements=[_table.c.user_id, _table.c.token])
+        )
+        sess.commit()
+    return True
+
+
+def user_searches(user_id: int) -> List[Tuple[int, str]]:
+    with SessionLocal() as sess:
+        return sess.execute(
+            select(SavedSearch.id, SavedSearch.token)
+            .where(SavedSearch.user_id == user_id)
+            .order_by(SavedSearch.id)
+        ).all()
+
+
+def remove(user_id: int, search_id: int = None):
+    """Удаляет подписку пользователя (или все, если search_id не указан)."""
+    stmt = delete(SavedSearch).where(SavedSearch.user_id == user_id)
+    if search_id is not None:
+        stmt = stmt.where(SavedSearch.id == search_id)
+    with SessionLocal() as sess:
+        sess.execute(stmt)
+        sess.commit()
+
+
+def _regions_of(city: str) -> List[str]:
+    # поиск «по всему региону» — префикс ads.city (см. search_query), регионов немного
+    city = city.lower()
+    return [r.name for r in catalog.REGIONS if city.startswith(r.name.lower())]
+
+
+def _like_literal(expr):
+    # подстрока из колонки как обычный текст: экранируем \, % и _ (как autoescape в search_query)
+    for ch in ("\\", "%", "_"):
+        expr = func.replace(expr, ch, "\\" + ch)
+    return expr
+
+
+def match_users(sess, city: str, category: str, subcategory: str) -> Set[int]:
+    """Подписчики объявления с ключом (ads.city, категория, подкатегория)."""
+    pairs = {(category, subcategory), (category, ""), ("", "")}
+    places = [
+        SavedSearch.location_kind == LOCATION_ANY,
+        and_(SavedSearch.location_kind == LOCATION_CITY, SavedSearch.location == city),
+        and_(SavedSearch.location_kind == LOCATION_CUSTOM, literal(city.lower()).contains(_like_literal(SavedSearch.location), escape="\\")),
+    ]
+    regions = _regions_of(city)
+    if regions:
+        places.append(and_(SavedSearch.location_kind == LOCATION_REGION, SavedSearch.location.in_(regions)))
+    return set(sess.execute(
+        select(SavedSearch.user_id).distinct()
+        .where(tuple_(SavedSearch.category, SavedSearch.subcategory).in_(list(pairs)), or_(*places))
+    ).scalars())
+
+
+def on_approved(ad_ids: Iterable[int]) -> int:
+    """
+    Ставит в очередь уведомления о только что одобренных объявлениях.
+    Один запрос подписчиков на ключ (город, категория, подкатегория), а не на объявление.
+    Возвращает число поставленных уведомлений.
+    """
+    ad_ids = list(ad_ids)
+    if not ad_ids:
+        return 0
+    queued = 0
+    with SessionLocal() as sess:
+        rows = sess.execute(
+            select(Ad.id, Ad.user_id, Ad.city, Ad.category, Ad.subcategory,
+                   Ad.inline_button_text, func.substr(Ad.text, 1, 15).label("text_head"))
+            .where(Ad.id.in_(ad_ids), Ad.status == "approved", Ad.is_active == True)
+            .order_by(Ad.id)
+        ).all()
+        by_key = defaultdict(list)
+        for row in rows:
+            by_key[(row.city or "", row.category or "", row.subcategory or "")].append(row)
+        for key, ads in by_key.items():
+            for user_id in match_users(sess, *key):
+                for ad in ads:
+                    if ad.user_id != user_id:
+                        _pending[user_id][ad.id] = ad.inline_button_text or f"{ad.text_head}..."
+                        queued += 1
+    return queued
+
+
+def _alert_message(ads: "OrderedDict[int, str]") -> Tuple[str, types.InlineKeyboardMarkup]:
+    shown = list(ads.items())[-ALERT_MAX_ADS_PER_MESSAGE:]
+    text = f"🔔 Новые объявления по вашим сохранённым поискам: {len(ads)}."
+    if len(ads) > len(shown):
+        text += f"\nПоказаны последние {len(shown)}, остальные — в поиске."
+    kb = types.InlineKeyboardMarkup(inline_keyboard=[
+        [ types.InlineKeyboardButton(text=label, callback_data=callbacks.SEARCH_OPEN_AD.pack(ad_id)) ]
+        for ad_id, label in reversed(shown)
+    ] + [[ types.InlineKeyboardButton(text="Мои подписки", callback_data=SAVED_LIST) ]])
+    return text, kb
+
+
+async def flush(bot: Bot) -> int:
+    """Рассылает накопленное: одно сообщение на пользователя. Возвращает число отправленных."""
+    batch = list(_pending.items())
+    _pending.clear()
+    sent = 0
+    for i, (user_id, ads) in enumerate(batch):
+        text, kb = _alert_message(ads)
+        try:
+            await bot.send_message(user_id, text, reply_markup=kb)
+            sent += 1
+        except TelegramRetryAfter as e:
+            # упёрлись в лимит Telegram: это и оставшееся — следующим проходом (новые объявления — после)
+            for rest_user, rest_ads in batch[i:]:
+                newer = _pending.pop(rest_user, None)
+                if newer:
+                    rest_ads.update(newer)
+                _pending[rest_user] = rest_ads
+            await asyncio.sleep(e.retry_after)
+            break
+        except TelegramForbiddenError:
+            # бот заблокирован — подписки больше некому доставлять
+            await asyncio.to_thread(remove, user_id)
+        except Exception as e:
+            print(f"Не удалось отправить уведомление {user_id}: {e}")
+        await asyncio.sleep(1 / ALERT_RATE_PER_SEC)
+    return sent
+
+
+async def alert_loop(bot: Bot):
+    """Фоновая задача (запускается в on_startup, см. bot.py)."""
+    while True:
+        await asyncio.sleep(ALERT_FLUSH_SEC)
+        try:
+            await flush(bot)
+        except Exception as e:
+            print("Ошибка при рассылке уведомлений о новых объявлениях:", e)
+
+
+# ────────────────────────────────────────────────────────────────────
+#   Хендлеры: сохранить поиск, список подписок, удалить
+# ────────────────────────────────────────────────────────────────────
+SAVED_LIST = "saved_searches_list"
+
+
+def save_button(token: str) -> types.InlineKeyboardButton:
+    """Кнопка «Сохранить поиск» под результатами (search.py)."""
+    return types.InlineKeyboardButton(text="🔔 Сохранить поиск", callback_data=callbacks.SEARCH_SAVE.pack(token))
+
+
+async def _searches_view(bot: Bot, user_id: int) -> Tuple[str, types.InlineKeyboardMarkup]:
+    rows = user_searches(user_id)
+    if not rows:
+        return (
+            "Сохранённых поисков нет. Найдите объявления через «🔍Поиск объявлений» "
+            "и нажмите «🔔 Сохранить поиск» — пришлём новые объявления по нему.",
+            None
+        )
+    username = (await bot.me()).username
+    lines, buttons = [f"🔔 Сохранённые поиски ({len(rows)} из {SAVED_SEARCH_LIMIT}):"], []
+    for n, (search_id, token) in enumerate(rows, 1):
+        try:
+            lines.append(f"{n}. {search_query.decode(token).describe()}")
+            row = [ types.InlineKeyboardButton(
+                text=f"{n}. Открыть", url=f"https://t.me/{username}?start={search_query.DEEP_LINK_PREFIX}{token}"
+            ) ]
+        except ValueError:
+            lines.append(f"{n}. (устарел — справочник городов/категорий изменился)")
+            row = []
+        row.append(types.InlineKeyboardButton(text=f"{n}. Удалить", callback_data=callbacks.SAVED_SEARCH_DELETE.pack(search_id)))
+        buttons.append(row)
+    return "\n".join(lines), types.InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def register_saved_search_handlers(bot: Bot, dp: Dispatcher):
+    cb = callbacks.get_router(dp)
+
+    @cb.route(callbacks.SEARCH_SAVE)
+    async def handle_save(call: types.CallbackQuery, args: tuple):
+        token, = args
+        try:
+            query = search_query.decode(token)
+        except ValueError:
+            return await bot.answer_callback_query(call.id, "Поиск устарел, начните его заново.", show_alert=True)
+        if not save(call.from_user.id, token, query):
+            return await bot.answer_callback_query(
+                call.id, f"Можно сохранить не больше {SAVED_SEARCH_LIMIT} поисков. Удалите лишние в «🔔 Мои подписки».",
+                show_alert=True
+            )
+        return await bot.answer_callback_query(call.id, "Поиск сохранён: пришлём новые объявления по нему.", show_alert=True)
+
+    @dp.message(lambda m: m.text == "🔔 Мои подписки")
+    async def list_searches(message: types.Message):
+        text, kb = await _searches_view(bot, message.chat.id)
+        await bot.send_message(message.chat.id, text, reply_markup=kb)
+
+    @cb.route(exact=(SAVED_LIST,))
+    async def list_searches_inline(call: types.CallbackQuery):
+        await bot.answer_callback_query(call.id)
+        text, kb = await _searches_view(bot, call.from_user.id)
+        await bot.send_message(call.from_user.id, text, reply_markup=kb)
+
+    @cb.route(callbacks.SAVED_SEARCH_DELETE)
+    async def handle_delete(call: types.CallbackQuery, args: tuple):
+        search_id, = args
+        remove(call.from_user.id, search_id)
+        await bot.answer_callback_query(call.id, "Подписка удалена.")
+        text, kb = await _searches_view(bot, call.from_user.id)
+        try:
+            await bot.edit_message_text(text, chat_id=call.message.chat.id, message_id=call.message.message_id,
+                                        reply_markup=kb)
+        except Exception:
+            await bot.send_message(call.message.chat.id, text, reply_markup=kb)
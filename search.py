@@ -1,9 +1,18 @@
 #!/usr/bin/env python3
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, Dispatcher, F, types
+from aiogram.filters import CommandObject, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 
-from config import MAIN_CATEGORIES, CITY_STRUCTURE, ADMIN_COMPLAINT_CHAT_ID
+import callbacks
+import catalog
+import counters
+import render
+import saved_searches
+import search_cache
+import search_query
+import users
+from config import ADMIN_COMPLAINT_CHAT_ID
 from database import SessionLocal, Ad, User, AdChat, Sale
 from utils import main_menu_keyboard
 
@@ -18,40 +27,59 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
       2) Выбор конкретного города/округа
       3) Выбор категории (или все)
       4) Выбор подкатегории (или пропустить)
-      5) Поиск, постраничный вывод (10 на страницу)
+      5) Поиск, постраничный вывод (SEARCH_PAGE_SIZE на страницу) — без состояния:
+         запрос живёт в подписанном токене (search_query.py), страницы — по курсору,
+         ссылка ?start=s_<токен> открывает тот же поиск
       6) Кнопки «купить», «детали», «написать продавцу», и теперь:
          - если сделка завершена => «Оставить отзыв»
          - иначе => «Пожаловаться»
     """
+    cb = callbacks.get_router(dp)
+
     @dp.message(lambda m: m.text == "🔍Поиск объявлений")
     async def start_search_flow(message: types.Message):
         chat_id = message.chat.id
+        # в состоянии храним только коды из catalog.py (и свой город текстом)
         user_steps[chat_id] = {
             "mode": "search_flow",
-            "picked_region": None,
-            "region_list": [],
-            "city_list": [],
+            "region": None,
             "city": None,
+            "custom_city": None,
             "use_region_wide": False,
-            "is_custom_city": False,
             "category": None,
-            "subcat_list": [],
-            "subcategory": None,
-            "search_results": [],
-            "shown_count": 0
+            "subcategory": None
         }
         await ask_for_region(chat_id)
 
+    def query_from_steps(st) -> search_query.SearchQuery:
+        """Запрос из кодов, выбранных в меню поиска."""
+        return search_query.SearchQuery(
+            region=st["region"],
+            city=st["city"],
+            custom_city=st["custom_city"],
+            region_wide=st["use_region_wide"],
+            category=st["category"],
+            subcategory=st["subcategory"],
+        )
+
+    def search_location(st):
+        """
+        Фильтр по месту из кодов состояния: (строка города, по всему региону, свой город).
+        Строка — в формате ads.city, как её понимают поиск и counters.
+        """
+        return query_from_steps(st).location()
+
     # ====================== Шаг 1: Выбор региона ======================
     async def ask_for_region(chat_id):
-        region_names = list(CITY_STRUCTURE.keys())
-        user_steps[chat_id]["region_list"] = region_names
+        # показываем только регионы, где есть живые объявления (по ad_counters)
+        totals = counters.city_totals()
+        reg_counts = counters.region_counts((r.name for r in catalog.REGIONS), totals)
 
         txt = "1) Выберите регион или «Добавить свой город», либо «Пропустить»:"
 
         buttons = [
-            [ types.InlineKeyboardButton(text=reg_name, callback_data=f"srch_region_{i}") ]
-            for i, reg_name in enumerate(region_names)
+            [ types.InlineKeyboardButton(text=f"{reg.name} ({reg_counts[reg.name]})", callback_data=callbacks.SEARCH_REGION.pack(reg.code)) ]
+            for reg in catalog.REGIONS if reg_counts[reg.name] > 0
         ]
         buttons.append([ types.InlineKeyboardButton(text="Добавить свой город", callback_data="srch_city_custom") ])
         buttons.append([ types.InlineKeyboardButton(text="Пропустить город", callback_data="srch_city_skip") ])
@@ -59,9 +87,8 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await bot.send_message(chat_id, txt, reply_markup=kb)
 
-    @dp.callback_query(lambda call: call.data.startswith("srch_region_") or
-        call.data in ("srch_city_custom", "srch_city_skip", "srch_cancel"))
-    async def handle_region_choice(call: types.CallbackQuery, state: FSMContext):
+    @cb.route(callbacks.SEARCH_REGION, exact=("srch_city_custom", "srch_city_skip", "srch_cancel"))
+    async def handle_region_choice(call: types.CallbackQuery, state: FSMContext, args: tuple):
         chat_id = call.message.chat.id
         if chat_id not in user_steps or user_steps[chat_id]["mode"] != "search_flow":
             return await bot.answer_callback_query(call.id, "Нет активного поиска", show_alert=True)
@@ -81,8 +108,8 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             await bot.delete_message(chat_id, call.message.message_id)
             await bot.answer_callback_query(call.id, "Без города")
             st["city"] = None
+            st["custom_city"] = None
             st["use_region_wide"] = False
-            st["is_custom_city"] = False
             return await ask_for_category(chat_id)
 
         if call.data == "srch_city_custom":
@@ -92,26 +119,17 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             await state.set_state(SearchStates.custom_city)
             return await bot.send_message(chat_id, "Введите свой город (поиск будет по частичному совпадению):")
 
-        # srch_region_{i}
-        if call.data.startswith("srch_region_"):
-            idx_str = call.data.replace("srch_region_", "")
-            try:
-                idx = int(idx_str)
-            except:
-                return await bot.answer_callback_query(call.id, "Ошибка индекса региона", show_alert=True)
-            regions = st["region_list"]
-            if idx < 0 or idx >= len(regions):
-                return await bot.answer_callback_query(call.id, "Недопустимый индекс", show_alert=True)
-
-            chosen_region = regions[idx]
-            st["picked_region"] = chosen_region
-            st["is_custom_city"] = False
+        # SEARCH_REGION(code)
+        region = catalog.REGION_BY_CODE.get(args[0])
+        if not region:
+            return await bot.answer_callback_query(call.id, "Недопустимый регион", show_alert=True)
 
-            await bot.delete_message(chat_id, call.message.message_id)
-            await bot.answer_callback_query(call.id, f"Регион: {chosen_region}")
-            return await show_city_list(chat_id)
-        else:
-            return None
+        st["region"] = region.code
+        st["custom_city"] = None
+
+        await bot.delete_message(chat_id, call.message.message_id)
+        await bot.answer_callback_query(call.id, f"Регион: {region.name}")
+        return await show_city_list(chat_id)
 
     @dp.message(SearchStates.custom_city)
     async def process_custom_city(message: types.Message, state: FSMContext):
@@ -120,36 +138,36 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         if chat_id not in user_steps or user_steps[chat_id]["mode"] != "search_flow":
             return
 
-        city_str = message.text.strip()
         st = user_steps[chat_id]
-        st["city"] = city_str
+        st["city"] = None
+        # обрезаем сразу: свой город должен влезть в токен поиска
+        st["custom_city"] = search_query.truncate_city(message.text or "")
         st["use_region_wide"] = False
-        st["is_custom_city"] = True
 
         await ask_for_category(chat_id)
 
     # ====================== Шаг 2: Выбор города/округа ======================
     async def show_city_list(chat_id):
         st = user_steps[chat_id]
-        region_name = st["picked_region"]
-        city_list = CITY_STRUCTURE.get(region_name, [])
-        st["city_list"] = city_list
+        region = catalog.REGION_BY_CODE[st["region"]]
+        totals = counters.city_totals()
+        region_total = counters.region_counts([region.name], totals)[region.name]
 
-        txt = f"Регион: {region_name}\nВыберите конкретный округ или «По всему региону»:"
+        txt = f"Регион: {region.name}\nВыберите конкретный округ или «По всему региону»:"
         buttons = [[
             # «По всему региону»
-            types.InlineKeyboardButton(text=f"По всему региону «{region_name}»", callback_data="srch_wide_region")
+            types.InlineKeyboardButton(text=f"По всему региону «{region.name}» ({region_total})", callback_data="srch_wide_region")
         ]]
-        for i, c_name in enumerate(city_list):
-            buttons.append([ types.InlineKeyboardButton(text=c_name, callback_data=f"srch_city_{i}") ])
+        for city in region.cities:
+            cnt = totals.get(city.full_name, 0)
+            if cnt > 0:
+                buttons.append([ types.InlineKeyboardButton(text=f"{city.name} ({cnt})", callback_data=callbacks.SEARCH_CITY.pack(city.code)) ])
         buttons.append([ types.InlineKeyboardButton(text="Назад к регионам", callback_data="srch_back_regions") ])
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await bot.send_message(chat_id, txt, reply_markup=kb)
 
-    @dp.callback_query(lambda call:
-        call.data.startswith("srch_city_") or
-        call.data in ("srch_wide_region", "srch_back_regions"))
-    async def handle_city_selection(call: types.CallbackQuery):
+    @cb.route(callbacks.SEARCH_CITY, exact=("srch_wide_region", "srch_back_regions"))
+    async def handle_city_selection(call: types.CallbackQuery, args: tuple):
         chat_id = call.message.chat.id
         if chat_id not in user_steps or user_steps[chat_id]["mode"] != "search_flow":
             return await bot.answer_callback_query(call.id, "Нет активного поиска", show_alert=True)
@@ -162,124 +180,108 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             return await ask_for_region(chat_id)
 
         if call.data == "srch_wide_region":
-            region_name = st["picked_region"]
-            st["city"] = region_name
+            region = catalog.REGION_BY_CODE.get(st["region"])
+            if not region:
+                return await bot.answer_callback_query(call.id, "Сначала выберите регион", show_alert=True)
+            st["city"] = None
             st["use_region_wide"] = True
-            st["is_custom_city"] = False
             await bot.delete_message(chat_id, call.message.message_id)
-            await bot.answer_callback_query(call.id, f"По всему региону: {region_name}")
+            await bot.answer_callback_query(call.id, f"По всему региону: {region.name}")
             return await ask_for_category(chat_id)
 
-        if call.data.startswith("srch_city_"):
-            idx_str = call.data.replace("srch_city_", "")
-            try:
-                idx = int(idx_str)
-            except:
-                return await bot.answer_callback_query(call.id, "Ошибка индекса города", show_alert=True)
-            c_list = st["city_list"]
-            if idx < 0 or idx >= len(c_list):
-                return await bot.answer_callback_query(call.id, "Недопустимый индекс города", show_alert=True)
-
-            chosen_city = c_list[idx]
-            region = st["picked_region"]
-            st["city"] = f"{region} | {chosen_city}"
+        if args:
+            city = catalog.CITY_BY_CODE.get(args[0])
+            if not city:
+                return await bot.answer_callback_query(call.id, "Недопустимый город", show_alert=True)
+
+            st["region"] = city.region_code
+            st["city"] = city.code
             st["use_region_wide"] = False
-            st["is_custom_city"] = False
 
             await bot.delete_message(chat_id, call.message.message_id)
-            await bot.answer_callback_query(call.id, f"Город: {region} | {chosen_city}")
+            await bot.answer_callback_query(call.id, f"Город: {city.full_name}")
             return await ask_for_category(chat_id)
         else:
             return None
 
     # ====================== Шаг 3: Выбор категории ======================
     async def ask_for_category(chat_id):
-        categories = list(MAIN_CATEGORIES.keys())
+        st = user_steps[chat_id]
+        cat_counts = counters.category_counts(*search_location(st))
+        total = sum(cat_counts.values())
+        if not total:
+            # по выбранному месту объявлений нет — не гоняем пустой поиск
+            user_steps.pop(chat_id, None)
+            return await bot.send_message(
+                chat_id,
+                "Ничего не найдено по заданным критериям.",
+                reply_markup=main_menu_keyboard()
+            )
+
+        categories = [cat for cat in catalog.CATEGORIES if cat_counts.get(cat.name, 0) > 0]
+        button = lambda cat: types.InlineKeyboardButton(
+            text=f"{cat.name} ({cat_counts[cat.name]})", callback_data=callbacks.SEARCH_CATEGORY.pack(cat.code)
+        )
         buttons = [
-            [
-                types.InlineKeyboardButton(text=f, callback_data=f"srch_cat_{f}"),
-                types.InlineKeyboardButton(text=s, callback_data=f"srch_cat_{s}")
-            ]
+            [ button(f), button(s) ]
             for (f, s) in zip(categories[::2], categories[1::2])
         ]
         if len(categories) % 2 > 0:
-            last = categories[len(categories) - 1]
-            buttons.append([
-                types.InlineKeyboardButton(text=last, callback_data=f"srch_cat_{last}")
-            ])
+            buttons.append([ button(categories[-1]) ])
         buttons.append([
-            types.InlineKeyboardButton(text="Все категории", callback_data="srch_cat_all"),
+            types.InlineKeyboardButton(text=f"Все категории ({total})", callback_data="srch_cat_all"),
             types.InlineKeyboardButton(text="Отмена", callback_data="srch_cancel")
         ])
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await bot.send_message(chat_id, "3) Выберите категорию или «Все категории»:", reply_markup=kb)
 
-    @dp.callback_query(lambda call:
-        call.data.startswith("srch_cat_") or
-        call.data in ("srch_cat_all", "srch_cancel"))
-    async def handle_category_choice(call: types.CallbackQuery):
+    @cb.route(callbacks.SEARCH_CATEGORY, exact=("srch_cat_all",))
+    async def handle_category_choice(call: types.CallbackQuery, args: tuple):
         chat_id = call.message.chat.id
         st = user_steps.get(chat_id)
         if not st or st.get("mode") != "search_flow":
             return await bot.answer_callback_query(call.id, "Нет активного поиска", show_alert=True)
 
-        if call.data == "srch_cancel":
-            await bot.delete_message(chat_id, call.message.message_id)
-            await bot.answer_callback_query(call.id, "Поиск отменён.")
-            await bot.send_message(chat_id, "Поиск отменён.", reply_markup=main_menu_keyboard())
-            user_steps.pop(chat_id, None)
-            return None
-
         if call.data == "srch_cat_all":
             await bot.delete_message(chat_id, call.message.message_id)
             await bot.answer_callback_query(call.id, "Все категории")
             st["category"] = None
-            st["subcat_list"] = []
             st["subcategory"] = None
             return await do_search(chat_id)
 
         # выбор конкретной категории
-        if call.data.startswith("srch_cat_"):
-            cat_name = call.data.replace("srch_cat_", "")
-            st["category"] = cat_name
-
-            # раскладываем все записи из MAIN_CATEGORIES[cat_name] по запятым
-            raw_list = MAIN_CATEGORIES.get(cat_name, [])
-            flat = []
-            for entry in raw_list:
-                parts = [p.strip() for p in entry.split(",") if p.strip()]
-                flat.extend(parts)
-            st["subcat_list"] = flat
+        category = catalog.CATEGORY_BY_CODE.get(args[0])
+        if not category:
+            return await bot.answer_callback_query(call.id, "Недопустимая категория", show_alert=True)
+        st["category"] = category.code
+        st["subcategory"] = None
 
-            await bot.delete_message(chat_id, call.message.message_id)
-            await bot.answer_callback_query(call.id, f"Категория: {cat_name}")
-
-            if not flat:
-                # если в категории нет подкатегорий
-                st["subcategory"] = None
-                return await do_search(chat_id)
-            else:
-                return await ask_for_subcategory(chat_id, cat_name)
-        else:
-            return None
+        await bot.delete_message(chat_id, call.message.message_id)
+        await bot.answer_callback_query(call.id, f"Категория: {category.name}")
+        return await ask_for_subcategory(chat_id, category)
 
-    async def ask_for_subcategory(chat_id, cat_name: str):
+    async def ask_for_subcategory(chat_id, category: catalog.Category):
         """
         Шаг 4: предста­вляем пользователю список подкатегорий,
         каждая из которых уже — отдельная кнопка.
+        Показываем только подкатегории, где есть объявления.
         """
         st = user_steps[chat_id]
-        sub_list = st.get("subcat_list", [])
+        sub_counts = counters.subcategory_counts(category.name, *search_location(st))
+        sub_list = [sub for sub in category.subcategories if sub_counts.get(sub.name, 0) > 0]
+        if not sub_list:
+            # если в категории нет подкатегорий с объявлениями
+            return await do_search(chat_id)
+
+        button = lambda sub: types.InlineKeyboardButton(
+            text=f"{sub.name} ({sub_counts[sub.name]})", callback_data=callbacks.SEARCH_SUBCATEGORY.pack(sub.code)
+        )
         buttons = [
-            [
-                types.InlineKeyboardButton(text=sub_list[2 * i], callback_data=f"srch_subcat_{2 * i}"),
-                types.InlineKeyboardButton(text=sub_list[2 * i + 1], callback_data=f"srch_subcat_{2 * i + 1}")
-            ] for i in range(0, len(sub_list) // 2)
+            [ button(f), button(s) ]
+            for (f, s) in zip(sub_list[::2], sub_list[1::2])
         ]
         if len(sub_list) % 2 > 0:
-            buttons.append([
-                types.InlineKeyboardButton(text=sub_list[len(sub_list) - 1], callback_data=f"srch_subcat_{len(sub_list) - 1}")
-            ])
+            buttons.append([ button(sub_list[-1]) ])
         buttons.append([
             types.InlineKeyboardButton(text="Пропустить", callback_data="srch_subcat_skip"),
             types.InlineKeyboardButton(text="Отмена", callback_data="srch_cancel")
@@ -287,13 +289,12 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
         await bot.send_message(
             chat_id,
-            f"Категория «{cat_name}»: выберите подкатегорию:",
+            f"Категория «{category.name}»: выберите подкатегорию:",
             reply_markup=kb
         )
 
-    @dp.callback_query(lambda call:
-        call.data.startswith("srch_subcat_") or call.data == "srch_subcat_skip")
-    async def handle_subcat_choice(call: types.CallbackQuery):
+    @cb.route(callbacks.SEARCH_SUBCATEGORY, exact=("srch_subcat_skip",))
+    async def handle_subcat_choice(call: types.CallbackQuery, args: tuple):
         chat_id = call.message.chat.id
         st = user_steps.get(chat_id)
         if not st or st.get("mode") != "search_flow":
@@ -303,117 +304,120 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
             st["subcategory"] = None
             await bot.answer_callback_query(call.id, "Подкатегория пропущена.")
         else:
-            idx = int(call.data.replace("srch_subcat_", ""))
-            sub_list = st.get("subcat_list", [])
-            if 0 <= idx < len(sub_list):
-                chosen = sub_list[idx]
-                st["subcategory"] = chosen
-                await bot.answer_callback_query(call.id, f"Подкатегория: {chosen}")
-            else:
-                return await bot.answer_callback_query(call.id, "Некорректный индекс", show_alert=True)
+            sub = catalog.SUBCATEGORY_BY_CODE.get(args[0])
+            if not sub or sub.category_code != st.get("category"):
+                return await bot.answer_callback_query(call.id, "Некорректная подкатегория", show_alert=True)
+            st["subcategory"] = sub.code
+            await bot.answer_callback_query(call.id, f"Подкатегория: {sub.name}")
 
         await bot.delete_message(chat_id, call.message.message_id)
         return await do_search(chat_id)
 
     # ====================== Шаг 4: Поиск ======================
     async def do_search(chat_id):
-        st = user_steps[chat_id]
-        city = st["city"]
-        region_ok = st["use_region_wide"]
-        is_custom = st["is_custom_city"]
-        cat = st["category"]
-        subcat = st["subcategory"]
-
-        with SessionLocal() as sess:
-            # Берём только одобренные и активные объявления
-            q = sess.query(Ad).filter(
-                Ad.status == "approved",
-                Ad.is_active == True
-            )
-
-            # --- фильтрация по месту -------------------------------
-            if city is not None:
-                if is_custom:
-                    q = q.filter(Ad.city.ilike(f"%{city}%"))
-                elif region_ok:
-                    q = q.filter(Ad.city.ilike(f"{city}%"))
-                else:
-                    q = q.filter(Ad.city == city)
-
-            # --- фильтрация по категории ---------------------------
-            if cat:
-                q = q.filter(Ad.category == cat)
-            if subcat:
-                q = q.filter(Ad.subcategory == subcat)
-
-            ads_found = q.order_by(Ad.created_at.desc()).all()
-
-        st["search_results"] = ads_found
-        st["shown_count"] = 0
-
-        if not ads_found:
-            await bot.send_message(
+        # дальше поиск живёт только в токене — состояние меню больше не нужно
+        query = query_from_steps(user_steps.pop(chat_id))
+        await show_results(chat_id, query)
+
+    async def show_results(chat_id, query: search_query.SearchQuery):
+        """Первая страница результатов новым сообщением."""
+        page, next_cursor = search_cache.fetch_page(query)
+        if not page:
+            return await bot.send_message(
                 chat_id,
                 "Ничего не найдено по заданным критериям.",
                 reply_markup=main_menu_keyboard()
             )
-            user_steps.pop(chat_id, None)
-            return
-
-        # Показываем первые 10
-        slice_ = ads_found[:10]
-        st["shown_count"] = len(slice_)
 
-        kb = build_results_kb(chat_id, slice_)
-        text = f"Найдено объявлений: {len(ads_found)}.\nВыберите:"
-        sent = await bot.send_message(chat_id, text, reply_markup=kb)
-
-        st["last_list_msg_id"] = sent.message_id
+        token = search_query.encode(query)
+        link = f"https://t.me/{(await bot.me()).username}?start={search_query.DEEP_LINK_PREFIX}{token}"
+        kb = build_results_kb(token, page, 0, next_cursor)
+        text = (
+            f"Найдено объявлений: {search_cache.count(query)}.\n"
+            f"Поиск: {query.describe()}\n"
+            f"Ссылка на этот поиск: {link}\n"
+            "Выберите:"
+        )
+        sent = await bot.send_message(chat_id, text, reply_markup=kb, disable_web_page_preview=True)
+        render.remember(chat_id, sent.message_id, None, kb)
+        return sent
 
-    def build_results_kb(chat_id, ads_slice):
+    def build_results_kb(token, page, cursor, next_cursor):
         buttons = [
             [ types.InlineKeyboardButton(
-                text=ad_obj.inline_button_text or (ad_obj.text[:15] + "..."),
-                callback_data=f"srch_openad_{ad_obj.id}"
-            ) ] for ad_obj in ads_slice
+                text=row.label,
+                callback_data=callbacks.SEARCH_OPEN_AD.pack(row.id)
+            ) ] for row in page
         ]
-        st = user_steps[chat_id]
-        if st["shown_count"] < len(st["search_results"]):
-            buttons.append([ types.InlineKeyboardButton(text="Показать ещё", callback_data="srch_show_more") ])
+        nav = []
+        if cursor:
+            nav.append(types.InlineKeyboardButton(text="В начало", callback_data=callbacks.SEARCH_PAGE.pack(token, 0)))
+        if next_cursor:
+            nav.append(types.InlineKeyboardButton(text="Показать ещё", callback_data=callbacks.SEARCH_PAGE.pack(token, next_cursor)))
+        if nav:
+            buttons.append(nav)
+        buttons.append([ saved_searches.save_button(token) ])
         return types.InlineKeyboardMarkup(inline_keyboard=buttons)
 
-    @dp.callback_query(lambda call: call.data == "srch_show_more")
-    async def handle_show_more(call: types.CallbackQuery):
-        chat_id = call.message.chat.id
-        st = user_steps.get(chat_id)
-        if not st or st["mode"] != "search_flow":
-            return await bot.answer_callback_query(call.id, "Нет активного поиска", show_alert=True)
+    @cb.route(callbacks.SEARCH_PAGE, exact=("srch_show_more",))
+    async def handle_show_more(call: types.CallbackQuery, args: tuple):
+        """Страница результатов по (токен, курсор) — не зависит от памяти процесса."""
+        if call.data == "srch_show_more":
+            # кнопка из списков до перехода на токены: результатов в памяти больше нет
+            return await bot.answer_callback_query(call.id, "Поиск устарел, начните его заново.", show_alert=True)
 
-        ads = st["search_results"]
-        shown = st["shown_count"]
-        slice_ = ads[shown: shown + 10]
-        if not slice_:
+        token, cursor = args
+        try:
+            query = search_query.decode(token)
+        except ValueError:
+            return await bot.answer_callback_query(call.id, "Поиск устарел, начните его заново.", show_alert=True)
+
+        page, next_cursor = search_cache.fetch_page(query, cursor)
+        if not page:
             return await bot.answer_callback_query(call.id, "Больше объявлений нет.", show_alert=True)
 
-        st["shown_count"] += len(slice_)
-        kb = build_results_kb(chat_id, slice_)
+        chat_id = call.message.chat.id
+        kb = build_results_kb(token, page, cursor, next_cursor)
+        await bot.answer_callback_query(call.id)
 
-        try:
-            await bot.edit_message_reply_markup(chat_id=chat_id,
-                                                message_id=st["last_list_msg_id"],
-                                                reply_markup=kb)
-        except:
+        async def send_new():
+            # вдруг старое нельзя было редактировать
             sent = await bot.send_message(chat_id, "Дополнительные объявления:", reply_markup=kb)
-            st["last_list_msg_id"] = sent.message_id  # вдруг старое нельзя было редактировать
+            render.remember(chat_id, sent.message_id, None, kb)
 
-        return await bot.answer_callback_query(call.id)
+        # меняется только клавиатура; быстрые повторные нажатия сольются в одну правку
+        render.schedule(bot, chat_id, call.message.message_id, None, kb, fallback=send_new)
+
+    @dp.message(CommandStart(deep_link=True, magic=F.args.startswith(search_query.DEEP_LINK_PREFIX)),
+                F.chat.type == "private")
+    async def open_search_link(message: types.Message, command: CommandObject):
+        """Ссылка ?start=s_<токен> — сразу результаты этого поиска."""
+        chat_id = message.chat.id
+        first_visit = not users.is_registered(chat_id)
+        users.ensure_user(chat_id, message.from_user.username)
+        if first_visit:
+            await bot.send_message(
+                chat_id,
+                "🎉 Добро пожаловать в Adix! Используя бота, вы соглашаетесь с пользовательскими "
+                "соглашениями — они в приветствии по команде /start.",
+                reply_markup=main_menu_keyboard()
+            )
+
+        try:
+            query = search_query.decode(command.args[len(search_query.DEEP_LINK_PREFIX):])
+        except ValueError:
+            return await bot.send_message(
+                chat_id,
+                "Ссылка на поиск устарела или повреждена. Начните поиск заново: «🔍Поиск объявлений».",
+                reply_markup=main_menu_keyboard()
+            )
+        return await show_results(chat_id, query)
 
     # ================== Показ одного объявления ==================
-    @dp.callback_query(lambda call: call.data.startswith("srch_openad_"))
-    async def handle_open_ad(call: types.CallbackQuery):
-        ad_id = int(call.data.replace("srch_openad_", ""))
+    @cb.route(callbacks.SEARCH_OPEN_AD)
+    async def handle_open_ad(call: types.CallbackQuery, args: tuple):
+        ad_id, = args
         chat_id = call.message.chat.id
-        st = user_steps.get(chat_id)
 
         # --- берём объявление и продавца -----------------------
         with SessionLocal() as sess:
@@ -482,22 +486,22 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
 
         await bot.answer_callback_query(call.id)
 
-        # --- обновляем «список объявлений» под сообщением ------
-        if st and "last_list_msg_id" in st:
-            try:
-                await bot.delete_message(chat_id, st["last_list_msg_id"])
-            except:
-                pass
-
-            slice_ = st["search_results"][:st["shown_count"]]
-            new_kb = build_results_kb(chat_id, slice_)
-            txt = f"Найдено объявлений: {len(st['search_results'])}.\nВыберите:"
-            new_msg = await bot.send_message(chat_id, txt, reply_markup=new_kb)
-            st["last_list_msg_id"] = new_msg.message_id
+        # --- переносим «список объявлений» под объявление ------
+        # кнопка нажата в самом списке: переотправляем его как есть (или с ещё не показанной страницей)
+        list_msg = call.message
+        pending = render.cancel(chat_id, list_msg.message_id)
+        list_kb = pending.reply_markup if pending else list_msg.reply_markup
+        try:
+            await bot.delete_message(chat_id, list_msg.message_id)
+        except:
+            pass
+        new_msg = await bot.send_message(chat_id, list_msg.text or "Выберите:", reply_markup=list_kb,
+                                         disable_web_page_preview=True)
+        render.remember(chat_id, new_msg.message_id, None, list_kb)
         return None
 
     # =============== Пожаловаться ================
-    @dp.callback_query(lambda call: call.data.startswith("complain_ad_"))
+    @cb.route("complain_ad_")
     async def complain_about_ad(call: types.CallbackQuery, state: FSMContext):
         """
         Пользователь жалуется на объявление (не купил или сделка не завершена).
@@ -565,7 +569,7 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
         return None
 
     # =============== «Написать продавцу» в объявлении ================
-    @dp.callback_query(lambda call: call.data.startswith("write_seller_ad_"))
+    @cb.route("write_seller_ad_")
     async def handle_write_seller(call: types.CallbackQuery):
         """
         Создаёт (или находит) AdChat и шлёт обеим сторонам кнопку «Открыть / Ответить».
@@ -589,18 +593,9 @@ def register_search_handlers(bot: Bot, dp: Dispatcher, user_steps: dict):
                 )
             seller_id = ad.user_id
 
-            # 2. гарантируем наличие пользователей
-            def ensure_user(u_id, uname=None):
-                row = sess.query(User).filter_by(id=u_id).first()
-                if not row:
-                    row = User(id=u_id, username=uname)
-                    sess.add(row)
-                elif uname and row.username != uname:
-                    row.username = uname
-                return row
-
-            ensure_user(buyer_id, buyer_name)
-            ensure_user(seller_id)
+            # 2. гарантируем наличие пользователей (известные — без запросов, см. users.py)
+            users.ensure_user(buyer_id, buyer_name, sess)
+            users.ensure_user(seller_id, sess=sess)
 
             # 3. находим / создаём чат
             chat = (sess.query(AdChat)
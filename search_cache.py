@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Кэш результатов поиска в памяти процесса.
+
+Ключ — (SearchQuery, курсор) для страницы и (SearchQuery, None) для числа найденных;
+значение — то, что вернул search_query (id и подписи кнопок, не ORM-объекты).
+Популярные поиски («Электроника» в Москве) отдаются из памяти без запроса к БД.
+
+Свежесть:
+  • точечная инвалидация: ORM-изменение объявления (одобрение, правка, деактивация,
+    удаление — admin.py, profile.py, moderation.py) запоминается в after_flush по ключу
+    счётчика (город, категория, подкатегория) и после коммита выбрасывает только те
+    записи, чей фильтр под этот ключ подходит; массовые UPDATE мимо ORM
+    (maintenance.expire_ads) вызывают mark_dirty() сами;
+  • остальное (другие процессы бота, правки руками в БД) — не старше SEARCH_CACHE_TTL_SEC.
+
+Коммиты бывают и в потоках (фоновые задачи через asyncio.to_thread, см. maintenance.py),
+поэтому сами словари кэша меняются только под _lock; загрузка из БД идёт без него.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import event
+
+import counters
+import search_query
+from config import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL_SEC
+from database import SessionLocal, Ad
+from search_query import SearchQuery
+
+CacheKey = Tuple[SearchQuery, Optional[int]]
+
+_entries: "OrderedDict[CacheKey, Tuple[float, object]]" = OrderedDict()
+# название категории запроса (None — все категории) → ключи кэша: инвалидация не перебирает весь кэш
+_by_category: Dict[Optional[str], Set[CacheKey]] = {}
+_lock = threading.Lock()
+
+
+def _category_of(key: CacheKey) -> Optional[str]:
+    return key[0].category_names()[0]
+
+
+def _drop(key: CacheKey):
+    if _entries.pop(key, None) is not None:
+        bucket = _by_category.get(_category_of(key))
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del _by_category[_category_of(key)]
+
+
+def _get(key: CacheKey, load: Callable[[], object]):
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and now - entry[0] < SEARCH_CACHE_TTL_SEC:
+            _entries.move_to_end(key)
+            return entry[1]
+
+    value = load()
+    with _lock:
+        _entries[key] = (now, value)
+        _entries.move_to_end(key)
+        _by_category.setdefault(_category_of(key), set()).add(key)
+        while len(_entries) > SEARCH_CACHE_SIZE:
+            _drop(next(iter(_entries)))
+    return value
+
+
+def fetch_page(query: SearchQuery, cursor: int = 0):
+    """search_query.fetch_page через кэш."""
+    return _get((query, cursor), lambda: search_query.fetch_page(query, cursor))
+
+
+def count(query: SearchQuery) -> int:
+    """search_query.count через кэш."""
+    return _get((query, None), lambda: search_query.count(query))
+
+
+def _matches(query: SearchQuery, key: counters.CounterKey) -> bool:
+    city, category, subcategory = key
+    cat, sub = query.category_names()
+    if cat is not None and cat != category:
+        return False
+    if sub is not None and sub != subcategory:
+        return False
+    return counters.location_matcher(*query.location())(city)
+
+
+def invalidate(keys: Iterable[counters.CounterKey]) -> int:
+    """Выбрасывает записи, в выдачу которых попадают объявления с этими ключами. Возвращает их число."""
+    dropped = 0
+    with _lock:
+        for key in set(keys):
+            category = key[1] or None
+            candidates = set(_by_category.get(category, ())) | set(_by_category.get(None, ()))
+            for cache_key in candidates:
+                if _matches(cache_key[0], key):
+                    _drop(cache_key)
+                    dropped += 1
+    return dropped
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+        _by_category.clear()
+
+
+def mark_dirty(session, keys: Iterable[counters.CounterKey]):
+    """Инвалидировать ключи после коммита `session` (для UPDATE мимо ORM)."""
+    session.info.setdefault("search_cache_keys", set()).update(k for k in keys if k)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _after_flush(session, flush_context):
+    keys = set()
+    conn = None
+    for obj in session.new:
+        if isinstance(obj, Ad):
+            keys.add(counters.live_key(obj.status, obj.is_active, obj.city, obj.category, obj.subcategory))
+    for obj in session.dirty:
+        # любая правка живого объявления (текст, подпись кнопки) меняет его страницу
+        if isinstance(obj, Ad) and session.is_modified(obj):
+            conn = conn or session.connection()
+            keys.update(counters.keys_before_after(conn, obj))
+    for obj in session.deleted:
+        if isinstance(obj, Ad):
+            conn = conn or session.connection()
+            keys.add(counters.keys_before_after(conn, obj)[0])
+    keys.discard(None)
+    if keys:
+        mark_dirty(session, keys)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    keys = session.info.pop("search_cache_keys", None)
+    if keys:
+        invalidate(keys)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("search_cache_keys", None)
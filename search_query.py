@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Поисковый запрос как подписанный токен: результаты поиска без состояния в памяти.
+
+Меню поиска (регион → город → категория → подкатегория) собирает SearchQuery,
+дальше он живёт только в токене — в callback_data кнопок «Показать ещё»
+и в ссылке https://t.me/<бот>?start=s_<токен>. Любой процесс бота с тем же
+SEARCH_TOKEN_SECRET отдаёт любую страницу по (токен, курсор): перезапуск не теряет
+поиск, ссылкой можно поделиться, а страницы — кэшировать по ключу (запрос, курсор).
+
+Токен — base64url без «=» от байтов:
+    [версия:4 | место:2 | категория:2] [код места, 3 байта] [код категории, 3 байта] [свой город] [HMAC, 6 байт]
+Коды — 24-битные коды catalog.py; город региона и категорию подкатегории не пишем —
+они выводятся из справочника. Подпись не даёт подсунуть боту произвольный фильтр.
+
+Страницы — keyset по ads.id (объявления создаются по возрастанию id, то есть это
+порядок «сначала новые»): курсор — id последнего показанного, 0 — первая страница.
+"""
+import base64
+import hashlib
+import hmac
+from dataclasses import dataclass
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, select
+
+import catalog
+from config import BOT_TOKEN, SEARCH_PAGE_SIZE, SEARCH_TOKEN_SECRET
+from database import SessionLocal, Ad
+
+# префикс аргумента /start для ссылок на поиск
+DEEP_LINK_PREFIX = "s_"
+
+_VERSION = 1
+_MAC_BYTES = 6
+_CODE_BYTES = 3
+
+# место: ничего / город / весь регион / свой город (текст в конце)
+_LOC_NONE, _LOC_CITY, _LOC_REGION, _LOC_CUSTOM = range(4)
+# категория: все / категория / подкатегория
+_CAT_NONE, _CAT_CATEGORY, _CAT_SUBCATEGORY = range(3)
+
+# Свой город обрезается, чтобы токен влез в callback_data «Показать ещё»
+# (64 байта вместе с префиксом и курсором, см. callbacks.SEARCH_PAGE) и в аргумент /start.
+CUSTOM_CITY_MAX_BYTES = 29
+
+_KEY = hashlib.sha256(f"search-token\x00{SEARCH_TOKEN_SECRET or BOT_TOKEN}".encode("utf-8")).digest()
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    """Коды catalog.py (или свой город текстом). Хэшируем — годится ключом кэша."""
+    region: Optional[int] = None
+    city: Optional[int] = None
+    custom_city: Optional[str] = None
+    region_wide: bool = False
+    category: Optional[int] = None
+    subcategory: Optional[int] = None
+
+    def location(self) -> Tuple[Optional[str], bool, bool]:
+        """
+        (строка города, по всему региону, свой город) — в формате ads.city,
+        как её понимают counters и фильтр поиска.
+        """
+        if self.custom_city is not None:
+            return self.custom_city, False, True
+        if self.region_wide and self.region in catalog.REGION_BY_CODE:
+            return catalog.REGION_BY_CODE[self.region].name, True, False
+        if self.city in catalog.CITY_BY_CODE:
+            return catalog.CITY_BY_CODE[self.city].full_name, False, False
+        return None, False, False
+
+    def category_names(self) -> Tuple[Optional[str], Optional[str]]:
+        cat = catalog.CATEGORY_BY_CODE[self.category].name if self.category in catalog.CATEGORY_BY_CODE else None
+        sub = catalog.SUBCATEGORY_BY_CODE[self.subcategory].name if self.subcategory in catalog.SUBCATEGORY_BY_CODE else None
+        return cat, sub
+
+    def describe(self) -> str:
+        """Короткое описание фильтра для заголовка результатов."""
+        city, _, _ = self.location()
+        cat, sub = self.category_names()
+        parts = [city or "все города", cat or "все категории"]
+        if sub:
+            parts.append(sub)
+        return ", ".join(parts)
+
+
+def truncate_city(text: str) -> str:
+    """Свой город, обрезанный по границе символа до CUSTOM_CITY_MAX_BYTES."""
+    return text.strip().encode("utf-8")[:CUSTOM_CITY_MAX_BYTES].decode("utf-8", "ignore").strip()
+
+
+def _sign(body: bytes) -> bytes:
+    return hmac.new(_KEY, body, hashlib.sha256).digest()[:_MAC_BYTES]
+
+
+def encode(query: SearchQuery) -> str:
+    """SearchQuery → токен (только символы [A-Za-z0-9_-])."""
+    tail = b""
+    if query.custom_city is not None:
+        loc, loc_code = _LOC_CUSTOM, None
+        tail = truncate_city(query.custom_city).encode("utf-8")
+    elif query.region_wide and query.region is not None:
+        loc, loc_code = _LOC_REGION, query.region
+    elif query.city is not None:
+        loc, loc_code = _LOC_CITY, query.city
+    else:
+        loc, loc_code = _LOC_NONE, None
+
+    if query.subcategory is not None:
+        cat, cat_code = _CAT_SUBCATEGORY, query.subcategory
+    elif query.category is not None:
+        cat, cat_code = _CAT_CATEGORY, query.category
+    else:
+        cat, cat_code = _CAT_NONE, None
+
+    body = bytes([_VERSION << 4 | loc << 2 | cat])
+    for code in (loc_code, cat_code):
+        if code is not None:
+            body += code.to_bytes(_CODE_BYTES, "big")
+    body += tail
+    return base64.urlsafe_b64encode(body + _sign(body)).rstrip(b"=").decode("ascii")
+
+
+def decode(token: str) -> SearchQuery:
+    """Токен → SearchQuery. ValueError, если токен подделан, обрезан или устарел справочник."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise ValueError("search token: не base64")
+    body, mac = raw[:-_MAC_BYTES], raw[-_MAC_BYTES:]
+    if not body or not hmac.compare_digest(mac, _sign(body)):
+        raise ValueError("search token: неверная подпись")
+
+    head, pos = body[0], 1
+    if head >> 4 != _VERSION:
+        raise ValueError("search token: неизвестная версия")
+    loc, cat = head >> 2 & 0b11, head & 0b11
+
+    def code() -> int:
+        nonlocal pos
+        if pos + _CODE_BYTES > len(body):
+            raise ValueError("search token: обрезан")
+        pos += _CODE_BYTES
+        return int.from_bytes(body[pos - _CODE_BYTES:pos], "big")
+
+    fields = {}
+    if loc == _LOC_CITY:
+        city = catalog.CITY_BY_CODE.get(code())
+        if city is None:
+            raise ValueError("search token: город удалён из справочника")
+        fields.update(region=city.region_code, city=city.code)
+    elif loc == _LOC_REGION:
+        region = catalog.REGION_BY_CODE.get(code())
+        if region is None:
+            raise ValueError("search token: регион удалён из справочника")
+        fields.update(region=region.code, region_wide=True)
+
+    if cat == _CAT_SUBCATEGORY:
+        sub = catalog.SUBCATEGORY_BY_CODE.get(code())
+        if sub is None:
+            raise ValueError("search token: подкатегория удалена из справочника")
+        fields.update(category=sub.category_code, subcategory=sub.code)
+    elif cat == _CAT_CATEGORY:
+        category = catalog.CATEGORY_BY_CODE.get(code())
+        if category is None:
+            raise ValueError("search token: категория удалена из справочника")
+        fields.update(category=category.code)
+    elif cat != _CAT_NONE:
+        raise ValueError("search token: неизвестный тип категории")
+
+    tail = body[pos:]
+    if loc == _LOC_CUSTOM:
+        fields.update(custom_city=tail.decode("utf-8"))
+    elif tail:
+        raise ValueError("search token: лишние байты")
+    return SearchQuery(**fields)
+
+
+def _filtered(stmt, query: SearchQuery):
+    """Условия поиска: одобренные активные объявления по месту и категории."""
+    stmt = stmt.where(Ad.status == "approved", Ad.is_active == True)
+    city, region_wide, is_custom = query.location()
+    if city is not None:
+        # autoescape: «%» и «_» из введённого города — обычные символы, а не шаблон LIKE
+        if is_custom:
+            stmt = stmt.where(Ad.city.icontains(city, autoescape=True))
+        elif region_wide:
+            stmt = stmt.where(Ad.city.istartswith(city, autoescape=True))
+        else:
+            stmt = stmt.where(Ad.city == city)
+    cat, sub = query.category_names()
+    if cat:
+        stmt = stmt.where(Ad.category == cat)
+    if sub:
+        stmt = stmt.where(Ad.subcategory == sub)
+    return stmt
+
+
+class ResultRow(NamedTuple):
+    """Всё, что нужно кнопке объявления на странице результатов."""
+    id: int
+    label: str
+
+
+def fetch_page(query: SearchQuery, cursor: int = 0) -> Tuple[List[ResultRow], Optional[int]]:
+    """
+    Страница результатов после курсора (0 — первая).
+    Возвращает (объявления страницы, курсор следующей страницы или None).
+    """
+    stmt = _filtered(select(Ad.id, Ad.inline_button_text, func.substr(Ad.text, 1, 15)), query)
+    if cursor:
+        stmt = stmt.where(Ad.id < cursor)
+    stmt = stmt.order_by(Ad.id.desc()).limit(SEARCH_PAGE_SIZE + 1)
+    with SessionLocal() as sess:
+        rows = sess.execute(stmt).all()
+    page = [ResultRow(ad_id, button_text or f"{text_head}...") for ad_id, button_text, text_head in rows[:SEARCH_PAGE_SIZE]]
+    next_cursor = page[-1].id if len(rows) > SEARCH_PAGE_SIZE else None
+    return page, next_cursor
+
+
+def count(query: SearchQuery) -> int:
+    """Сколько объявлений подходит под запрос."""
+    with SessionLocal() as sess:
+        return sess.execute(_filtered(select(func.count(Ad.id)), query)).scalar_one()
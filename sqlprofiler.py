@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Профилировщик SQL (включается SQL_PROFILE=1, по умолчанию выключен).
+
+Слушает before/after_cursor_execute у engine и собирает:
+  • статистику по «отпечаткам» запросов — текст с параметрами, заменёнными на «?»:
+    сколько раз выполнялся, суммарное и максимальное время;
+  • число запросов на апдейт по хендлерам (имя берём из metrics.py);
+  • N+1: один и тот же отпечаток больше SQL_NPLUS1_THRESHOLD раз за апдейт — пишем в лог;
+  • медленные запросы дольше SQL_SLOW_QUERY_MS — тоже в лог, с параметрами.
+Сводка — «/admin sql».
+"""
+import re
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from sqlalchemy import event
+
+import metrics
+from config import SQL_PROFILE, SQL_SLOW_QUERY_MS, SQL_NPLUS1_THRESHOLD
+from database import engine
+
+# сколько символов запроса/параметров печатать в логе
+_LOG_SNIPPET = 300
+
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACES_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """Нормализованный текст запроса: литералы и параметры → «?», списки IN (?, ?, …) → (?…)."""
+    fp = _STRING_RE.sub("?", statement)
+    fp = _PARAM_RE.sub("?", fp)
+    fp = _NUMBER_RE.sub("?", fp)
+    fp = _IN_LIST_RE.sub("(?…)", fp)
+    return _SPACES_RE.sub(" ", fp).strip()
+
+
+class _StatementStats:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class _HandlerQueries:
+    __slots__ = ("updates", "queries", "max_queries", "seconds")
+
+    def __init__(self):
+        self.updates = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.seconds = 0.0
+
+
+_lock = threading.Lock()
+_statements: Dict[str, _StatementStats] = {}
+_handlers: Dict[str, _HandlerQueries] = {}
+
+# отпечаток → сколько раз выполнен в текущем апдейте
+_update_queries: ContextVar[Optional[Counter]] = ContextVar("sqlprofiler_update", default=None)
+
+
+def _short(value: Any) -> str:
+    text = _SPACES_RE.sub(" ", str(value))
+    return text if len(text) <= _LOG_SNIPPET else text[:_LOG_SNIPPET] + "…"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._profiler_started = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_profiler_started", None)
+    if started is None:
+        return
+    elapsed = perf_counter() - started
+    fp = fingerprint(statement)
+
+    with _lock:
+        st = _statements.get(fp)
+        if st is None:
+            st = _statements[fp] = _StatementStats()
+        st.count += 1
+        st.total += elapsed
+        st.max = max(st.max, elapsed)
+
+    per_update = _update_queries.get()
+    if per_update is not None:
+        per_update[fp] += 1
+
+    if elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        where = metrics.current_handler() or "фон"
+        print(f"[sql] медленный запрос {elapsed * 1000:.0f} мс ({where}): {_short(statement)} | {_short(parameters)}")
+
+
+class SqlProfilerMiddleware(BaseMiddleware):
+    """Outer-мидлварь апдейта: считает запросы и ищет N+1."""
+
+    async def __call__(self, handler: Callable[..., Awaitable[Any]], event: Any, data: Dict[str, Any]) -> Any:
+        queries = Counter()
+        token = _update_queries.set(queries)
+        start = perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            _update_queries.reset(token)
+            elapsed = perf_counter() - start
+            name = metrics.current_handler() or metrics.UNHANDLED
+            total = sum(queries.values())
+            with _lock:
+                hq = _handlers.get(name)
+                if hq is None:
+                    hq = _handlers[name] = _HandlerQueries()
+                hq.updates += 1
+                hq.queries += total
+                hq.max_queries = max(hq.max_queries, total)
+                hq.seconds += elapsed
+            for fp, n in queries.items():
+                if n > SQL_NPLUS1_THRESHOLD:
+                    print(f"[sql] N+1 в {name}: {n} раз за апдейт ({total} запросов всего): {_short(fp)}")
+
+
+def install(dp: Dispatcher) -> bool:
+    """Подключает профилировщик, если включён SQL_PROFILE. Вызывать после metrics.install()."""
+    if not SQL_PROFILE:
+        return False
+    dp.update.outer_middleware(SqlProfilerMiddleware())
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    print(f"[sql] профилирование включено: медленные > {SQL_SLOW_QUERY_MS} мс, N+1 > {SQL_NPLUS1_THRESHOLD} повторов")
+    return True
+
+
+def report_text(limit: int = 10) -> str:
+    """Сводка для «/admin sql»: тяжёлые запросы и хендлеры с наибольшим числом запросов."""
+    if not SQL_PROFILE:
+        return "Профилирование SQL выключено (SQL_PROFILE=1 в окружении)."
+    with _lock:
+        top = sorted(_statements.items(), key=lambda kv: kv[1].total, reverse=True)[:limit]
+        chatty = sorted(_handlers.items(), key=lambda kv: kv[1].queries / kv[1].updates, reverse=True)[:limit]
+        lines = ["Запросы по суммарному времени (кол-во, всего мс, макс мс):"]
+        for fp, st in top:
+            lines.append(f"• {st.count}, {st.total * 1000:.0f}, {st.max * 1000:.0f}: {_short(fp)[:200]}")
+        if not top:
+            lines.append("пока нет данных")
+        lines.append("\nЗапросов на апдейт (среднее / максимум):")
+        for name, hq in chatty:
+            lines.append(f"• {name}: {hq.queries / hq.updates:.1f} / {hq.max_queries} (апдейтов {hq.updates})")
+    return "\n".join(lines)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import dataclasses
+from datetime import datetime
 from typing import Optional, List
 
 from aiogram import Bot, Dispatcher, types
@@ -8,9 +9,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import CallbackQuery
 
+import archive
 from config import ADMIN_SUPPORT_CHAT_ID
 from database import SessionLocal, SupportTicket, SupportMessage
 from utils import main_menu_keyboard, rus_status
+from callbacks import get_router
 
 class SupportStates(StatesGroup):
     waiting_for_problem_description = State()
@@ -27,10 +30,63 @@ class ResolvedTicket:
     id: int
     status: str
     msgs: List[ResolvedTicketMessage]
+    total: int = 0          # всего сообщений в тикете (msgs — только хвост)
+
+# размер страницы списков тикетов и сколько последних сообщений показывать в карточке
+TICKETS_PAGE_SIZE = 10
+THREAD_TAIL = 20
+PREVIEW_LEN = 100
+# Telegram не примет текст длиннее 4096 символов — оставляем запас на заголовок
+CARD_TEXT_LIMIT = 3800
+
+def add_ticket_message(s, ticket_id: int, sender_id: int, text: str, by_admin: bool):
+    """
+    Добавляет сообщение в тикет и одним UPDATE обновляет денормализованные поля тикета:
+    время активности, превью, число сообщений и непрочитанные у другой стороны.
+    Коммит — за вызывающим.
+    """
+    s.add(SupportMessage(ticket_id=ticket_id, sender_id=sender_id, text=text))
+    unread = SupportTicket.unread_by_user if by_admin else SupportTicket.unread_by_admin
+    s.query(SupportTicket).filter_by(id=ticket_id).update({
+        SupportTicket.last_activity_at: datetime.utcnow(),
+        SupportTicket.last_message_preview: " ".join(text.split())[:PREVIEW_LEN],
+        SupportTicket.message_count: SupportTicket.message_count + 1,
+        unread: unread + 1,
+    }, synchronize_session=False)
+
+def ticket_button_text(t_id: int, status: str, unread: int, preview: Optional[str], prefix: str = "") -> str:
+    text = f"{prefix}#{t_id} — {rus_status(status)}"
+    if unread:
+        text += f" · 🔴 {unread}"
+    if preview:
+        text += f" · {preview[:40]}"
+    return text
+
+def thread_text(msgs, total: int, who) -> str:
+    """
+    Текст переписки для карточки тикета: последние сообщения, которые влезают
+    в CARD_TEXT_LIMIT. who(sender_id) — подпись автора.
+    """
+    parts: List[str] = []
+    size = 0
+    for m in reversed(msgs):
+        part = f"{who(m.sender_id)} ({m.created_at:%d.%m.%y %H:%M}):\n{m.text}"
+        if parts and size + len(part) > CARD_TEXT_LIMIT:
+            break
+        parts.append(part[:CARD_TEXT_LIMIT])
+        size += len(part) + 2
+    if not parts:
+        return "Сообщений пока нет."
+    body = "\n\n".join(reversed(parts))
+    if total > len(parts):
+        body = f"… показаны последние {len(parts)} из {total}\n\n{body}"
+    return body
 
 # ────────────────────────────────────────────────────────────────────
 def register_support_handlers(bot: Bot, dp: Dispatcher):
 # ────────────────────────────────────────────────────────────────────
+    cb = get_router(dp)
+
     # ── безопасный edit (подавляем “message is not modified”) ──────
     async def _safe_edit(chat_id, msg_id, text, **txt_kwargs):
         try:
@@ -53,7 +109,7 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
     # ────────────────────────────────────────────────────────────────
     #   СОЗДАНИЕ НОВОГО ТИКЕТА
     # ────────────────────────────────────────────────────────────────
-    @dp.callback_query(lambda c: c.data == f"st:new")
+    @cb.route(exact=("st:new",))
     async def _start_new(call: types.CallbackQuery, state: FSMContext):
         await bot.answer_callback_query(call.id)
         await state.set_state(SupportStates.waiting_for_problem_description) # Set state
@@ -71,7 +127,7 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
             s.add(tk)               # получаем tk.id без закрытия сессии
             s.flush()
             ticket_id = tk.id
-            s.add(SupportMessage(ticket_id=ticket_id, sender_id=uid, text=text))
+            add_ticket_message(s, ticket_id, uid, text, by_admin=False)
             s.commit()
 
         await bot.send_message(ADMIN_SUPPORT_CHAT_ID, f"🆕 Тикет #{ticket_id} от {uid}:\n{text}")
@@ -81,17 +137,26 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
     # ────────────────────────────────────────────────────────────────
     #   СПИСОК ТИКЕТОВ
     # ────────────────────────────────────────────────────────────────
-    @dp.callback_query(lambda c: c.data == f"st:list" or c.data == f"st:back")
+    @cb.route("st:page:", exact=("st:list", "st:back"))
     async def _show_list(call: types.CallbackQuery):
-        uid, mid, redraw = call.from_user.id, call.message.message_id, call.data == f"st:back"
+        uid, mid, redraw = call.from_user.id, call.message.message_id, call.data != "st:list"
+        try:
+            page = max(0, int(call.data[len("st:page:"):])) if call.data.startswith("st:page:") else 0
+        except ValueError:
+            page = 0
         with SessionLocal() as s:
-            rows = (s.query(SupportTicket)
+            # одна страница (+1 строка, чтобы понять, есть ли следующая), только колонки для кнопок
+            rows = (s.query(SupportTicket.id, SupportTicket.status,
+                            SupportTicket.unread_by_user, SupportTicket.last_message_preview)
                       .filter_by(user_id=uid)
-                      .order_by(SupportTicket.id.desc())
+                      .order_by(SupportTicket.last_activity_at.desc().nullslast(), SupportTicket.id.desc())
+                      .offset(page * TICKETS_PAGE_SIZE)
+                      .limit(TICKETS_PAGE_SIZE + 1)
                       .all())
-            tickets = [(t.id, t.status) for t in rows]
+        has_next = len(rows) > TICKETS_PAGE_SIZE
+        tickets = rows[:TICKETS_PAGE_SIZE]
 
-        if not tickets:
+        if not tickets and page == 0:
             txt = "У вас нет обращений."
             if redraw:
                 return await _safe_edit(uid, mid, txt, reply_markup=main_menu_keyboard())
@@ -100,38 +165,44 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
                 return await bot.send_message(uid, txt, reply_markup=main_menu_keyboard())
 
         buttons = [
-            [ types.InlineKeyboardButton(text=f"#{t_id} — {rus_status(st)}", callback_data=f"st:view:{t_id}") ]
-            for t_id, st in tickets
+            [ types.InlineKeyboardButton(text=ticket_button_text(t_id, st, unread, preview),
+                                         callback_data=f"st:view:{t_id}") ]
+            for t_id, st, unread, preview in tickets
         ]
+        nav = []
+        if page > 0:
+            nav.append(types.InlineKeyboardButton(text="⏪ Назад", callback_data=f"st:page:{page - 1}"))
+        if has_next:
+            nav.append(types.InlineKeyboardButton(text="Вперёд ⏩", callback_data=f"st:page:{page + 1}"))
+        if nav:
+            buttons.append(nav)
         buttons.append(
             [ types.InlineKeyboardButton(text="❌ Закрыть", callback_data="delete_msg") ]
         )
         kb = types.InlineKeyboardMarkup(inline_keyboard=buttons)
+        title = f"Ваши обращения (стр. {page + 1}):" if page else "Ваши обращения:"
+        await bot.answer_callback_query(call.id)
         if redraw:
-            return await _safe_edit(uid, mid, "Ваши обращения:", reply_markup=kb)
+            return await _safe_edit(uid, mid, title, reply_markup=kb)
         else:
-            await bot.answer_callback_query(call.id)
             await bot.delete_message(uid, mid)
-            return await bot.send_message(uid, "Ваши обращения:", reply_markup=kb)
+            return await bot.send_message(uid, title, reply_markup=kb)
 
     # ────────────────────────────────────────────────────────────────
     #   КАРТОЧКА ТИКЕТА
     # ────────────────────────────────────────────────────────────────
     view_route_prefix="st:view:"
 
-    @dp.callback_query(lambda c: c.data.startswith(view_route_prefix))
+    @cb.route(view_route_prefix)
     async def _view_card(call: types.CallbackQuery):
         uid, mid = call.from_user.id, call.message.message_id
-        tk = await _fetch_ticket(call.id, call.data, uid, view_route_prefix)
+        tk = await _fetch_ticket(call.id, call.data, uid, view_route_prefix, with_messages=True)
         if tk is not None:
             await bot.answer_callback_query(call.id)
             await _show_card(uid, mid, tk)
 
     async def _show_card(user_id: int, message_id: int, tk: ResolvedTicket):
-        body = "\n\n".join(
-            f"{'Админ' if msg.sender_id != user_id else 'Вы'} ({msg.created_at:%d.%m.%y %H:%M}):\n{msg.text}"
-            for msg in tk.msgs
-        ) or "Сообщений пока нет."
+        body = thread_text(tk.msgs, tk.total, lambda sender_id: "Вы" if sender_id == user_id else "Админ")
         buttons = []
         if tk.status == "open":
             buttons.append([
@@ -151,17 +222,20 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
     # ────────────────────────────────────────────────────────────────
     close_route_prefix = "st:close:"
 
-    @dp.callback_query(lambda c: c.data.startswith(close_route_prefix))
+    @cb.route(close_route_prefix)
     async def _close_ticket(call: types.CallbackQuery):
         uid, mid = call.from_user.id, call.message.message_id
-        tk = await _fetch_ticket(call.id, call.data, uid, close_route_prefix)
+        tk = await _fetch_ticket(call.id, call.data, uid, close_route_prefix, with_messages=True)
         if tk is None:
             return None
         if tk.status == "closed":
             return await bot.answer_callback_query(call.id, "Тикет уже закрыт.", show_alert=True)
         with SessionLocal() as s:
-            s.query(SupportTicket).filter_by(id=tk.id, user_id=uid).update({"status": "closed"})
+            s.query(SupportTicket).filter_by(id=tk.id, user_id=uid).update(
+                {"status": "closed", "closed_at": datetime.utcnow()}
+            )
             s.commit()
+        tk.status = "closed"
         await bot.answer_callback_query(call.id, "Тикет закрыт.")
         await bot.send_message(ADMIN_SUPPORT_CHAT_ID, f"⛔️ Пользователь {uid} закрыл тикет #{tk.id}")
         return await _show_card(uid, mid, tk)
@@ -171,7 +245,7 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
     # ────────────────────────────────────────────────────────────────
     reply_route_prefix = "st:reply:"
 
-    @dp.callback_query(lambda c: c.data.startswith(reply_route_prefix))
+    @cb.route(reply_route_prefix)
     async def _prep_reply(call: types.CallbackQuery, state: FSMContext):
         uid = call.from_user.id
         tk = await _fetch_ticket(call.id, call.data, uid, reply_route_prefix)
@@ -196,7 +270,7 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
             tk = s.query(SupportTicket).filter_by(id=t_id, user_id=uid).first()
             if not tk or tk.status == "closed":
                 return await bot.send_message(uid, "Тикет не найден или закрыт.")
-            s.add(SupportMessage(ticket_id=t_id, sender_id=uid, text=msg.text.strip()))
+            add_ticket_message(s, t_id, uid, msg.text.strip(), by_admin=False)
             s.commit()
 
         await bot.send_message(uid, "Сообщение отправлено.")
@@ -204,30 +278,41 @@ def register_support_handlers(bot: Bot, dp: Dispatcher):
                                f"💬 Новое сообщение в тикете #{t_id} от {uid}:\n{msg.text}")
 
     # ────────────────────────────────────────────────────────────────
-    #   УТИЛИТА: получаем тикет + сообщения (только простые типы)
+    #   УТИЛИТА: получаем тикет + хвост переписки (только простые типы)
     # ────────────────────────────────────────────────────────────────
-    async def _fetch_ticket(cb_id: str, call_data: str, uid: int, prefix: str) -> Optional[ResolvedTicket]:
+    async def _fetch_ticket(cb_id: str, call_data: str, uid: int, prefix: str,
+                            with_messages: bool = False) -> Optional[ResolvedTicket]:
+        """
+        with_messages=False — только сам тикет (для «Ответить»), без переписки.
+        with_messages=True  — ещё последние THREAD_TAIL сообщений; тикет считается прочитанным.
+        """
         t_id = int(call_data[prefix.__len__():call_data.__len__()])
         with SessionLocal() as s:
-            t = s.query(SupportTicket).filter_by(id=t_id, user_id=uid).first()
+            t = (s.query(SupportTicket.id, SupportTicket.status,
+                         SupportTicket.message_count, SupportTicket.unread_by_user)
+                   .filter_by(id=t_id, user_id=uid)
+                   .first())
             if not t:
                 if cb_id:
                     await bot.answer_callback_query(cb_id, "Тикет не найден.", show_alert=True)
                 return None
+            if not with_messages:
+                return ResolvedTicket(id=t.id, status=t.status, msgs=[], total=t.message_count)
 
+            # давно закрытые тикеты читаются из архива
             msgs = [
                 ResolvedTicketMessage(m.sender_id, m.text, m.created_at)
-                for m in s.query(SupportMessage)
-                          .filter_by(ticket_id=t.id)
-                          .order_by(SupportMessage.created_at.asc())
-                          .all()
+                for m in archive.load_messages(s, archive.KIND_TICKET, t.id, tail=THREAD_TAIL)
             ]
-        return ResolvedTicket(id=t.id, status=t.status, msgs=msgs)
+            if t.unread_by_user:
+                s.query(SupportTicket).filter_by(id=t.id).update({"unread_by_user": 0})
+                s.commit()
+        return ResolvedTicket(id=t.id, status=t.status, msgs=msgs, total=max(t.message_count, len(msgs)))
 
     # ────────────────────────────────────────────────────────────────
     #   Кнопка «удалить сообщение»
     # ────────────────────────────────────────────────────────────────
-    @dp.callback_query(lambda c: c.data == "delete_msg")
+    @cb.route(exact=("delete_msg",))
     async def _del(call: CallbackQuery):
         await bot.delete_message(call.message.chat.id, call.message.message_id)
         await bot.answer_callback_query(call.id)
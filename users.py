@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Регистрация пользователей: одна точка «пользователь есть в users, username актуален».
+
+ensure_user() делает один INSERT ... ON CONFLICT DO UPDATE, который пишет строку
+только если username действительно изменился (IS DISTINCT FROM), и помнит
+в памяти уже известные пары (id, username): повторный /start или сообщение
+известного пользователя с тем же username не идёт в БД вовсе.
+
+Если ensure_user() вызван внутри чужой сессии, пара попадает в кэш только
+после коммита этой сессии (при откате — забывается).
+
+is_registered() помнит и отрицательный ответ — на UNREGISTERED_TTL_SEC секунд:
+незарегистрированный пользователь, засыпающий группу сообщениями, не делает
+запрос к БД на каждое. Свой /start (ensure_user) этот ответ сразу забывает.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert
+
+from database import SessionLocal, User
+
+# сколько пользователей помнить (самые давние вытесняются)
+CACHE_SIZE = 100_000
+# сколько помнить «не нажимал /start» (/start в другом процессе бота увидим не позже)
+UNREGISTERED_TTL_SEC = 60
+
+# пользователь точно есть в users, но его username мы не знаем
+_UNKNOWN = object()
+
+_table = User.__table__
+_known: "OrderedDict[int, object]" = OrderedDict()
+# user_id → до какого момента (time.monotonic()) считать незарегистрированным без запроса к БД
+_unregistered: "OrderedDict[int, float]" = OrderedDict()
+
+
+def _remember(user_id: int, username: Optional[str]):
+    if username is not None or user_id not in _known:
+        _known[user_id] = _UNKNOWN if username is None else username
+    _unregistered.pop(user_id, None)
+    _known.move_to_end(user_id)
+    while len(_known) > CACHE_SIZE:
+        _known.popitem(last=False)
+
+
+def _is_known(user_id: int, username: Optional[str]) -> bool:
+    cached = _known.get(user_id)
+    if cached is None:
+        return False
+    # без username нас интересует только существование строки
+    return username is None or cached == username
+
+
+def is_registered(user_id: int) -> bool:
+    """Есть ли пользователь в users (нажимал /start). Известные и недавно проверенные — без запроса к БД."""
+    if user_id in _known:
+        return True
+    now = time.monotonic()
+    if _unregistered.get(user_id, 0) > now:
+        return False
+    with SessionLocal() as sess:
+        found = sess.query(User.id).filter_by(id=user_id).first() is not None
+    if found:
+        _remember(user_id, None)
+    else:
+        _unregistered[user_id] = now + UNREGISTERED_TTL_SEC
+        _unregistered.move_to_end(user_id)
+        while len(_unregistered) > CACHE_SIZE:
+            _unregistered.popitem(last=False)
+    return found
+
+
+def ensure_user(user_id: int, username: Optional[str] = None, sess=None):
+    """
+    Гарантирует строку users для user_id; если передан username — обновляет его.
+    sess — выполнить в транзакции вызывающего (коммит за ним), иначе своя транзакция.
+    """
+    if _is_known(user_id, username):
+        _known.move_to_end(user_id)
+        return
+
+    stmt = insert(_table).values(id=user_id, username=username)
+    if username is None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[_table.c.id])
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[_table.c.id],
+            set_={"username": stmt.excluded.username},
+            where=_table.c.username.is_distinct_from(stmt.excluded.username),
+        )
+
+    if sess is not None:
+        sess.execute(stmt)
+        sess.info.setdefault("users_pending", []).append((user_id, username))
+        return
+    with SessionLocal() as own:
+        own.execute(stmt)
+        own.commit()
+    _remember(user_id, username)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    for user_id, username in session.info.pop("users_pending", ()):
+        _remember(user_id, username)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("users_pending", None)
@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
 from aiogram import Bot, types
+import callbacks
+from config import AD_LIFETIME_DAYS
 from database import SessionLocal, Sale, User
+from datetime import datetime, timedelta
 from decimal import Decimal
+from typing import Optional, Sequence, Tuple
 
 # Словарь для перевода статусов в русскую форму:
 STATUS_TRANSLATIONS = {
@@ -42,6 +46,104 @@ def rus_status(status: str) -> str:
     """Возвращает русский вариант статуса."""
     return STATUS_TRANSLATIONS.get(status, status)
 
+# Регионы чатов биржи (ChatGroup.region) и их названия
+CHAT_REGION_LABELS = {
+    "moscow": "Москва",
+    "mo": "Московская область",
+    "rf": "Города РФ"
+}
+
+def detect_region(title: str) -> str:
+    """Регион чата по его названию: "moscow" | "mo" | "rf"."""
+    low = title.lower()
+    if "москв" in low and "область" not in low:
+        return "moscow"
+    elif "область" in low:
+        return "mo"
+    else:
+        return "rf"
+
+def to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def parse_chat_id(cell) -> int:
+    """ID чата из ячейки: число или строка вида "🆔 Chat ID: -100…"."""
+    if isinstance(cell, (int, float)):
+        return int(cell)
+    s = str(cell)
+    if ':' in s:
+        s = s.split(':', 1)[1]
+    return int(s.strip())
+
+def parse_chat_xlsx_row(row: Sequence) -> Optional[dict]:
+    """
+    Строка листа XLSX с чатами (A: название, B–E: цены за 1/5/10/закреп,
+    F: участники, G: ID) → поля ChatGroup. None — строку пропускаем (нет или битый ID).
+    """
+    title_cell, p1, p5, p10, p_pin, part_cell, id_cell = row
+    if id_cell is None:
+        return None
+    try:
+        chat_id_val = parse_chat_id(id_cell)
+    except (TypeError, ValueError):
+        return None
+    try:
+        participants = int(part_cell or 0)
+    except (TypeError, ValueError):
+        participants = 0
+    return {
+        "chat_id": chat_id_val,
+        "title": str(title_cell or "").strip(),
+        "price_1": to_float(p1),
+        "price_5": to_float(p5),
+        "price_10": to_float(p10),
+        "price_pin": to_float(p_pin),
+        "participants": participants,
+    }
+
+def parse_chat_csv_row(row: Sequence[str]) -> Optional[Tuple[Optional[int], str, float]]:
+    """
+    Строка CSV с чатами → (chat_id или None, название, цена). None — строку пропускаем.
+
+    Форматы: «chat_id, title, price» или «title, …, price» (цена — последняя ячейка).
+    """
+    # уберём пустые колонки/пробелы
+    cells = [c.strip() for c in row if c.strip()]
+    if not cells:
+        return None
+
+    chat_id_val = None
+    # если первый столбец – число ⇒ это chat_id
+    first = cells[0].lstrip("‑-")  # знак «‑» & обычный минус
+    if first.isdigit():
+        chat_id_val = int(cells[0])
+        title_val = cells[1] if len(cells) > 1 else ""
+        price_cell = cells[2] if len(cells) > 2 else ""
+    else:
+        title_val = cells[0]
+        price_cell = cells[-1]  # берём последнюю ячейку
+
+    price_cell = price_cell.replace(" ", "").replace(",", ".")
+    try:
+        price_val = float(price_cell)
+    except ValueError:
+        return None
+    if abs(price_val) > 9.99e7:
+        return None
+    return chat_id_val, title_val, price_val
+
+def renew_ad_expiry(ad_object):
+    """
+    Запускает новый срок размещения объявления (AD_LIFETIME_DAYS от текущего момента).
+    Вызывается при одобрении и при продлении; коммит — на стороне вызывающего.
+    """
+    ad_object.is_active = True
+    ad_object.expires_at = datetime.utcnow() + timedelta(days=AD_LIFETIME_DAYS)
+    ad_object.expiry_reminded = False
+
 def main_menu_keyboard():
     """
     Главное меню (Reply-клавиатура).
@@ -51,10 +153,10 @@ def main_menu_keyboard():
         [ types.KeyboardButton(text="📜Личный кабинет"), types.KeyboardButton(text="Обратная связь") ]
     ])
 
-async def post_ad_to_chat(bot: Bot, chat_id, ad_object, user):
+def build_ad_caption(ad_object, user) -> str:
     """
-    Публикуем объявление в указанный чат/канал.
-    Вместо "[РЕКЛАМА]" теперь выводим название инлайн-кнопки (если есть).
+    Текст поста объявления для чата/канала.
+    Вместо "[РЕКЛАМА]" выводим название инлайн-кнопки (если есть).
     """
     inn_info = user.inn or "—"
     fio_info = user.full_name or user.company_name or "—"
@@ -75,15 +177,22 @@ async def post_ad_to_chat(bot: Bot, chat_id, ad_object, user):
         f"Контакты: @{user.username if user.username else '—'}\n\n"
         "Нажмите «Купить», чтобы оформить сделку через бота."
     )
+    return caption
+
+async def post_ad_to_chat(bot: Bot, chat_id, ad_object, user):
+    """
+    Публикуем объявление в указанный чат/канал.
+    """
+    caption = build_ad_caption(ad_object, user)
 
     kb = types.InlineKeyboardMarkup(inline_keyboard=[[
         types.InlineKeyboardButton(
             text=f"Купить «{ad_object.inline_button_text}»" if ad_object.inline_button_text else "Купить",
-            callback_data=f"buy_ad_{ad_object.id}"
+            callback_data=callbacks.BUY_AD.pack(ad_object.id)
         ),
         types.InlineKeyboardButton(
             text="Подробнее",
-            callback_data=f"details_ad_{ad_object.id}"
+            callback_data=callbacks.DETAILS_AD.pack(ad_object.id)
         )
     ]])
 